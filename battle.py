@@ -6,6 +6,7 @@ import sys
 import os
 import musicManager
 import engine.hitbox as hitbox
+import engine.collisionBox as collisionBox
 import menu.debugConsole as debugConsole
 import engine.optimize_dirty_rects
 import colorsys
@@ -17,12 +18,22 @@ import inspect
 import bdb
 
 import engine.network as network
+import engine.controller as controller
+import engine.abstractFighter as abstractFighter
+import engine.profiler as profiler
+import struct
+import zlib
+import time
+from global_functions import *
 
 from collections import namedtuple
 
 from cgi import log
 from PIL.SpiderImagePlugin import isInt
 
+#How long before a frame is due low latency mode stops sleeping and waits in a loop instead, in seconds
+FRAME_SPIN_TIME = 0.002
+
 """
 The battle object actually creates the fight and plays it out on screen.
 It calls the update function of all of the fighters and the stage, and draws them.
@@ -44,9 +55,15 @@ class Battle():
             self.controllers.append(player.key_bindings)
             
         self.stage = _stage
+        self.headless = False
+        self.network_enabled = None #None means we go by the network settings
         self.input_buffer = None
         self.data_logs = []
 
+        #Replays need to know the seed to play back the same, so if we weren't given one, pick one now
+        if _randomSeed is None:
+            _randomSeed = random.randrange(2**31)
+        self.random_seed = _randomSeed
         random.seed(_randomSeed)
         
         self.active_hitboxes = pygame.sprite.Group()
@@ -63,83 +80,22 @@ class Battle():
     def startBattle(self,_screen): 
         self.screen = _screen
         self.debug_console = debugConsole.debugConsole(self.screen, self)
+        #Made before anything can go wrong, since the summary's printed however the battle ends
+        self.latency = profiler.LatencyMeter()
         
         # Try block to catch any and every error
         try:
-            self.clock = pygame.time.Clock()
-            self.clock_speed = 60
-            self.clock_time = self.rules.time * 60
-            self.screen.fill(self.stage.background_color)
-            
-            #game_objects
-            self.current_fighters = self.players[:] #We have to slice this list so it passes by value instead of reference
-            self.game_objects = []
-            self.game_objects.extend(self.current_fighters)
-            
-            self.gui_objects = []
-            
-            if self.track_time:
-                pygame.time.set_timer(pygame.USEREVENT+2, 1000)
-                countdown_sprite = spriteManager.TextSprite('5','full Pack 2025',128,[0,0,0])
-                countdown_sprite.rect.center = self.screen.get_rect().center
-                self.count_alpha = 0
-                countdown_sprite.alpha(self.count_alpha)
-                self.gui_objects.append(countdown_sprite)
-                
-                self.clock_sprite = spriteManager.TextSprite('8:00','Orbitron Medium',32,[0,0,0])
-                self.clock_sprite.rect.topright = self.screen.get_rect().topright
-                self.clock_sprite.changeText(str(self.clock_time / 60)+':'+str(self.clock_time % 60).zfill(2))
-                self.gui_objects.append(self.clock_sprite)
-            
-            gui_offset = self.screen.get_rect().width / (len(self.players) + 1)
-            for fighter in self.current_fighters:
-                fighter.loadSpriteLibrary()
-                fighter.posx = self.stage.spawn_locations[fighter.player_num][0]
-                fighter.posy = self.stage.spawn_locations[fighter.player_num][1]-200
-                fighter.updatePosition()
-                fighter.ecb.normalize()
-                fighter.ecb.store()
-                fighter.posy += fighter.ecb.current_ecb.rect.height/2.0
-                fighter.players = self.players
-                self.stage.follows.append(fighter.ecb.tracking_rect)
-                log = DataLog()
-                self.data_logs.append(log)
-                fighter.data_log = log
-                if self.track_stocks: fighter.stocks = self.rules.stocks
-                
-                percent_sprite = HealthTracker(fighter)
-                
-                percent_sprite.rect.bottom = self.screen.get_rect().bottom
-                percent_sprite.rect.centerx = gui_offset
-    
-                gui_offset += self.screen.get_rect().width / (len(self.players) + 1)
-                
-                self.gui_objects.append(percent_sprite)
-            
-            center_stage_rect = pygame.rect.Rect((0,0),(16,16))
-            center_stage_rect.center = self.stage.size.center
-            self.stage.follows.append(center_stage_rect)
-            self.stage.initializeCamera()
-            
-            self.debug_mode = False
-            """
-            ExitStatus breaks us out of the loop. The battle loop can end in many ways, which is reflected here.
-            In general, ExitStatus positive means that the game was supposed to end, while a negative value indicates an error.
-            
-            ExitStatus == 1: Battle ended early by submission. Declare the other players winners, show victory screen.
-            ExitStatus == 2: Battle ended by time or stock. Declare winner from stocks and percentage, show victory screen. 
-            ExitStatus == 3: Battle ended early by mutual agreement. Declare draw by agreement, return to menu. 
-            ExitStatus == -1: Battle ended in error. Print stack trace, return to menu. 
-            """
-            self.exit_status = 0
+            self.setUpBattle()
             
             data_log = DataLog()
             data_log.addSection('test', 1)
             data_log.setData('test', 3, (lambda x,y: x + y))
-            self.dirty_rects = [pygame.Rect(0,0,self.settings['windowWidth'],self.settings['windowHeight'])]
             
             #initialises network
-            self.network = network.Network()
+            self.network = network.Network(self.network_enabled)
+            self.network.linkControllers(self.controllers)
+            #Gamepad sticks are sampled once a frame instead, so their flood of motion events never gets queued
+            pygame.event.set_blocked(pygame.JOYAXISMOTION)
             while self.exit_status == 0:
                 self.gameEventLoop()
                 
@@ -149,10 +105,13 @@ class Battle():
                 traceback.print_exc()
             finally:
                 self.exit_status = -1
+        pygame.event.set_allowed(pygame.JOYAXISMOTION)
+        for cont in self.controllers:
+            cont.releaseAxes()
         
-        for fighter in self.current_fighters:
-            print('Fighter '+fighter.name+' Player '+str(fighter.player_num))
-            print(fighter.input_buffer.buffer)   
+        latency = self.latency.getSummary()
+        if latency:
+            print("Input latency over %(inputs)d inputs: mean %(mean_ms).2f ms, median %(p50_ms).2f, 99th percentile %(p99_ms).2f, worst %(max_ms).2f, %(frames).2f frames" % latency)
              
         if self.exit_status == 1:
             musicManager.getMusicManager().stopMusic(1000)
@@ -184,55 +143,297 @@ class Battle():
         self.endBattle(self.exit_status)    
         return self.exit_status # This'll pop us back to the character select screen.
         
+    """
+    Puts the fighters on the stage and builds everything the battle needs before the first frame.
+    This is shared between the normal, on-screen battle and the headless simulation, so it
+    shouldn't draw anything to the screen or wait on the clock.
+    """
+    def setUpBattle(self):
+        self.clock = pygame.time.Clock()
+        self.clock_speed = 60
+        self.clock_time = self.rules.time * 60
+        self.frame = 0
+        self.replay_inputs = []
+        self.rollback_states = dict()
+        self.screen.fill(self.stage.background_color)
+        
+        #game_objects
+        self.current_fighters = self.players[:] #We have to slice this list so it passes by value instead of reference
+        self.game_objects = []
+        self.game_objects.extend(self.current_fighters)
+        
+        self.gui_objects = []
+        
+        if self.track_time:
+            if not self.headless:
+                pygame.time.set_timer(pygame.USEREVENT+2, 1000)
+            self.countdown_sprite = spriteManager.TextSprite('5','full Pack 2025',128,[0,0,0])
+            self.countdown_sprite.rect.center = self.screen.get_rect().center
+            self.count_alpha = 0
+            self.countdown_sprite.alpha(self.count_alpha)
+            self.gui_objects.append(self.countdown_sprite)
+            
+            self.clock_sprite = spriteManager.TextSprite('8:00','Orbitron Medium',32,[0,0,0])
+            self.clock_sprite.rect.topright = self.screen.get_rect().topright
+            self.clock_sprite.changeText(str(self.clock_time / 60)+':'+str(self.clock_time % 60).zfill(2))
+            self.gui_objects.append(self.clock_sprite)
+        
+        gui_offset = self.screen.get_rect().width / (len(self.players) + 1)
+        for fighter in self.current_fighters:
+            fighter.loadSpriteLibrary()
+            fighter.posx = self.stage.spawn_locations[fighter.player_num][0]
+            fighter.posy = self.stage.spawn_locations[fighter.player_num][1]-200
+            fighter.updatePosition()
+            fighter.ecb.normalize()
+            fighter.ecb.store()
+            fighter.posy += fighter.ecb.current_ecb.rect.height/2.0
+            fighter.players = self.players
+            self.stage.follows.append(fighter.ecb.tracking_rect)
+            log = DataLog()
+            self.data_logs.append(log)
+            fighter.data_log = log
+            if self.track_stocks: fighter.stocks = self.rules.stocks
+            
+            percent_sprite = HealthTracker(fighter)
+            
+            percent_sprite.rect.bottom = self.screen.get_rect().bottom
+            percent_sprite.rect.centerx = gui_offset
+
+            gui_offset += self.screen.get_rect().width / (len(self.players) + 1)
+            
+            self.gui_objects.append(percent_sprite)
+        
+        center_stage_rect = pygame.rect.Rect((0,0),(16,16))
+        center_stage_rect.center = self.stage.size.center
+        self.stage.follows.append(center_stage_rect)
+        self.stage.initializeCamera()
+        
+        self.debug_mode = False
+        """
+        ExitStatus breaks us out of the loop. The battle loop can end in many ways, which is reflected here.
+        In general, ExitStatus positive means that the game was supposed to end, while a negative value indicates an error.
+        
+        ExitStatus == 1: Battle ended early by submission. Declare the other players winners, show victory screen.
+        ExitStatus == 2: Battle ended by time or stock. Declare winner from stocks and percentage, show victory screen. 
+        ExitStatus == 3: Battle ended early by mutual agreement. Declare draw by agreement, return to menu. 
+        ExitStatus == -1: Battle ended in error. Print stack trace, return to menu. 
+        """
+        self.exit_status = 0
+        
+        #Drawing. See draw for how these are used.
+        self.partial_redraw = True
+        self.layer_key = None
+        self.background_layer = None
+        self.foreground_layer = None
+        self.object_layer = None
+        self.drawn_rects = []
+        self.drawn_gui_rects = []
+        
+        #Input latency is always timed, since it only costs anything on frames with inputs. See engine/profiler.py
+        #startBattle makes its meter first. Headless battles get theirs here.
+        if getattr(self, 'latency', None) is None:
+            self.latency = profiler.LatencyMeter()
+        #Low latency mode hands inputs to the fighters on the frame they come in, and starts frames on time.
+        #See gameEventLoop and waitForFrame.
+        self.low_latency = self.settings['lowLatency']
+        self.next_frame_time = None
+        
+        #Frame timings, off unless they're asked for. F3 shows them, F4 saves them as a trace. See engine/profiler.py
+        self.profiler = profiler.getProfiler()
+        self.profiler_overlay = None
+        if self.settings['showProfiler']:
+            self.toggleProfiler()
+    
+    """
+    Runs the battle without drawing anything or waiting on the clock, as fast as the simulation will go.
+    Used for balance testing CPU matches, and anything else that needs the result of a battle but not the pictures.
+    
+    _frames is the most frames that will be simulated. The battle may end sooner by time or stock.
+    _inputs is an optional list, indexed by frame, of lists of pygame KEYDOWN/KEYUP events to feed to
+    the controllers on that frame. CPU players make their own inputs, so they don't need any.
+    
+    Returns the exit status. This will be 0 if the frame limit ran out before the battle was over.
+    """
+    def simulate(self,_frames,_inputs=None):
+        self.initializeHeadless()
+        self.setUpBattle()
+        self.network = network.Network(_enabled=False)
+        return self.fastForward(_frames,_inputs)
+    
+    """
+    Gets a screen for the battle to build its sprites on, without opening a window if there isn't one already.
+    """
+    def initializeHeadless(self):
+        #If there's no display yet, we don't want one popping up. The dummy driver gives us surfaces without a window.
+        if not pygame.display.get_init():
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+        pygame.init()
+        self.screen = pygame.display.get_surface()
+        if self.screen is None:
+            self.screen = pygame.display.set_mode((settingsManager.getSetting('windowWidth'),settingsManager.getSetting('windowHeight')))
+        self.headless = True
+    
+    """
+    Steps an already set up battle forward by up to _frames frames, without drawing or waiting on the clock.
+    _inputs works like it does in simulate, indexed by the battle's frame number.
+    """
+    def fastForward(self,_frames,_inputs=None):
+        last_frame = self.frame + _frames
+        while self.exit_status == 0 and self.frame < last_frame:
+            for cont in self.controllers:
+                cont.passInputs()
+            if _inputs is not None and self.frame < len(_inputs):
+                for event in _inputs[self.frame]:
+                    for cont in self.controllers:
+                        cont.getInputs(event)
+            self.simulationStep()
+        return self.exit_status
+    
+    """
+    One frame of the battle: get the inputs, simulate, draw, and wait for the next frame.
+    
+    Normally, the inputs the controllers got last frame are passed to the fighters before this frame's events are
+    read, so everything pressed shows up a frame later than it could. In low latency mode, the events are read
+    first, and everything is passed on right before the simulation, so an input is in the very next frame drawn.
+    Online battles always do it the normal way, since both sides have to put inputs on the same frames.
+    """
     def gameEventLoop(self):
-        for cont in self.controllers:
-            cont.passInputs()
+        self.profiler.startFrame(self.frame)
+        self.profiler.begin('network')
+        poll_time = profiler.timer()
         rawEvents = pygame.event.get()
         #process events through network.
         events = self.network.processEvents(rawEvents)
+        self.profiler.end()
+        if self.network.rollback:
+            with self.profiler.section('rollback'):
+                self.rollback()
+        self.profiler.begin('input')
+        low_latency = self.low_latency and not self.network.enabled
+        if not low_latency:
+            self.passInputs()
         for event in events:
             if event.type == pygame.QUIT:
                 os._exit(1)
                 return -1
             
-            for cont in self.controllers:
-                cont.getInputs(event)
+            handled = self.handleInput(event)
+            if handled:
+                self.latency.inputPolled(poll_time)
             
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_F2:
                     print("saving screenshot")
                     pygame.image.save(self.screen,settingsManager.createPath('screenshot.jpg'))
+                elif event.key == pygame.K_F3:
+                    self.toggleProfiler()
+                elif event.key == pygame.K_F4:
+                    frames = self.profiler.exportTrace(settingsManager.createPath('trace.json'))
+                    print("saved a trace of the last "+str(frames)+" frames")
                 elif (event.key == pygame.K_LSHIFT or event.key == pygame.K_RSHIFT):
                     self.debug_mode = not self.debug_mode
             if event.type == pygame.KEYUP:
                 if event.key == pygame.K_ESCAPE:
                     self.exit_status = 1
                         
-            if event.type == pygame.USEREVENT+2:
+            if event.type == pygame.USEREVENT+2 and not self.network.rollback:
                 pygame.time.set_timer(pygame.USEREVENT+2, 1000)
-                self.clock_sprite.changeText(str(self.clock_time / 60)+':'+str(self.clock_time % 60).zfill(2))
-                self.clock_time -= 1
-                if self.clock_time <= 5 and self.clock_time > 0:
-                    self.countdown_sprite.changeText(str(self.clock_time))
-                    self.count_alpha = 255
-                if self.clock_time == 0:
-                    self.exit_status = 2
+                self.tickClock()
         # End pygame event loop
+        if low_latency:
+            self.passInputs()
+        self.profiler.end()
         
-        self.stage.update()
-        self.stage.cameraUpdate()
+        if self.network.canSimulate():
+            self.simulationStep()
+            self.latency.frameSimulated()
+        with self.profiler.section('draw'):
+            self.showFrame()
+            self.latency.frameShown()
+        with self.profiler.section('wait'):
+            self.waitForFrame(low_latency)
+        self.profiler.endFrame()
+        if self.debug_mode:
+            print("Paused, press shift key again to continue, press tab to drop into the debugger console")
+            self.cameraX = 0
+            self.cameraY = 0
+            self.zoomVal = 0
+            while self.debug_mode:
+                self.debugLoop()
+    
+    def passInputs(self):
+        for cont in self.controllers:
+            #Sticks are read here rather than coming in as events, so this is when they count as polled.
+            #Online, the network reads ours, see handleInput.
+            if not self.network.enabled and cont.sampleAxes():
+                self.latency.inputPolled(profiler.timer())
+            cont.passInputs()
+        self.latency.inputsPassed()
+    
+    """
+    Gives an event to the controllers. Online, they only get what the network says each player's input is,
+    so every side puts the same inputs on the same frames. Returns whether any controller took it.
+    """
+    def handleInput(self,_event):
+        if _event.type == network.NETWORK_INPUT:
+            if 0 <= _event.player < len(self.controllers):
+                self.controllers[_event.player].setInputValues(_event.values)
+                return True
+            return False
+        handled = False
+        if not self.network.enabled:
+            for cont in self.controllers:
+                if cont.getInputs(_event):
+                    handled = True
+        return handled
+    
+    """
+    Waits out the rest of the frame. clock.tick sleeps in whole milliseconds and can oversleep, so frames
+    start a millisecond or two late now and then. In low latency mode, it sleeps until FRAME_SPIN_TIME before the
+    next frame is due, then waits in a loop for the rest, which costs a little CPU but starts every frame on time.
+    Online, the network decides when frames run, so it never waits in a loop there.
+    If it's fallen more than a frame behind, it starts counting again from now rather than rushing to catch up.
+    """
+    def waitForFrame(self,_lowLatency):
+        if not _lowLatency:
+            self.clock.tick(self.clock_speed)
+            return
+        period = 1.0 / self.clock_speed
+        now = profiler.timer()
+        if self.next_frame_time is None or now > self.next_frame_time + period:
+            self.next_frame_time = now
+        if self.next_frame_time - now > FRAME_SPIN_TIME:
+            time.sleep(self.next_frame_time - now - FRAME_SPIN_TIME)
+        while profiler.timer() < self.next_frame_time:
+            pass
+        self.next_frame_time += period
+        self.clock.tick()
+    
+    """
+    Advances the game by one frame. This is everything that changes the state of the game,
+    and nothing that draws it, so it can be run headless.
+    """
+    def simulationStep(self):
+        with self.profiler.section('stage'):
+            self.stage.update()
+            self.stage.cameraUpdate()
         self.active_hitboxes.add(self.stage.active_hitboxes)
         self.active_hurtboxes.add(self.stage.active_hurtboxes)
     
         for obj in self.game_objects:
-            obj.update()
+            with self.profiler.section(obj.profiler_names['update'],obj.getProfilerArgs):
+                obj.update()
             if hasattr(obj,'active_hitboxes'):
                 self.active_hitboxes.add(obj.active_hitboxes)
             if hasattr(obj, 'active_hurtboxes'):
                 self.active_hurtboxes.add(obj.active_hurtboxes)      
-        self.checkHitboxClanks()
-        self.checkHitboxHits()
-        self.network.processFighters(self.current_fighters)
+        with self.profiler.section('clanks'):
+            self.checkHitboxClanks()
+        with self.profiler.section('hits'):
+            self.checkHitboxHits()
+        with self.profiler.section('network fighters'):
+            self.network.processFighters(self.current_fighters)
         for fight in self.current_fighters:
             if fight.ecb.current_ecb.rect.right < self.stage.blast_line.left or fight.ecb.current_ecb.rect.left > self.stage.blast_line.right or fight.ecb.current_ecb.rect.top > self.stage.blast_line.bottom or fight.ecb.current_ecb.rect.bottom < self.stage.blast_line.top:
                 if not self.track_stocks:
@@ -253,56 +454,227 @@ class Battle():
                         fight.die()
                         self.stage.follows.append(fight.ecb.tracking_rect)
         # End object updates
-        self.draw()
-        pygame.display.update()
-        if self.debug_mode:
-            print("Paused, press shift key again to continue, press tab to drop into the debugger console")
-            self.cameraX = 0
-            self.cameraY = 0
-            self.zoomVal = 0
-            while self.debug_mode:
-                self.debugLoop()
+        
+        #Keep hold of every frame that had inputs in it, so we can save a replay later
+        for i,fighter in enumerate(self.players):
+            frame_inputs = fighter.input_buffer.getLastNFrames(1)
+            if frame_inputs and frame_inputs[0]:
+                self.replay_inputs.append((self.frame,i,frame_inputs[0]))
+        self.frame += 1
+        
+        #Headless and rollback battles can't go by the timer event, so count down the clock by frames instead
+        if self.track_time and (self.headless or self.network.rollback) and self.frame % 60 == 0:
+            self.tickClock()
+    
+    """
+    Turns the frame timings and the overlay that shows them on or off. The timings are kept after they're
+    turned off, so they can still be saved.
+    """
+    def toggleProfiler(self):
+        if self.profiler_overlay is None:
+            self.profiler.enable()
+            self.profiler_overlay = profiler.ProfilerOverlay(self.profiler,self.latency)
+            self.gui_objects.append(self.profiler_overlay)
+        else:
+            self.gui_objects.remove(self.profiler_overlay)
+            self.profiler_overlay = None
+            self.profiler.enable(False)
+    
+    """
+    Counts the match clock down by a second. Called by the timer event in a normal battle,
+    or every 60 frames in a headless one.
+    """
+    def tickClock(self):
+        self.clock_sprite.changeText(str(self.clock_time / 60)+':'+str(self.clock_time % 60).zfill(2))
+        self.clock_time -= 1
+        if self.clock_time <= 5 and self.clock_time > 0:
+            self.countdown_sprite.changeText(str(self.clock_time))
+            self.count_alpha = 255
+        if self.clock_time == 0:
+            self.exit_status = 2
+    
+    """
+    Takes a snapshot of the whole game state, so it can be put back later with loadState.
+    This is everything simulationStep changes, so loading a snapshot and stepping forward plays
+    out the same as it did the first time. Used for rollback netcode and seeking in replays.
+    """
+    def saveState(self):
+        return (self.frame,
+                self.clock_time,
+                self.exit_status,
+                self.current_fighters[:],
+                list(self.active_hitboxes),
+                list(self.active_hurtboxes),
+                len(self.replay_inputs),
+                random.getstate(),
+                [data_log.data.copy() for data_log in self.data_logs],
+                self.stage.saveState(),
+                [fighter.saveState() for fighter in self.players],
+                [getObjectState(cont) for cont in self.controllers])
+    
+    def loadState(self,_state):
+        (self.frame,self.clock_time,self.exit_status,current_fighters,active_hitboxes,active_hurtboxes,
+         replay_length,random_state,data_log_states,stage_state,fighter_states,controller_states) = _state
+        self.current_fighters[:] = current_fighters
+        self.active_hitboxes.empty()
+        self.active_hitboxes.add(*active_hitboxes)
+        self.active_hurtboxes.empty()
+        self.active_hurtboxes.add(*active_hurtboxes)
+        del self.replay_inputs[replay_length:]
+        random.setstate(random_state)
+        for data_log,data in zip(self.data_logs,data_log_states):
+            data_log.data = data.copy()
+        self.stage.loadState(stage_state)
+        for fighter,fighter_state in zip(self.players,fighter_states):
+            fighter.loadState(fighter_state)
+        for cont,controller_state in zip(self.controllers,controller_states):
+            setObjectState(cont,controller_state)
+    
+    """
+    Rollback netcode. We keep a snapshot of the start of every frame the opponent hasn't confirmed yet.
+    If their input turns up for a frame we've already played, we load that frame's snapshot and play
+    forward to where we were, this time with what they actually pressed.
+    """
+    def rollback(self):
+        frame = self.network.rollback_frame
+        self.network.rollback_frame = None
+        if frame is not None and frame in self.rollback_states:
+            current_frame = self.frame
+            self.loadState(self.rollback_states[frame])
+            while self.frame < current_frame:
+                self.rollback_states[self.frame] = self.saveState()
+                for cont in self.controllers:
+                    cont.passInputs()
+                for event in self.network.getInputs(self.frame):
+                    self.handleInput(event)
+                self.simulationStep()
+        elif frame is not None:
+            print("Can't roll back to frame "+str(frame))
+        self.rollback_states[self.frame] = self.saveState()
+        #Once the opponent has confirmed a frame, we'll never need to go back before it
+        for old_frame in [old_frame for old_frame in self.rollback_states if old_frame < self.network.remote_frame]:
+            del self.rollback_states[old_frame]
 
+    """
+    Both collision checks use the broadphase in collisionBox, so only boxes that are near each other
+    get compared, and boxes belonging to the same fighter are never compared at all. Pairs come out
+    in the same order pygame.sprite.groupcollide would have given them.
+    """
     def checkHitboxClanks(self):
-        hitbox_hits = pygame.sprite.groupcollide(self.active_hitboxes, self.active_hitboxes, False, False)
-        for hbox in hitbox_hits:
+        hitboxes = list(self.active_hitboxes)
+        bounds = collisionBox.getRectBounds(hitboxes)
+        owners = collisionBox.getOwnerKeys(hitboxes, dict())
+        for i,j in zip(*collisionBox.getOverlappingPairs(bounds, bounds, owners, owners)):
             #first, check for clanks
-            hitbox_clank = hitbox_hits[hbox]
-            hitbox_clank = [x for x in hitbox_clank if (x is not hbox) and (x.owner is not hbox.owner)]
-            for other in hitbox_clank:
-                hbox_clank = hbox.compareTo(other)
-                other_clank = other.compareTo(hbox)
-                if hbox_clank == -1: 
-                    if hbox.article == None: hbox.owner.current_action.onClank(hbox.owner, hbox, other)
-                    else: hbox.article.onClank(hbox.owner, hbox, other)
-                elif hbox_clank == 1:
-                    if hbox.article == None: hbox.owner.current_action.onPrevail(hbox.owner, hbox, other)
-                    else: hbox.article.onPrevail(hbox.owner, hbox, other)
-                if other_clank == -1: 
-                    if other.article == None: other.owner.current_action.onClank(other.owner, other, hbox)
-                    else: other.article.onClank(other.owner, other, hbox)
-                elif other_clank == 1:
-                    if other.article == None: other.owner.current_action.onPrevail(other.owner, other, hbox)
-                    else: other.article.onPrevail(other.owner, other, hbox)
-                if hbox_clank == -1: other.owner.lockHitbox(hbox)
-                if other_clank == -1: hbox.owner.lockHitbox(other)
+            hbox = hitboxes[i]
+            other = hitboxes[j]
+            hbox_clank = hbox.compareTo(other)
+            other_clank = other.compareTo(hbox)
+            if hbox_clank == -1: 
+                if hbox.article == None: hbox.owner.current_action.onClank(hbox.owner, hbox, other)
+                else: hbox.article.onClank(hbox.owner, hbox, other)
+            elif hbox_clank == 1:
+                if hbox.article == None: hbox.owner.current_action.onPrevail(hbox.owner, hbox, other)
+                else: hbox.article.onPrevail(hbox.owner, hbox, other)
+            if other_clank == -1: 
+                if other.article == None: other.owner.current_action.onClank(other.owner, other, hbox)
+                else: other.article.onClank(other.owner, other, hbox)
+            elif other_clank == 1:
+                if other.article == None: other.owner.current_action.onPrevail(other.owner, other, hbox)
+                else: other.article.onPrevail(other.owner, other, hbox)
+            if hbox_clank == -1: other.owner.lockHitbox(hbox)
+            if other_clank == -1: hbox.owner.lockHitbox(other)
 
     def checkHitboxHits(self):
-        hurtbox_hits = pygame.sprite.groupcollide(self.active_hitboxes, self.active_hurtboxes, False, False)
-        for hbox in hurtbox_hits:
+        hitboxes = list(self.active_hitboxes)
+        hurtboxes = list(self.active_hurtboxes)
+        owner_keys = dict()
+        hitbox_owners = collisionBox.getOwnerKeys(hitboxes, owner_keys)
+        hurtbox_owners = collisionBox.getOwnerKeys(hurtboxes, owner_keys)
+        for i,j in zip(*collisionBox.getOverlappingPairs(collisionBox.getRectBounds(hitboxes), collisionBox.getRectBounds(hurtboxes), hitbox_owners, hurtbox_owners)):
             #then, hurtbox collisions
-            hitbox_collisions = hurtbox_hits[hbox]
-            for hurtbox in hitbox_collisions:
-                if hbox.owner != hurtbox.owner:
-                    hbox.onCollision(hurtbox)
+            hitboxes[i].onCollision(hurtboxes[j])
                         
 
+    """
+    Draws the frame and puts it on the screen, only updating the parts of the display that changed.
+    """
+    def showFrame(self):
+        changed_rects = self.draw()
+        if changed_rects is None:
+            pygame.display.update()
+        else:
+            pygame.display.update(changed_rects)
+    
+    """
+    Draws the frame. Returns the rects of the screen that changed, or None if all of it did.
+    
+    When the camera moves, the background and foreground move with it, so everything is drawn again.
+    Once the camera and the stage's sprites hold still for a frame, the background and foreground are drawn once
+    onto layers of their own, and the background is copied onto an object layer, which the fighters and articles
+    are drawn on instead of the screen. After that, each frame, the objects are wiped off the object layer where
+    they were last frame, by copying the background back there, and drawn on it where they are now. Then only
+    the parts of the screen where something was drawn last frame or is drawn this frame are repainted: the object
+    layer is copied there, and the foreground layer on top of it. The GUI is drawn on the screen over all of it.
+    That way everything is drawn once a frame, and the rects it was drawn in say what needs repainting.
+    """
     def draw(self):
-        self.screen.fill(self.stage.background_color)
+        layer_key = self.stage.getLayerKey()
+        screen_rect = self.screen.get_rect()
+        if not self.partial_redraw or layer_key != self.layer_key:
+            #The camera moved, draw everything straight onto the screen
+            self.layer_key = layer_key
+            self.background_layer = None
+            self.screen.fill(self.stage.background_color)
+            self.stage.drawBG(self.screen)
+            drawn_rects = self.drawObjects(self.screen)
+            self.stage.drawFG(self.screen)
+            changed_rects = None
+        elif self.background_layer is None:
+            #The camera's holding still, so this is what the background and foreground look like until it moves
+            self.drawLayers()
+            self.object_layer.blit(self.background_layer,(0,0))
+            drawn_rects = self.drawObjects(self.object_layer)
+            self.screen.blit(self.object_layer,(0,0))
+            self.screen.blit(self.foreground_layer,(0,0))
+            changed_rects = None
+        else:
+            for rect in self.drawn_rects:
+                self.object_layer.blit(self.background_layer,rect,rect)
+            drawn_rects = self.drawObjects(self.object_layer)
+            #The foreground is blitted over these, so none of them can overlap or it would be blended twice.
+            #Where the GUI was is repainted too, so it isn't drawn over itself.
+            changed_rects = [rect.clip(screen_rect) for rect in self.drawn_rects + drawn_rects + self.drawn_gui_rects]
+            changed_rects = engine.optimize_dirty_rects.optimize_dirty_rects([rect for rect in changed_rects if rect.width > 0 and rect.height > 0])
+            for rect in changed_rects:
+                self.screen.blit(self.object_layer,rect,rect)
+                self.screen.blit(self.foreground_layer,rect,rect)
+        gui_rects = self.drawGUI()
+        if changed_rects is not None:
+            changed_rects.extend(gui_rects)
+        self.drawn_rects = [rect.clip(screen_rect) for rect in drawn_rects]
+        self.drawn_gui_rects = gui_rects
         
-        draw_rects = self.stage.drawBG(self.screen)
-        self.dirty_rects.extend(draw_rects)
-
+        if self.track_time and self.clock_time <= 5:
+            self.count_alpha = max(0,self.count_alpha - 5)
+            self.countdown_sprite.alpha(self.count_alpha)
+        return changed_rects
+    
+    def drawLayers(self):
+        self.background_layer = pygame.Surface(self.screen.get_size()).convert()
+        self.background_layer.fill(self.stage.background_color)
+        self.stage.drawBG(self.background_layer)
+        self.foreground_layer = pygame.Surface(self.screen.get_size(), pygame.SRCALPHA, 32).convert_alpha()
+        self.stage.drawFG(self.foreground_layer)
+        if self.object_layer is None or self.object_layer.get_size() != self.screen.get_size():
+            self.object_layer = pygame.Surface(self.screen.get_size()).convert()
+    
+    """
+    Draws the fighters, their articles, and the hitboxes and hurtboxes if they're shown, onto _screen.
+    Returns the rects drawn in.
+    """
+    def drawObjects(self,_screen):
+        drawn_rects = []
         for obj in self.game_objects:
             foreground_articles = []
             if hasattr(obj, 'articles'):
@@ -310,48 +682,40 @@ class Battle():
                     if art.draw_depth == -1:
                         offset = self.stage.stageToScreen(art.sprite.rect)
                         scale =  self.stage.getScale()
-                        draw_rect = art.draw(self.screen,offset,scale)
-                        if draw_rect: self.dirty_rects.append(draw_rect)
+                        draw_rect = art.draw(_screen,offset,scale)
+                        if draw_rect: drawn_rects.append(draw_rect)
                     else: foreground_articles.append(art)
 
             offset = self.stage.stageToScreen(obj.sprite.rect)
             scale =  self.stage.getScale()
-            draw_rect = obj.draw(self.screen,offset,scale)
-            if draw_rect: self.dirty_rects.append(draw_rect)
+            draw_rect = obj.draw(_screen,offset,scale)
+            if draw_rect: drawn_rects.append(draw_rect)
             
             for art in foreground_articles:
                 offset = self.stage.stageToScreen(art.sprite.rect)
                 scale =  self.stage.getScale()
-                draw_rect = art.draw(self.screen,offset,scale)
-                if draw_rect: self.dirty_rects.append(draw_rect)
+                draw_rect = art.draw(_screen,offset,scale)
+                if draw_rect: drawn_rects.append(draw_rect)
             if (self.settings['showHurtboxes']): 
                 for hbox in self.active_hurtboxes:
-                    draw_rect = hbox.draw(self.screen,self.stage.stageToScreen(hbox.rect),scale)
-                    if draw_rect: self.dirty_rects.append(draw_rect)
+                    draw_rect = hbox.draw(_screen,self.stage.stageToScreen(hbox.rect),scale)
+                    if draw_rect: drawn_rects.append(draw_rect)
             if (self.settings['showHitboxes']):
                 for hbox in self.active_hitboxes:
-                    draw_rect = hbox.draw(self.screen,self.stage.stageToScreen(hbox.rect),scale)
-                    if draw_rect: self.dirty_rects.append(draw_rect)
-
-
-        draw_rects = self.stage.drawFG(self.screen)    
-        self.dirty_rects.extend(draw_rects)
-        
+                    draw_rect = hbox.draw(_screen,self.stage.stageToScreen(hbox.rect),scale)
+                    if draw_rect: drawn_rects.append(draw_rect)
+        return drawn_rects
+    
+    def drawGUI(self):
+        drawn_rects = []
         for obj in self.gui_objects:
             draw_rect = obj.draw(self.screen, obj.rect.topleft,1)
-            if draw_rect: self.dirty_rects.append(draw_rect)
-        if self.track_time and self.clock_time <= 5:
-            self.count_alpha = max(0,self.count_alpha - 5)
-            self.countdown_sprite.alpha(self.count_alpha)
-         
-        self.clock.tick(self.clock_speed)
-        optimized_rects = engine.optimize_dirty_rects.optimize_dirty_rects(self.dirty_rects)
-        #pygame.display.update(optimized_rects)
-        self.dirty_rects = []
+            if draw_rect: drawn_rects.append(draw_rect)
+        return drawn_rects
         
     def debugLoop(self):
-        self.draw()
-        pygame.display.update()
+        self.showFrame()
+        self.clock.tick(self.clock_speed)
         try:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
@@ -402,8 +766,47 @@ class Battle():
             if event.type == pygame.KEYUP:
                 pass
              
+    """
+    Saves the inputs of the battle so far to a replay file, which can be played back with a Replay.
+    See the Replay class below for what goes in the file.
+    """
     def saveReplay(self,_path):
-        pass
+        key_names = []
+        body = []
+        for frame,player,inputs in self.replay_inputs:
+            body.append(struct.pack('<IBB',frame,player,len(inputs)))
+            for key,value in inputs.items():
+                if key not in key_names:
+                    key_names.append(key)
+                code = key_names.index(key)
+                if value == 0:
+                    body.append(struct.pack('<B',code))
+                elif value == 1.0:
+                    body.append(struct.pack('<B',code | REPLAY_KEY_PRESSED))
+                else:
+                    body.append(struct.pack('<Bd',code | REPLAY_KEY_PRESSED | REPLAY_KEY_ANALOG,value))
+        if len(key_names) > REPLAY_KEY_ANALOG:
+            raise ValueError('Too many different keys to fit in a replay: '+str(len(key_names)))
+        
+        header = [struct.pack('<4sBqHIIbB',REPLAY_MAGIC,REPLAY_VERSION,self.random_seed,self.rules.stocks,self.rules.time,
+                              self.frame,self.exit_status,len(self.players))]
+        header.append(packReplayString(os.path.basename(os.path.dirname(inspect.getfile(self.stage.__class__)))))
+        for fighter in self.players:
+            header.append(struct.pack('<BBB',fighter.player_num,fighter.current_color,fighter.current_costume))
+            header.append(packReplayString(os.path.basename(os.path.normpath(fighter.base_dir))))
+            header.append(packReplayString(fighter.key_bindings.type))
+            timing_window = getattr(fighter.key_bindings,'timing_window',dict())
+            header.append(struct.pack('<B',len(timing_window)))
+            for name,value in timing_window.items():
+                header.append(packReplayString(name))
+                header.append(struct.pack('<i',int(value)))
+        header.append(struct.pack('<B',len(key_names)))
+        for key in key_names:
+            header.append(packReplayString(key))
+        
+        with open(_path,'wb') as replay_file:
+            replay_file.write(b''.join(header))
+            replay_file.write(zlib.compress(b''.join(body)))
     
     """
     Ends the battle and goes to a relevant menu or error page depending on how the
@@ -487,10 +890,177 @@ class Rules():
         self.time = _time #default to 8 minutes
         self.teams = _teams #teams off
     
+"""
+A Replay is a battle that gets its inputs from a file written by Battle.saveReplay instead of from players.
+It loads its own fighters and stage from the file, so all it needs is the path.
+It can be played on screen with startBattle like any other battle, or run headless with seek and fastForward.
+
+The file is a small header followed by the inputs, compressed with zlib. Everything is little-endian.
+The header holds the seed, rules, frame count and exit status, the stage's folder name, and for each player
+their number, color, costume, fighter folder name, controller type and timing windows (in frames), then the table
+of key names. The controller type matters because fighters read their direction from a keyboard differently
+than from anything else, so a replay has to play back as whatever it was recorded on. Version 1 replays don't have
+it, and were all recorded on keyboards.
+The inputs are only stored for frames where a player's input buffer had something in it. Each one is
+the frame, the player's index and the number of keys, then a byte per key: its index in the key table,
+with REPLAY_KEY_PRESSED set if it was pressed, and REPLAY_KEY_ANALOG if a double follows with its value.
+"""
 class Replay(Battle):
-    def __init__(self):
-        pass
+    def __init__(self,_path):
+        with open(_path,'rb') as replay_file:
+            data = replay_file.read()
+        
+        magic,version,self.seed,self.stocks,self.time,self.frame_count,self.final_status,player_count = struct.unpack_from('<4sBqHIIbB',data,0)
+        if magic != REPLAY_MAGIC or version not in (1,REPLAY_VERSION):
+            raise ValueError(_path+' is not a replay this version of TUSSLE can play')
+        offset = struct.calcsize('<4sBqHIIbB')
+        
+        self.stage_name,offset = unpackReplayString(data,offset)
+        self.replay_players = []
+        for _ in range(player_count):
+            player_num,color,costume = struct.unpack_from('<BBB',data,offset)
+            offset += 3
+            fighter_name,offset = unpackReplayString(data,offset)
+            controller_type = 'Keyboard'
+            if version >= 2:
+                controller_type,offset = unpackReplayString(data,offset)
+            timing_window = dict()
+            (window_count,) = struct.unpack_from('<B',data,offset)
+            offset += 1
+            for _ in range(window_count):
+                name,offset = unpackReplayString(data,offset)
+                (timing_window[name],) = struct.unpack_from('<i',data,offset)
+                offset += 4
+            self.replay_players.append({'player_num': player_num,
+                                        'color': color,
+                                        'costume': costume,
+                                        'fighter': fighter_name,
+                                        'type': controller_type,
+                                        'timing_window': timing_window,
+                                        'inputs': dict()
+                                        })
+        key_names = []
+        (key_count,) = struct.unpack_from('<B',data,offset)
+        offset += 1
+        for _ in range(key_count):
+            key,offset = unpackReplayString(data,offset)
+            key_names.append(key)
+        
+        body = zlib.decompress(data[offset:])
+        offset = 0
+        while offset < len(body):
+            frame,player,count = struct.unpack_from('<IBB',body,offset)
+            offset += 6
+            frame_inputs = []
+            for _ in range(count):
+                (code,) = struct.unpack_from('<B',body,offset)
+                offset += 1
+                if code & REPLAY_KEY_ANALOG:
+                    (value,) = struct.unpack_from('<d',body,offset)
+                    offset += 8
+                elif code & REPLAY_KEY_PRESSED:
+                    value = 1.0
+                else:
+                    value = 0
+                frame_inputs.append((key_names[code & ~(REPLAY_KEY_PRESSED | REPLAY_KEY_ANALOG)],value))
+            self.replay_players[player]['inputs'][frame] = frame_inputs
+        
+        self.loadBattle()
+    
+    """
+    Builds fresh fighters and a fresh stage from the replay, and hands each fighter a controller
+    that plays back its inputs. Anything the players press while watching goes nowhere.
+    """
+    def loadBattle(self):
+        #Fighters load their sounds as they're built, so pygame has to be up first.
+        #If nothing's started it yet, there's no game around us, so this replay is headless.
+        if not pygame.display.get_init():
+            self.initializeHeadless()
+        headless = getattr(self,'headless',False)
+        players = []
+        for player in self.replay_players:
+            fighter = self.loadFighter(player['fighter'],player['player_num'])
+            fighter.current_color = player['color']
+            fighter.current_costume = player['costume']
+            players.append(fighter)
+        stage = self.loadStage(self.stage_name)
+        
+        Battle.__init__(self,Rules(self.stocks,self.time),players,stage,self.seed)
+        self.headless = headless
+        self.network_enabled = False
+        self.keyframes = dict()
+        
+        self.controllers = []
+        for fighter,player in zip(players,self.replay_players):
+            replay_controller = controller.ReplayController(player['inputs'],player['timing_window'],player.get('type','Keyboard'))
+            replay_controller.linkObject(fighter)
+            fighter.key_bindings = replay_controller
+            self.controllers.append(replay_controller)
+    
+    def loadFighter(self,_fighterName,_playerNum):
+        directory = settingsManager.createPath('fighters')
+        fighter_py = settingsManager.importFromURI(directory,os.path.join(directory,_fighterName,'fighter.py'),_suffix=str(_playerNum))
+        if fighter_py:
+            return fighter_py.getFighter(os.path.join(directory,_fighterName),_playerNum)
+        return abstractFighter.AbstractFighter(os.path.join(directory,_fighterName),_playerNum)
+    
+    def loadStage(self,_stageName):
+        directory = settingsManager.createPath('stages')
+        stage_py = settingsManager.importFromURI(directory,os.path.join(directory,_stageName,'stage.py'))
+        if stage_py is None:
+            raise ValueError('No stage found at '+os.path.join(directory,_stageName,'stage.py'))
+        return stage_py.getStage()
     
+    """
+    Starts the replay over from the first frame. Without a screen from startBattle, it runs headless.
+    """
+    def restart(self):
+        self.loadBattle()
+        if getattr(self,'screen',None) is None:
+            self.initializeHeadless()
+        self.setUpBattle()
+        self.network = network.Network(_enabled=False)
+    
+    """
+    Jumps to the given frame. Going forward simulates up to it headless. Going back loads the
+    closest snapshot before it, or starts over from the beginning if we haven't got that far yet.
+    """
+    def seek(self,_frame):
+        if not hasattr(self,'exit_status'):
+            self.restart()
+        elif _frame < self.frame:
+            earlier = [frame for frame in self.keyframes if frame <= _frame]
+            if earlier:
+                self.loadState(self.keyframes[max(earlier)])
+            else:
+                self.restart()
+        return self.fastForward(_frame - self.frame)
+    
+    def simulationStep(self):
+        Battle.simulationStep(self)
+        #Every so often, keep a snapshot to seek back to
+        if self.frame % REPLAY_KEYFRAME_INTERVAL == 0 and self.frame not in self.keyframes:
+            self.keyframes[self.frame] = self.saveState()
+        #Once we're out of recording, end the battle the way the recorded one ended.
+        #If it was saved before it was over, call it a draw.
+        if self.frame >= self.frame_count and self.exit_status == 0:
+            self.exit_status = self.final_status if self.final_status > 0 else 3
+    
+REPLAY_MAGIC = b'TUSR'
+REPLAY_VERSION = 2
+REPLAY_KEY_PRESSED = 0x80
+REPLAY_KEY_ANALOG = 0x40
+REPLAY_KEYFRAME_INTERVAL = 300
+
+def packReplayString(_string):
+    data = _string.encode('utf-8')
+    return struct.pack('<H',len(data)) + data
+
+def unpackReplayString(_data,_offset):
+    (length,) = struct.unpack_from('<H',_data,_offset)
+    _offset += 2
+    return _data[_offset:_offset+length].decode('utf-8'),_offset+length
+
 
 """
 The HealthTracker object contains the sprites needed to display the percentages and stocks.
@@ -526,14 +1096,14 @@ class HealthTracker(spriteManager.Sprite):
         #recolor the percentage
         old_redness = self.redness
         self.redness = min(1.0,float(self.percent) / 300)
-        #the lighter color first
-        rgb_from = tuple(int(i * 255) for i in colorsys.hsv_to_rgb(0,old_redness,1.0))
-        rgb_to = tuple(int(i * 255) for i in colorsys.hsv_to_rgb(0,self.redness,1.0))
-        self.percent_sprites.recolor(self.percent_sprites.sheet, rgb_from, rgb_to)
-        #the darker color next
-        rgb_from = tuple(int(i * 255) for i in colorsys.hsv_to_rgb(0,old_redness,0.785))
-        rgb_to = tuple(int(i * 255) for i in colorsys.hsv_to_rgb(0,self.redness,0.785))
-        self.percent_sprites.recolor(self.percent_sprites.sheet, rgb_from, rgb_to)
+        #the lighter color and the darker color, swapped together
+        color_pairs = []
+        for value in [1.0, 0.785]:
+            rgb_from = tuple(int(i * 255) for i in colorsys.hsv_to_rgb(0,old_redness,value))
+            rgb_to = tuple(int(i * 255) for i in colorsys.hsv_to_rgb(0,self.redness,value))
+            color_pairs.append((rgb_from, rgb_to))
+        if self.redness != old_redness:
+            self.percent_sprites.swapPalette(self.percent_sprites.sheet, color_pairs)
         
         
         self.percent_sprite.image = pygame.Surface((196,64), pygame.SRCALPHA, 32).convert_alpha()
@@ -560,10 +1130,12 @@ class HealthTracker(spriteManager.Sprite):
         w = int(round(self.rect.width * _scale))
         new_off = (int(_offset[0] * _scale), int(_offset[1] * _scale))
         
-        _screen.blit(self.image,pygame.Rect(new_off,(w,h)))
+        drawn_rect = _screen.blit(self.image,pygame.Rect(new_off,(w,h)))
         
         rect = self.percent_sprite.rect
-        self.percent_sprite.draw(_screen, (new_off[0] + rect.left,new_off[1] + rect.top), _scale)
+        percent_rect = self.percent_sprite.draw(_screen, (new_off[0] + rect.left,new_off[1] + rect.top), _scale)
+        if percent_rect: drawn_rect = drawn_rect.union(percent_rect)
+        return drawn_rect
 
 """
 The Data Log object keeps track of information that happens in-game, such as score, deaths, total damage dealt/received, etc.
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Benchmark for the action prototypes in engine.actionLoader. Plays a replay back headless, noting every action
+the fighters change to, then times building each of those actions from the XML, the way every loadAction used to,
+against cloning it from the prototype. After that, it times the whole replay both ways.
+
+    python benchmarks/actions.py replay_file [frames]
+"""
+from __future__ import print_function
+import os
+import sys
+import timeit
+import argparse
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import engine.action as action
+import engine.actionLoader as actionLoader
+import battle
+
+def compileEveryTime(_loader, _actionName):
+    prototype = _loader.compileAction(_actionName)
+    if isinstance(prototype, action.Action):
+        return prototype
+    return prototype()
+
+def recordActions(_path, _frames):
+    loaded = []
+    load_action = actionLoader.ActionLoader.loadAction
+    def recordingLoad(_loader, _actionName):
+        loaded.append((_loader, _actionName))
+        return load_action(_loader, _actionName)
+    actionLoader.ActionLoader.loadAction = recordingLoad
+    try:
+        battle.Replay(_path).seek(_frames)
+    finally:
+        actionLoader.ActionLoader.loadAction = load_action
+    return loaded
+
+def timeReplay(_path, _frames):
+    replay = battle.Replay(_path)
+    return timeit.timeit(lambda: replay.seek(_frames), number=1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Times loading actions from their prototypes against building them from the XML.')
+    parser.add_argument('replay_file', help='a replay to play back, from replays/')
+    parser.add_argument('frames', type=int, nargs='?', help='how much of the replay to play. All of it by default')
+    args = parser.parse_args()
+    path = args.replay_file
+    frames = args.frames if args.frames is not None else battle.Replay(path).frame_count
+    loaded = recordActions(path, frames)
+    assert loaded, "the replay never changed action"
+    print("%d frames, %d action changes" % (frames, len(loaded)))
+
+    for name,load in [('compile', compileEveryTime), ('prototype', actionLoader.ActionLoader.loadAction)]:
+        seconds = min(timeit.repeat(lambda: [load(loader, action_name) for loader,action_name in loaded], number=1, repeat=3))
+        print("%-14s %8.1f us per action change" % (name, 1000000.0 * seconds / len(loaded)))
+
+    load_action = actionLoader.ActionLoader.loadAction
+    actionLoader.ActionLoader.loadAction = compileEveryTime
+    try:
+        compile_seconds = timeReplay(path, frames)
+    finally:
+        actionLoader.ActionLoader.loadAction = load_action
+    prototype_seconds = timeReplay(path, frames)
+    for name,seconds in [('compile', compile_seconds), ('prototype', prototype_seconds)]:
+        print("%-14s %8.1f ms for the replay, %6.1f us per frame" % (name, 1000.0 * seconds, 1000000.0 * seconds / frames))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Benchmark for the hitbox broadphase in engine.collisionBox, against the old way of doing it
+with pygame.sprite.groupcollide. Sets up 4 fighters, each with a few hurtboxes and hitboxes of their own,
+and 200 projectile hitboxes spread over the stage, then times a frame's worth of clank and hit checks.
+Both ways are checked to find the same pairs, in the same order.
+
+    python benchmarks/broadphase.py [projectiles] [frames]
+"""
+from __future__ import print_function
+import os
+import sys
+import random
+import timeit
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+import engine.collisionBox as collisionBox
+
+class Owner(object):
+    pass
+
+class Box(pygame.sprite.Sprite):
+    def __init__(self, _owner, _rect):
+        pygame.sprite.Sprite.__init__(self)
+        self.owner = _owner
+        self.rect = pygame.Rect(_rect)
+
+def buildScene(_projectiles, _seed=0):
+    rng = random.Random(_seed)
+    fighters = [Owner() for _ in range(4)]
+    hitboxes = pygame.sprite.Group()
+    hurtboxes = pygame.sprite.Group()
+    for num,fighter in enumerate(fighters):
+        x = 400 + num * 250
+        for _ in range(3):
+            hurtboxes.add(Box(fighter, (x + rng.randint(-20, 20), 500 + rng.randint(-40, 40), 40, 50)))
+        for _ in range(4):
+            hitboxes.add(Box(fighter, (x + rng.randint(-60, 60), 500 + rng.randint(-50, 50), 30, 30)))
+    for _ in range(_projectiles):
+        hitboxes.add(Box(rng.choice(fighters), (rng.randint(0, 1800), rng.randint(200, 800), 16, 16)))
+    return hitboxes, hurtboxes
+
+def groupcollidePairs(_hitboxes, _hurtboxes):
+    clanks = []
+    hitbox_hits = pygame.sprite.groupcollide(_hitboxes, _hitboxes, False, False)
+    for hbox in hitbox_hits:
+        for other in hitbox_hits[hbox]:
+            if other is not hbox and other.owner is not hbox.owner:
+                clanks.append((hbox, other))
+    hits = []
+    hurtbox_hits = pygame.sprite.groupcollide(_hitboxes, _hurtboxes, False, False)
+    for hbox in hurtbox_hits:
+        for hurtbox in hurtbox_hits[hbox]:
+            if hbox.owner != hurtbox.owner:
+                hits.append((hbox, hurtbox))
+    return clanks, hits
+
+def broadphasePairs(_hitboxes, _hurtboxes):
+    hitboxes = list(_hitboxes)
+    hurtboxes = list(_hurtboxes)
+    owner_keys = dict()
+    bounds = collisionBox.getRectBounds(hitboxes)
+    owners = collisionBox.getOwnerKeys(hitboxes, owner_keys)
+    clanks = [(hitboxes[i], hitboxes[j]) for i,j in zip(*collisionBox.getOverlappingPairs(bounds, bounds, owners, owners))]
+    hurtbox_owners = collisionBox.getOwnerKeys(hurtboxes, owner_keys)
+    hits = [(hitboxes[i], hurtboxes[j]) for i,j in zip(*collisionBox.getOverlappingPairs(bounds, collisionBox.getRectBounds(hurtboxes), owners, hurtbox_owners))]
+    return clanks, hits
+
+def main():
+    projectiles = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+    hitboxes, hurtboxes = buildScene(projectiles)
+    old = groupcollidePairs(hitboxes, hurtboxes)
+    new = broadphasePairs(hitboxes, hurtboxes)
+    assert old == new, "broadphase found different collisions than groupcollide"
+    print("%d hitboxes, %d hurtboxes: %d clanks, %d hits" % (len(hitboxes), len(hurtboxes), len(old[0]), len(old[1])))
+    for name,function in [('groupcollide', groupcollidePairs), ('broadphase', broadphasePairs)]:
+        seconds = min(timeit.repeat(lambda: function(hitboxes, hurtboxes), number=frames, repeat=3))
+        print("%-12s %8.1f us per frame" % (name, 1000000.0 * seconds / frames))
+
+if __name__ == '__main__':
+    main()
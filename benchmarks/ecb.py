@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""
+Benchmark for the ECB collision kernel in engine.collisionBox. Puts a fighter's ECB in the middle of a stage
+full of platforms, then times the size and movement collision checks from collisionUpdate, once with the
+code the kernel replaced, which works out each platform on its own, and once with the kernel, which works
+out all of them together. Both ways are checked to find the same blocks, in the same order, with the same ejections.
+
+The code the kernel replaced is kept here as it was, with its filters written out as lists, which is what
+they were under Python 2, where the engine runs. tests/test_collision.py checks the kernel against it too.
+
+    python benchmarks/ecb.py [platforms] [frames]
+"""
+from __future__ import print_function
+import os
+import sys
+import copy
+import random
+import timeit
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+import pygame
+import spriteManager
+import engine.collisionBox as collisionBox
+
+class Actor(object):
+    pass
+
+#Just the rects an ECB's collision checks use, without a fighter to build them from
+class SceneECB(collisionBox.ECB):
+    def __init__(self, _current, _previous):
+        self.current_ecb = spriteManager.RectSprite(_current)
+        self.previous_ecb = spriteManager.RectSprite(_previous)
+
+def buildScene(_platforms, _seed=0):
+    rng = random.Random(_seed)
+    actor = Actor()
+    actor.ecb = SceneECB(pygame.Rect(880, 470, 40, 70), pygame.Rect(874, 461, 40, 70))
+    actor.change_x = 6.5
+    actor.change_y = 9.25
+    platforms = pygame.sprite.Group()
+    for _ in range(_platforms):
+        platforms.add(spriteManager.RectSprite(pygame.Rect(rng.randint(700, 1100), rng.randint(400, 600), rng.randint(20, 300), rng.randint(10, 60))))
+    return actor, platforms
+
+########################################################
+#            THE CODE THE KERNEL REPLACED              #
+########################################################
+
+def directionalDisplacements(_firstRect, _secondRect):
+    norm = numpy.linalg.norm([_firstRect.width, _firstRect.height])
+    directions = numpy.array([[float(-1), float(0)], [float(1), float(0)], [float(0), float(-1)], [float(0), float(1)], [-_firstRect.height/norm, -_firstRect.width/norm], [_firstRect.height/norm, -_firstRect.width/norm], [-_firstRect.height/norm, _firstRect.width/norm], [_firstRect.height/norm, _firstRect.width/norm]])
+    first_points = numpy.array([_firstRect.midtop, _firstRect.midbottom, _firstRect.midleft, _firstRect.midright])
+    second_points = numpy.array([_secondRect.topleft, _secondRect.topright, _secondRect.bottomleft, _secondRect.bottomright])
+    first_dots = numpy.inner(first_points, directions)
+    second_dots = numpy.inner(second_points, directions)
+    projected_displacements = numpy.amax(second_dots, 0) - numpy.amin(first_dots, 0)
+    return numpy.stack((directions*projected_displacements.reshape((8, 1)), directions.reshape((8, 2))), axis=1)
+
+def projectionIntersects(_startPoints, _endPoints, _rectPoints, _vector):
+    start_dots = numpy.inner(_startPoints, _vector)
+    end_dots = numpy.inner(_endPoints, _vector)
+    rect_dots = numpy.inner(_rectPoints, _vector)
+
+    if min(start_dots) == min(end_dots):
+        if min(start_dots) <= max(rect_dots): #.O.|...
+            t_mins = [float("-inf"), float("inf")]
+        else:                               #...|.O.
+            t_mins = [float("inf"), float("-inf")]
+    elif min(start_dots) > min(end_dots):
+        t_mins = [float(max(rect_dots)-min(start_dots))/(min(end_dots)-min(start_dots)), float("inf")]
+    else:
+        t_mins = [float("-inf"), float(max(rect_dots)-min(start_dots))/(min(end_dots)-min(start_dots))]
+
+    if max(start_dots) == max(end_dots):
+        if max(start_dots) >= min(rect_dots): #...|.O.
+            t_maxs = [float("-inf"), float("inf")]
+        else:                               #.O.|...
+            t_maxs = [float("inf"), float("-inf")]
+    elif max(start_dots) < max(end_dots):
+        t_maxs = [float(min(rect_dots)-max(start_dots))/(max(end_dots)-max(start_dots)), float("inf")]
+    else:
+        t_maxs = [float("-inf"), float(min(rect_dots)-max(start_dots))/(max(end_dots)-max(start_dots))]
+
+    if max(end_dots)-max(start_dots) == min(end_dots)-min(start_dots):
+        if max(start_dots) > min(start_dots):
+            t_open = [float("-inf"), float("inf")]
+        else:
+            t_open = [float("inf"), float("-inf")]
+    elif max(end_dots)-max(start_dots) > min(end_dots)-min(start_dots):
+        t_open = [float("-inf"), float(max(end_dots)-max(start_dots)-min(end_dots)+min(start_dots))/(max(start_dots)-min(start_dots))]
+    else:
+        t_open = [float(max(end_dots)-max(start_dots)-min(end_dots)+min(start_dots))/(max(start_dots)-min(start_dots)), float("inf")]
+
+    return [max(t_mins[0], t_maxs[0], t_open[0]), min(t_mins[1], t_maxs[1], t_open[1])]
+
+def getTestRect(_ecb, _dx, _dy):
+    test_rect = _ecb.current_ecb.rect.copy()
+    test_rect.x += _dx
+    test_rect.y += _dy
+    return test_rect
+
+def doesIntersect(_ecb, _other, _dx=0, _dy=0):
+    displacements = directionalDisplacements(getTestRect(_ecb, _dx, _dy), _other)
+    return all([numpy.dot(k[0], k[1]) >= 0 for k in displacements])
+
+def ejectionDirections(_ecb, _other, _dx=0, _dy=0):
+    distances = directionalDisplacements(getTestRect(_ecb, _dx, _dy), _other)
+    working_list = [e for e in distances if numpy.dot(e[0], e[1]) >= 0]
+    reference_list = copy.deepcopy(working_list)
+    for element in reference_list:
+        working_list = [k for k in working_list if abs(numpy.dot(k[0], element[1]) - numpy.dot(element[0], element[1])) > 0.01 or numpy.allclose(k[0], element[0])]
+    return working_list
+
+def primaryEjection(_ecb, _other, _dx=0, _dy=0):
+    good_directions = ejectionDirections(_ecb, _other, _dx, _dy)
+    distances = directionalDisplacements(_ecb.previous_ecb.rect, _other)
+    previous_dir = min(distances, key=lambda x: x[0][0]*x[1][0]+x[0][1]*x[1][1])
+    return min(good_directions, key=lambda y: -numpy.dot(previous_dir[1], y[0])+numpy.linalg.norm(y[0]))
+
+def pathRectIntersects(_ecb, _platform, _dx, _dy):
+    rect = _ecb.current_ecb.rect
+    if rect.colliderect(_platform):
+        return 0
+    start_corners = [rect.midtop, rect.midbottom, rect.midleft, rect.midright]
+    end_corners = [[rect.centerx+_dx, rect.top+_dy], 
+                   [rect.centerx+_dx, rect.bottom+_dy],
+                   [rect.left+_dx, rect.centery+_dy], 
+                   [rect.right+_dx, rect.centery+_dy]]
+    rect_corners = [_platform.topleft, _platform.topright, _platform.bottomleft, _platform.bottomright]
+
+    horizontal_intersects = projectionIntersects(start_corners, end_corners, rect_corners, [1, 0])
+    vertical_intersects = projectionIntersects(start_corners, end_corners, rect_corners, [0, 1])
+    downward_diagonal_intersects = projectionIntersects(start_corners, end_corners, rect_corners, [rect.height, rect.width])
+    upward_diagonal_intersects = projectionIntersects(start_corners, end_corners, rect_corners, [-rect.height, rect.width])
+
+    total_intersects = [max(horizontal_intersects[0], vertical_intersects[0], downward_diagonal_intersects[0], upward_diagonal_intersects[0], 0), min(horizontal_intersects[1], vertical_intersects[1], downward_diagonal_intersects[1], upward_diagonal_intersects[1], 1)]
+    if total_intersects[0] > total_intersects[1]:
+        return 999
+    else:
+        return total_intersects[0]
+
+def separateCollisions(_actor, _platforms):
+    ecb = _actor.ecb
+    size_collisions = [block for block in pygame.sprite.spritecollide(ecb.current_ecb, _platforms, False) if doesIntersect(ecb, block.rect)]
+    size_collisions.sort(key=lambda block: numpy.linalg.norm(primaryEjection(ecb, block.rect)[0]))
+    ejections = [primaryEjection(ecb, block.rect) for block in size_collisions]
+    future_rect = ecb.current_ecb.rect.move(_actor.change_x, _actor.change_y)
+    collide_sprite = spriteManager.RectSprite(ecb.current_ecb.rect.union(future_rect))
+    movement_collisions = [(block, pathRectIntersects(ecb, block.rect, _actor.change_x, _actor.change_y)) for block in pygame.sprite.spritecollide(collide_sprite, _platforms, False)]
+    movement_collisions = sorted([(block, t) for block, t in movement_collisions if t <= 1], key=lambda q: q[1])
+    return size_collisions, ejections, movement_collisions
+
+########################################################
+
+def batchedCollisions(_actor, _platforms):
+    size_collisions = collisionBox.getSizeCollisionsWith(_actor, _platforms)
+    ejections = list(_actor.ecb.primaryEjections(collisionBox.getRectBounds(size_collisions)))
+    movement_collisions = collisionBox.getMovementCollisionsWith(_actor, _platforms)
+    return size_collisions, ejections, movement_collisions
+
+def main():
+    platforms = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+    actor, group = buildScene(platforms)
+    old = separateCollisions(actor, group)
+    new = batchedCollisions(actor, group)
+    assert old[0] == new[0] and old[2] == new[2], "kernel found different collisions"
+    assert all((a == b).all() for a,b in zip(old[1], new[1])), "kernel found different ejections"
+    print("%d platforms: %d overlapping, %d in the way" % (platforms, len(old[0]), len(old[2])))
+    for name,function in [('separate', separateCollisions), ('batched', batchedCollisions)]:
+        seconds = min(timeit.repeat(lambda: function(actor, group), number=frames, repeat=3))
+        print("%-12s %8.1f us per frame" % (name, 1000000.0 * seconds / frames))
+
+if __name__ == '__main__':
+    main()
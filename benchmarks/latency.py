@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Benchmark for input latency. Plays hitboxie against sandbag through the normal battle loop, in a window,
+with player one on the keyboard. Every so often it posts a key press or release for player one, and the
+battle's LatencyMeter times it from the frame's pygame.event.get() to the end of drawing the first frame
+that has it in. It plays once the normal way and once in low latency mode.
+
+For each mode it reports the latency of every input: the mean, median, 99th percentile and worst, in
+milliseconds, and how many frames were shown up to and including the one with the input in it. It also
+reports how far each frame started from when it was due, since uneven frames feel like latency too.
+
+The latency is counted from when the battle reads the input, not from when the key was pressed, so on top
+of it there's the time an input waits in the queue for the next frame. That's half a frame on average,
+about 8 ms at 60 frames a second, plus whatever the keyboard, the OS and the monitor add.
+
+    python benchmarks/latency.py [frames] [stage]
+"""
+from __future__ import print_function
+import os
+import sys
+import random
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+import settingsManager
+import engine.controller as controller
+import engine.network as network
+import engine.profiler as profiler
+from matches import ScriptedMatch, FIGHTERS, TIMING_WINDOW, SEED, getPercentile
+
+KEY_BINDINGS = {pygame.K_z: 'attack', pygame.K_x: 'special', pygame.K_c: 'jump',
+                pygame.K_LEFT: 'left', pygame.K_RIGHT: 'right'}
+#Frames to play before timing anything, to get the caches warm
+WARMUP_FRAMES = 60
+
+def getLatencyMatch(_stage,_frames,_lowLatency):
+    match = ScriptedMatch(_stage, FIGHTERS, WARMUP_FRAMES + _frames + 1)
+    #Player one plays off the keyboard, like a person would. Player two keeps to the script.
+    keyboard = controller.Controller(KEY_BINDINGS, TIMING_WINDOW)
+    keyboard.linkObject(match.players[0])
+    match.players[0].key_bindings = keyboard
+    match.controllers[0] = keyboard
+    match.screen = pygame.display.get_surface()
+    match.setUpBattle()
+    #After setting up, which goes by the settings
+    match.low_latency = _lowLatency
+    match.network = network.Network(_enabled=False)
+    return match
+
+def runLatency(_stage,_frames,_lowLatency):
+    match = getLatencyMatch(_stage, _frames, _lowLatency)
+    rng = random.Random(SEED)
+    for _ in range(WARMUP_FRAMES):
+        match.gameEventLoop()
+    match.latency = profiler.LatencyMeter()
+    held = dict()
+    frame_starts = []
+    for _ in range(_frames):
+        if rng.random() < 0.2:
+            key = rng.choice(list(KEY_BINDINGS))
+            event_type = pygame.KEYUP if held.get(key) else pygame.KEYDOWN
+            held[key] = not held.get(key)
+            pygame.event.post(pygame.event.Event(event_type, key=key, mod=0, unicode='', scancode=0))
+        frame_starts.append(profiler.timer())
+        match.gameEventLoop()
+    period = 1.0 / match.clock_speed
+    lateness = [1000.0 * abs(end - start - period) for start,end in zip(frame_starts, frame_starts[1:])]
+    result = match.latency.getSummary() or {}
+    result['mode'] = 'low latency' if _lowLatency else 'normal'
+    result['pacing_p50_ms'] = getPercentile(lateness, 50)
+    result['pacing_p99_ms'] = getPercentile(lateness, 99)
+    return result
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 1800
+    stage = sys.argv[2] if len(sys.argv) > 2 else 'true_arena'
+    pygame.init()
+    pygame.display.set_mode(settingsManager.getSetting('windowSize'))
+    results = [runLatency(stage, frames, False), runLatency(stage, frames, True)]
+    pygame.quit()
+    print("%-12s %7s %8s %8s %8s %8s %7s %10s %10s" % ('mode', 'inputs', 'mean ms', 'p50 ms', 'p99 ms', 'max ms', 'frames', 'pacing p50', 'pacing p99'))
+    for result in results:
+        if 'inputs' not in result:
+            print("%-12s no inputs were timed" % result['mode'])
+            continue
+        print("%-12s %7d %8.2f %8.2f %8.2f %8.2f %7.2f %10.3f %10.3f" % (result['mode'], result['inputs'], result['mean_ms'], result['p50_ms'],
+                                                                   result['p99_ms'], result['max_ms'], result['frames'],
+                                                                   result['pacing_p50_ms'], result['pacing_p99_ms']))
+
+if __name__ == '__main__':
+    main()
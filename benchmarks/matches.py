@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+"""
+Benchmark for the whole simulation. Plays hitboxie against sandbag on each of the bundled stages, headless,
+with the same scripted inputs every time, and times every frame. Each match runs in a process of its own,
+so the peak memory of one doesn't count against the next.
+
+For each match it reports the frames per second, the median and 99th percentile frame time, how much memory
+a frame allocates on top of what it started with, and the peak resident memory of the process. Where the
+fighters ended up is saved too, so a change that plays differently shows up as well as one that's slower.
+
+The results are saved as JSON, along with the commit they came from. Two of them can be compared:
+
+    python benchmarks/matches.py [frames] [results.json]
+    python benchmarks/matches.py compare old.json new.json
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import random
+import timeit
+import subprocess
+import multiprocessing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import resource
+except ImportError: #Not on Windows
+    resource = None
+try:
+    import tracemalloc
+except ImportError: #Not in Python 2
+    tracemalloc = None
+
+import battle
+
+FIGHTERS = ['hitboxie', 'sandbag']
+STAGES = ['true_arena', 'arena', 'arena_moving_platform', 'treehouse', 'training_stage']
+KEYS = ['left', 'right', 'up', 'down', 'attack', 'special', 'jump', 'shield']
+#The default controls, so a match plays the same whatever the settings say
+TIMING_WINDOW = {'buffer_window': 8, 'repeat_window': 8, 'smoothing_window': 64, 'smash_window': 4}
+#Frames to play before timing anything, to get the caches warm
+WARMUP_FRAMES = 60
+SEED = 0
+
+"""
+A replay that never was. Instead of reading a file, it makes up its inputs from a seeded script: a random key
+held down for a random while, a few times a second, for each player. There are no stocks and no clock,
+so the match lasts as long as it's asked to. Loading it starts pygame headless, the way any replay does
+when there's no game around it.
+"""
+class ScriptedMatch(battle.Replay):
+    def __init__(self,_stage,_fighters,_frames,_seed=SEED):
+        self.seed = _seed
+        self.stocks = 0
+        self.time = 0
+        self.frame_count = _frames
+        self.final_status = 0
+        self.stage_name = _stage
+        self.replay_players = []
+        for player_num,fighter in enumerate(_fighters):
+            self.replay_players.append({'player_num': player_num,
+                                        'color': player_num,
+                                        'costume': 0,
+                                        'fighter': fighter,
+                                        'type': 'Keyboard',
+                                        'timing_window': TIMING_WINDOW,
+                                        'inputs': getScript(random.Random(_seed * 16 + player_num), _frames)
+                                        })
+        self.loadBattle()
+
+    #Nothing here seeks backwards, so there's no point saving keyframes
+    def simulationStep(self):
+        battle.Battle.simulationStep(self)
+
+def getScript(_rng,_frames):
+    inputs = dict()
+    frame = 0
+    while frame < _frames:
+        key = _rng.choice(KEYS)
+        inputs.setdefault(frame, []).append((key, 1.0))
+        inputs.setdefault(frame + _rng.randint(1, 20), []).append((key, 0))
+        frame += _rng.randint(1, 12)
+    return inputs
+
+def getPercentile(_values,_percentile):
+    values = sorted(_values)
+    return values[min(len(values) - 1, int(len(values) * _percentile / 100.0))]
+
+#In kilobytes. Linux counts ru_maxrss in kilobytes, macOS in bytes.
+def getPeakRSS():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+"""
+How much memory each frame allocates, on average, in kilobytes. This is the highest the traced memory goes
+during the frame, less what it was when the frame started, so it counts what's thrown away by the end of the
+frame too. It's a pass of its own, since tracing every allocation slows everything down.
+"""
+def getAllocationsPerFrame(_stage,_fighters,_frames):
+    if tracemalloc is None or not hasattr(tracemalloc, 'reset_peak'):
+        return None
+    match = ScriptedMatch(_stage, _fighters, WARMUP_FRAMES + _frames)
+    match.seek(WARMUP_FRAMES)
+    allocated = 0
+    tracemalloc.start()
+    try:
+        for _ in range(_frames):
+            start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            match.fastForward(1)
+            allocated += tracemalloc.get_traced_memory()[1] - start
+    finally:
+        tracemalloc.stop()
+    return allocated / 1024.0 / _frames
+
+def runMatch(_args):
+    stage,fighters,frames = _args
+    match = ScriptedMatch(stage, fighters, WARMUP_FRAMES + frames)
+    match.seek(WARMUP_FRAMES)
+    frame_times = []
+    timer = timeit.default_timer
+    for _ in range(frames):
+        start = timer()
+        match.fastForward(1)
+        frame_times.append(timer() - start)
+    result = {'stage': stage,
+              'fighters': fighters,
+              'frames': frames,
+              'fps': frames / sum(frame_times),
+              'p50_ms': 1000.0 * getPercentile(frame_times, 50),
+              'p99_ms': 1000.0 * getPercentile(frame_times, 99),
+              'final_state': [[round(fighter.posx, 2), round(fighter.posy, 2), fighter.damage] for fighter in match.players]
+              }
+    result['alloc_kb_per_frame'] = getAllocationsPerFrame(stage, fighters, frames)
+    result['peak_rss_kb'] = getPeakRSS()
+    return result
+
+#The engine prints as it goes, which would bury the results
+def silenceWorker():
+    sys.stdout = open(os.devnull, 'w')
+
+def getCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__))).decode('utf-8').strip()
+    except Exception:
+        return None
+
+def run(_frames,_path):
+    #One process per match, so each match's peak memory is its own
+    pool = multiprocessing.Pool(1, silenceWorker, maxtasksperchild=1)
+    try:
+        matches = pool.map(runMatch, [(stage, FIGHTERS, _frames) for stage in STAGES], 1)
+    finally:
+        pool.close()
+        pool.join()
+    print("%-22s %8s %8s %8s %10s %10s" % ('stage', 'fps', 'p50 ms', 'p99 ms', 'alloc kb', 'rss kb'))
+    for match in matches:
+        print("%-22s %8.1f %8.3f %8.3f %10s %10s" % (match['stage'], match['fps'], match['p50_ms'], match['p99_ms'],
+                                                   formatNumber(match['alloc_kb_per_frame']), formatNumber(match['peak_rss_kb'])))
+    results = {'commit': getCommit(),
+               'python': sys.version.split()[0],
+               'seed': SEED,
+               'matches': matches}
+    with open(_path, 'w') as results_file:
+        json.dump(results, results_file, indent=1, sort_keys=True)
+    print("Saved to " + _path)
+
+def formatNumber(_value):
+    if _value is None:
+        return '-'
+    return '%.1f' % _value
+
+"""
+Prints how each number changed from one set of results to the other, as a percentage. Frames per second going
+down is bad, everything else going up is. If the fighters ended up somewhere else, the simulation changed.
+"""
+def compare(_oldPath,_newPath):
+    with open(_oldPath) as old_file:
+        old = json.load(old_file)
+    with open(_newPath) as new_file:
+        new = json.load(new_file)
+    print("%s -> %s" % (old.get('commit'), new.get('commit')))
+    old_matches = dict([(match['stage'], match) for match in old['matches']])
+    for match in new['matches']:
+        before = old_matches.get(match['stage'])
+        if before is None:
+            continue
+        changes = []
+        for key in ['fps', 'p50_ms', 'p99_ms', 'alloc_kb_per_frame', 'peak_rss_kb']:
+            if before.get(key) and match.get(key) is not None:
+                changes.append("%s %+.1f%%" % (key, 100.0 * (match[key] - before[key]) / before[key]))
+        if before['final_state'] != match['final_state'] or before['frames'] != match['frames']:
+            changes.append('PLAYS DIFFERENTLY')
+        print("%-22s %s" % (match['stage'], ', '.join(changes)))
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        compare(sys.argv[2], sys.argv[3])
+        return
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 1800
+    path = sys.argv[2] if len(sys.argv) > 2 else 'benchmark_results.json'
+    run(frames, path)
+
+if __name__ == '__main__':
+    main()
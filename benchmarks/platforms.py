@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""
+Benchmark for the stage's platform index in engine.collisionBox. Builds a big custom stage's worth of platforms,
+a few of them moving, then times the lookups a frame of four fighters makes (collision, ground, wall and ceiling
+checks), once with pygame.sprite.spritecollide over the whole list and once through the SpatialIndex.
+Both ways are checked to find the same platforms, in the same order.
+
+    python benchmarks/platforms.py [platforms] [frames]
+"""
+from __future__ import print_function
+import os
+import sys
+import random
+import timeit
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+import spriteManager
+import engine.collisionBox as collisionBox
+
+#About how many platform lookups each fighter makes in a frame
+LOOKUPS_PER_FIGHTER = 12
+
+def buildScene(_platforms, _seed=0):
+    rng = random.Random(_seed)
+    platforms = []
+    for _ in range(_platforms):
+        platforms.append(spriteManager.RectSprite(pygame.Rect(rng.randint(0, 8000), rng.randint(0, 4000), rng.randint(40, 400), rng.randint(1, 60))))
+    moving = rng.sample(platforms, 4)
+    queries = []
+    for _ in range(4 * LOOKUPS_PER_FIGHTER):
+        queries.append(spriteManager.RectSprite(pygame.Rect(rng.randint(0, 8000), rng.randint(0, 4000), rng.randint(40, 80), rng.randint(60, 120))))
+    return platforms, moving, queries
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+    platforms, moving, queries = buildScene(count)
+    index = collisionBox.SpatialIndex(platforms, moving)
+    for query in queries:
+        assert pygame.sprite.spritecollide(query, platforms, False) == collisionBox.spritecollide(query, index), "index found different platforms"
+    print("%d platforms, %d lookups per frame" % (count, len(queries)))
+    for name,platform_list in [('spritecollide', platforms), ('index', index)]:
+        seconds = min(timeit.repeat(lambda: [collisionBox.spritecollide(query, platform_list) for query in queries], number=frames, repeat=3))
+        print("%-14s %8.1f us per frame" % (name, 1000000.0 * seconds / frames))
+
+if __name__ == '__main__':
+    main()
@@ -170,6 +170,9 @@ class MainFrame(Tk):
         else:
             new_fighter = engine.abstractFighter.AbstractFighter(dirname,0)
         
+        #The editor changes the actions it loads in place, so they can't be copies sharing a prototype's subactions
+        if hasattr(new_fighter.actions, 'use_prototypes'):
+            new_fighter.actions.use_prototypes = False
         new_fighter.loadSpriteLibrary(0)
         new_fighter.current_action = new_fighter.getAction('NeutralAction')
         new_fighter.init_boxes()
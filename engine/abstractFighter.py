@@ -14,6 +14,8 @@ import engine.article as article
 import engine.controller as controller
 import engine.actionLoader as actionLoader
 import engine.articleLoader
+import engine.fighterPackage as fighterPackage
+import engine.profiler as profiler
 from global_functions import *
 
 class AbstractFighter():
@@ -189,6 +191,10 @@ class AbstractFighter():
         
         self.base_dir = _baseDir
         self.player_num = _playerNum
+        #The profiler's names for this fighter's sections, made once here rather than every frame
+        self.profiler_names = {'update': 'fighter '+str(_playerNum)+' update',
+                               'collisionUpdate': 'fighter '+str(_playerNum)+' collisionUpdate',
+                               'childUpdate': 'fighter '+str(_playerNum)+' childUpdate'}
         
         #Load the xml data if fighter.xml exists
         if os.path.exists(os.path.join(self.base_dir,'fighter.xml')):
@@ -362,7 +368,10 @@ class AbstractFighter():
     
     def loadSpriteLibrary(self,_color=None):
         """ Loads the sprite library for the fighter, with the current
-        costume and color.
+        costume and color. It comes out of the fighter package for that
+        costume and color, which is built the first time it's needed, and
+        again whenever the fighter's files change. The package's action
+        prototypes are handed to the action loader too.
         
         Parameters
         -----------
@@ -379,13 +388,22 @@ class AbstractFighter():
 
         if _color == None: _color = self.current_color
         
+        #The package the sprites and actions come from, if there is one
+        self.sprite_package = fighterPackage.getPackage(self,_color)
+        library = None
+        if self.sprite_package is not None:
+            library = self.sprite_package.getImageLibrary()
+            if hasattr(self.actions,'addPrototypes'):
+                self.actions.addPrototypes(self.sprite_package.getPrototypes())
+        
         self.sprite = spriteManager.SpriteHandler(str(directory),
                                                   self.costumes[self.current_costume % len(self.costumes)],
                                                   self.default_sprite,
                                                   self.sprite_width,
                                                   self.color_palettes[_color % len(self.color_palettes)],
                                                   scale,
-                                                  self.sprite_flip)
+                                                  self.sprite_flip,
+                                                  library)
         self.rect = self.sprite.rect
     
     def initialize(self):
@@ -492,7 +510,7 @@ class AbstractFighter():
         
         # Allow ledge re-grabs if we've vacated a ledge
         if self.ledge_lock:
-            ledges = pygame.sprite.spritecollide(self.ecb.current_ecb, self.game_state.platform_ledges, False)
+            ledges = self.game_state.getLedgeIndex().spritecollide(self.ecb.current_ecb)
             if len(ledges) == 0: # If we've cleared out of all of the ledges
                 self.ledge_lock = False
         
@@ -508,10 +526,18 @@ class AbstractFighter():
         self.updatePosition()
         self.ecb.normalize()
         
-        self.collisionUpdate()            
-        self.childUpdate()
+        with profiler.getProfiler().section(self.profiler_names['collisionUpdate']):
+            self.collisionUpdate()
+        with profiler.getProfiler().section(self.profiler_names['childUpdate']):
+            self.childUpdate()
         self.timerUpdate()
         
+    def getProfilerArgs(self):
+        """ What the profiler notes down about this fighter's update in a trace.
+        It's only asked for when the profiler's on.
+        """
+        return {'fighter': self.name, 'action': self.current_action.name}
+        
     def collisionUpdate(self):
         """ Execute movement and resolve collisions.
         This function is due for a huge overhaul.
@@ -522,7 +548,7 @@ class AbstractFighter():
             self.updatePosition()
             self.ecb.normalize()
             bumped = False
-            block_hit_list = collisionBox.getSizeCollisionsWith(self, self.game_state.platform_list)
+            block_hit_list = collisionBox.getSizeCollisionsWith(self, self.game_state.getPlatformIndex())
             if not block_hit_list:
                 break
             for block in block_hit_list:
@@ -545,10 +571,10 @@ class AbstractFighter():
 
         self.updatePosition()
         self.ecb.normalize()
-        block_hit_list = collisionBox.getMovementCollisionsWith(self, self.game_state.platform_list)
-        for block in block_hit_list:
-            if self.ecb.pathRectIntersects(block.rect, self.change_x, self.change_y) > 0 and self.ecb.pathRectIntersects(block.rect, self.change_x, self.change_y) < t and collisionBox.catchMovement(self, block, self.platform_phase > 0): 
-                t = self.ecb.pathRectIntersects(block.rect, self.change_x, self.change_y)
+        block_hit_list = collisionBox.getMovementCollisionsWith(self, self.game_state.getPlatformIndex())
+        for block, block_t in block_hit_list:
+            if block_t > 0 and block_t < t and collisionBox.catchMovement(self, block, self.platform_phase > 0): 
+                t = block_t
                 to_bounce_block = block
                 
         self.posy += self.change_y*t
@@ -579,8 +605,14 @@ class AbstractFighter():
         """
         if self.mask:self.mask = self.mask.update()
         
+        #Articles come and go, so their sections are only named when the profiler's on to keep them
+        profiling = profiler.getProfiler().enabled
         for art in self.articles:
-            art.update()
+            if profiling:
+                with profiler.getProfiler().section('article '+getattr(art,'name',art.__class__.__name__),{'fighter': self.name}):
+                    art.update()
+            else:
+                art.update()
         for stat in self.status_effects:
             stat.update()
         
@@ -621,7 +653,7 @@ class AbstractFighter():
             self.updatePosition()
             self.ecb.normalize()
             bumped = False
-            block_hit_list = collisionBox.getSizeCollisionsWith(self, self.game_state.platform_list)
+            block_hit_list = collisionBox.getSizeCollisionsWith(self, self.game_state.getPlatformIndex())
             if not block_hit_list:
                 break
             for block in block_hit_list:
@@ -665,13 +697,58 @@ class AbstractFighter():
             self.platform_phase -= 1
         self.ecb.normalize()
 
+    def saveState(self):
+        """ Take a snapshot of everything about the fighter that can change from frame to frame,
+        so it can be put back with loadState. Used for rollback netcode and seeking in replays.
+        Only the things that get changed in place are copied, so this is cheap enough to do every frame.
+        
+        Return
+        -----------
+        A tuple to hand back to loadState. Don't go poking around in it.
+        """
+        return (getObjectState(self),
+                self.ecb.saveState(),
+                self.sprite.saveState(),
+                self.current_action.saveState(),
+                self.input_buffer.saveState(),
+                self.auto_hurtbox.saveState(),
+                [art.saveState() for art in self.articles],
+                [getObjectState(stat) for stat in self.status_effects],
+                self.mask.saveState() if self.mask else None)
+    
+    def loadState(self,_state):
+        """ Put the fighter back the way it was when saveState was called.
+        
+        Parameters
+        -----------
+        _state : tuple
+            A snapshot from saveState
+        """
+        attributes,ecb_state,sprite_state,action_state,buffer_state,hurtbox_state,article_states,status_states,mask_state = _state
+        # Restoring our attributes first means the rest of these are the objects we had when we saved
+        setObjectState(self,attributes)
+        self.ecb.loadState(ecb_state)
+        self.sprite.loadState(sprite_state)
+        self.current_action.loadState(action_state)
+        self.input_buffer.loadState(buffer_state)
+        self.auto_hurtbox.loadState(hurtbox_state)
+        for art,article_state in zip(self.articles,article_states):
+            art.loadState(article_state)
+        for stat,status_state in zip(self.status_effects,status_states):
+            setObjectState(stat,status_state)
+        if self.mask: self.mask.loadState(mask_state)
+
     def draw(self,_screen,_offset,_scale):
-        if (settingsManager.getSetting('showSpriteArea')):spriteManager.RectSprite(self.sprite.rect).draw(_screen, _offset, _scale)
-        rect = self.sprite.draw(_screen,_offset,_scale)
-        if self.mask: self.mask.draw(_screen,_offset,_scale)
+        rects = []
+        if (settingsManager.getSetting('showSpriteArea')):rects.append(spriteManager.RectSprite(self.sprite.rect).draw(_screen, _offset, _scale))
+        rects.append(self.sprite.draw(_screen,_offset,_scale))
+        if self.mask: rects.append(self.mask.draw(_screen,_offset,_scale))
         if settingsManager.getSetting('showECB'): 
-            self.ecb.draw(_screen,_offset,_scale)
-        return rect
+            rects.append(self.ecb.draw(_screen,_offset,_scale))
+        #Everything the fighter drew on, so the battle knows what to redraw next frame
+        rects = [rect for rect in rects if rect]
+        if not rects: return None
+        return rects[0].unionall(rects[1:])
 
     ########################################################
     #                 ACTION MANAGEMENT                    #
@@ -964,51 +1041,51 @@ class AbstractFighter():
         
     def checkGround(self):
         self.updatePosition()
-        return collisionBox.checkGround(self, self.game_state.platform_list, self.tech_window <= 0)
+        return collisionBox.checkGround(self, self.game_state.getPlatformIndex(), self.tech_window <= 0)
 
     def checkLeftWall(self):
         self.updatePosition()
-        return collisionBox.checkLeftWall(self, self.game_state.platform_list, True)
+        return collisionBox.checkLeftWall(self, self.game_state.getPlatformIndex(), True)
 
     def checkRightWall(self):
         self.updatePosition()
-        return collisionBox.checkRightWall(self, self.game_state.platform_list, True)
+        return collisionBox.checkRightWall(self, self.game_state.getPlatformIndex(), True)
 
     def checkBackWall(self):
         self.updatePosition()
-        return collisionBox.checkBackWall(self, self.game_state.platform_list, True)
+        return collisionBox.checkBackWall(self, self.game_state.getPlatformIndex(), True)
 
     def checkFrontWall(self):
         self.updatePosition()
-        return collisionBox.checkFrontWall(self, self.game_state.platform_list, True)
+        return collisionBox.checkFrontWall(self, self.game_state.getPlatformIndex(), True)
 
     def checkCeiling(self):
         self.updatePosition()
-        return collisionBox.checkCeiling(self, self.game_state.platform_list, True)
+        return collisionBox.checkCeiling(self, self.game_state.getPlatformIndex(), True)
 
     def isGrounded(self):
         self.updatePosition()
-        return collisionBox.isGrounded(self, self.game_state.platform_list, self.tech_window <= 0)
+        return collisionBox.isGrounded(self, self.game_state.getPlatformIndex(), self.tech_window <= 0)
 
     def isLeftWalled(self):
         self.updatePosition()
-        return collisionBox.isLeftWalled(self, self.game_state.platform_list, True)
+        return collisionBox.isLeftWalled(self, self.game_state.getPlatformIndex(), True)
 
     def isRightWalled(self):
         self.updatePosition()
-        return collisionBox.isRightWalled(self, self.game_state.platform_list, True)
+        return collisionBox.isRightWalled(self, self.game_state.getPlatformIndex(), True)
 
     def isBackWalled(self):
         self.updatePosition()
-        return collisionBox.isBackWalled(self, self.game_state.platform_list, True)
+        return collisionBox.isBackWalled(self, self.game_state.getPlatformIndex(), True)
 
     def isFrontWalled(self):
         self.updatePosition()
-        return collisionBox.isFrontWalled(self, self.game_state.platform_list, True)
+        return collisionBox.isFrontWalled(self, self.game_state.getPlatformIndex(), True)
 
     def isCeilinged(self):
         self.updatePosition()
-        return collisionBox.isCeilinged(self, self.game_state.platform_list, True)
+        return collisionBox.isCeilinged(self, self.game_state.getPlatformIndex(), True)
     
     def setSpeed(self,_speed,_direction):
         """ Set the actor's speed. Instead of modifying the change_x and change_y values manually,
@@ -1083,7 +1160,7 @@ class AbstractFighter():
     ########################################################
     
     
-    def keyPressed(self,_key):
+    def keyPressed(self,_key,_value=1.0):
         """ Add a key to the buffer. This function should be adding
         to the buffer, and ONLY adding to the buffer. Any sort
         of calculations and state changes should probably be done
@@ -1093,9 +1170,12 @@ class AbstractFighter():
         -----------
         _key : String
             The key to append to the buffer
+        _value : float
+            How far the key is pressed, from 0 to 1. Buttons are all the way,
+            a gamepad's stick can be anywhere in between.
         """
-        self.input_buffer.append((_key,1.0))
-        self.keys_held[_key] = 1.0
+        self.input_buffer.append((_key,_value))
+        self.keys_held[_key] = _value
         
     def keyReleased(self,_key):
         """ Removes a key from the buffer. That is to day, it appends
@@ -1134,7 +1214,7 @@ class AbstractFighter():
         _to : int : 0
             The furthest forward frame to look to.
         """
-        if any(map(lambda k: _key in k and k[_key] >= _state,self.input_buffer.getLastNFrames(_from, _to))):
+        if self.input_buffer.getKeyFrames(_key, _from, _to, _state)[0]:
             self.last_input_frame = 0
             return True
         return False
@@ -1157,13 +1237,10 @@ class AbstractFighter():
         """
         if _from is None:
             _from = max(min(int(self.key_bindings.timing_window['buffer_window']), self.last_input_frame), 1)
-        down_frames = map(lambda k: _key in k and k[_key] >= _state, self.input_buffer.getLastNFrames(_from, _to))
-        up_frames = map(lambda k: _key in k and k[_key] < _state, self.input_buffer.getLastNFrames(_from, _to))
-        if not any(down_frames) or not any(up_frames):
+        down_frames,up_frames = self.input_buffer.getKeyFrames(_key, _from, _to, _state)
+        if not down_frames or not up_frames:
             return False
-        first_down_frame = reduce(lambda j, k: j if j != None else (k if down_frames[k] else None), range(len(down_frames)), None)
-        last_up_frame = reduce(lambda j, k: k if up_frames[k] else j, range(len(up_frames)), None)
-        if first_down_frame >= last_up_frame:
+        if controller.getNewestFrame(down_frames) >= controller.getOldestFrame(up_frames):
             self.last_input_frame = 0
             return True
         return False
@@ -1187,16 +1264,13 @@ class AbstractFighter():
         """
         if _from is None:
             _from = max(min(int(self.key_bindings.timing_window['buffer_window']), self.last_input_frame), 1)
-        down_frames = map(lambda k: _key in k and k[_key] >= _state, self.input_buffer.getLastNFrames(_from, _to))
-        up_frames = map(lambda k: _key in k and k[_key] < _state, self.input_buffer.getLastNFrames(_from, _to))
-        if not any(down_frames):
+        down_frames,up_frames = self.input_buffer.getKeyFrames(_key, _from, _to, _state)
+        if not down_frames:
             return False
-        if any(down_frames) and not any(up_frames):
+        if not up_frames:
             self.last_input_frame = 0
             return True
-        first_down_frame = reduce(lambda j, k: j if j != None else (k if down_frames[k] else None), range(len(down_frames)), None)
-        last_up_frame = reduce(lambda j, k: k if up_frames[k] else j, range(len(up_frames)), None)
-        if first_down_frame < last_up_frame:
+        if controller.getNewestFrame(down_frames) < controller.getOldestFrame(up_frames):
             self.last_input_frame = 0
             return True
         return False
@@ -1216,7 +1290,7 @@ class AbstractFighter():
         _to : int : 0
             The furthest forward frame to look to.
         """
-        if any(map(lambda k: _key in k and k[_key] < _state, self.input_buffer.getLastNFrames(_from, _to))):
+        if self.input_buffer.getKeyFrames(_key, _from, _to, _state)[1]:
             self.last_input_frame = 0
             return True
         return False
@@ -1239,13 +1313,11 @@ class AbstractFighter():
         """
         if _from is None:
             _from = max(min(int(self.key_bindings.timing_window['buffer_window']), self.last_input_frame), 1)
-        up_frames = map(lambda k: _key in k and k[_key] < _state, self.input_buffer.getLastNFrames(_from, _to))
-        down_frames = map(lambda k: _key in k and k[_key] >= _state, self.input_buffer.getLastNFrames(_from, _to))
-        if not any(down_frames) or not any(down_frames):
+        down_frames,up_frames = self.input_buffer.getKeyFrames(_key, _from, _to, _state)
+        if not down_frames:
             return False
-        first_up_frame = reduce(lambda j, k: j if j != None else (k if up_frames[k] else None), range(len(up_frames)), None)
-        last_down_frame = reduce(lambda j, k: k if down_frames[k] else j, range(len(down_frames)), None)
-        if first_up_frame < last_down_frame:
+        #With no releases at all, this has always counted as a reinput
+        if not up_frames or controller.getNewestFrame(up_frames) < controller.getOldestFrame(down_frames):
             self.last_input_frame = 0
             return True
         return False
@@ -1268,16 +1340,13 @@ class AbstractFighter():
         """
         if _from is None:
             _from = max(min(int(self.key_bindings.timing_window['buffer_window']), self.last_input_frame), 1)
-        up_frames = map(lambda k: _key in k and k[_key] < _state, self.input_buffer.getLastNFrames(_from, _to))
-        down_frames = map(lambda k: _key in k and k[_key] >= _state, self.input_buffer.getLastNFrames(_from, _to))
-        if not any(up_frames):
+        down_frames,up_frames = self.input_buffer.getKeyFrames(_key, _from, _to, _state)
+        if not up_frames:
             return False
-        if any(up_frames) and not any(down_frames):
+        if not down_frames:
             self.last_input_frame = 0
             return True
-        first_up_frame = reduce(lambda j, k: j if j != None else (k if up_frames[k] else None), range(len(up_frames)), None)
-        last_down_frame = reduce(lambda j, k: k if down_frames[k] else j, range(len(down_frames)), None)
-        if first_up_frame >= last_down_frame:
+        if controller.getNewestFrame(up_frames) >= controller.getOldestFrame(down_frames):
             self.last_input_frame = 0
             return True
         return False
@@ -1294,61 +1363,19 @@ class AbstractFighter():
         
         """
         #QUESTION - explain this algorithm a little better
-        #TODO If this is a gamepad, simply return its analog input
         if _distanceBack is None:
             smooth_distance = int(self.key_bindings.timing_window['smoothing_window'])
             _distanceBack = smooth_distance
         else:
             smooth_distance = _distanceBack
         
-        hold_buffer = reversed(self.input_buffer.getLastNFrames(_distanceBack))
-        smoothed_x = 0.0
-        smoothed_y = 0.0
         if self.key_bindings.type == "Keyboard":
-            for frame_input in hold_buffer:
-                working_x = 0.0
-                working_y = 0.0
-                x_decay = float(1.5)/smooth_distance
-                y_decay = float(1.5)/smooth_distance
-                if 'left' in frame_input: working_x -= frame_input['left']
-                if 'right' in frame_input: working_x += frame_input['right']
-                if 'up' in frame_input: working_y -= frame_input['up']
-                if 'down' in frame_input: working_y += frame_input['down']
-                if (working_x > 0 and smoothed_x > 0) or (working_x < 0 and smoothed_x < 0):
-                    x_decay = float(1)/smooth_distance
-                elif (working_x < 0 and smoothed_x > 0) or (working_x > 0 and smoothed_x < 0):
-                    x_decay = float(4)/smooth_distance
-                if (working_y < 0 and smoothed_y < 0) or (working_y > 0 and smoothed_y > 0):
-                    y_decay = float(1)/smooth_distance
-                elif (working_y < 0 and smoothed_y > 0) or (working_y > 0 and smoothed_y < 0):
-                    ySmooth = float(4)/smooth_distance
-                magnitude = numpy.linalg.norm([working_x, working_y])
-                if magnitude > _maxMagnitude:
-                    working_x /= magnitude/_maxMagnitude
-                    working_y /= magnitude/_maxMagnitude
-                if smoothed_x > 0:
-                    smoothed_x -= x_decay
-                    if smoothed_x < 0:
-                        smoothed_x = 0
-                elif smoothed_x < 0:
-                    smoothed_x += x_decay
-                    if smoothed_x > 0:
-                        smoothed_x = 0
-                if smoothed_y > 0:
-                    smoothed_y -= y_decay
-                    if smoothed_y < 0:
-                        smoothed_y = 0
-                elif smoothed_y < 0:
-                    smoothed_y += y_decay
-                    if smoothed_y > 0:
-                        smoothed_y = 0
-                smoothed_x += working_x
-                smoothed_y += working_y
+            smoothed_x,smoothed_y = self.input_buffer.getSmoothedDirection(smooth_distance,_maxMagnitude)
         else:
-            left = self.keys_held['left'] if self.keys_held.has_key('left') else 0
-            right = self.keys_held['right'] if self.keys_held.has_key('right') else 0
-            up = self.keys_held['up'] if self.keys_held.has_key('up') else 0
-            down = self.keys_held['down'] if self.keys_held.has_key('down') else 0
+            left = self.keys_held.get('left', 0)
+            right = self.keys_held.get('right', 0)
+            up = self.keys_held.get('up', 0)
+            down = self.keys_held.get('down', 0)
             smoothed_x = -left+right
             smoothed_y = -up+down
             
@@ -1,4 +1,6 @@
 import xml.etree.ElementTree as ElementTree
+import copy
+from global_functions import *
 
 # The action class is used for creating attacks, movement options,
 # air dodges, rolls, and pretty much anything that happens to your
@@ -43,20 +45,84 @@ class Action(object):
         self.tear_down_actions = []
         
         self.default_vars = dict()
+        
+        #The subaction lists, compiled into functions by compile. Until then, the lists are run as they are.
+        self.compiled_at_frame = None
+        self.compiled_before_frame = None
+        self.compiled_after_frame = None
+        self.compiled_at_last_frame = None
+        self.compiled_transitions = None
+        self.compiled_events = None
+    
+    # The subaction lists an action is built from. They never change while
+    # the action runs, so copies of an action can all share them.
+    compiled_attributes = frozenset(['actions_at_frame', 'actions_before_frame', 'actions_after_frame',
+                                     'actions_at_last_frame', 'actions_on_clank', 'actions_on_prevail',
+                                     'events', 'state_transition_actions', 'set_up_actions',
+                                     'tear_down_actions', 'default_vars',
+                                     'compiled_at_frame', 'compiled_events'])
+    
+    # Makes a fresh copy of this action, to be set up and run on its own.
+    # The compiled subactions are shared with this one, everything else
+    # (frame, variables, hitboxes, locks...) belongs to the copy. Doesn't
+    # call __init__, so it's much cheaper than building the action again.
+    # Editing a copy's subactions edits them all, see use_prototypes in
+    # ActionLoader for getting actions that can be edited.
+    def clone(self):
+        new_action = object.__new__(self.__class__)
+        new_action.__dict__.update(self.__dict__)
+        for key,value in self.__dict__.items():
+            if key not in self.compiled_attributes and isinstance(value, (list,dict,set)):
+                setattr(new_action, key, copy.copy(value))
+        return new_action
+    
+    # Compiles the frame tables and transitions into one function each, so
+    # that running a frame doesn't go back through every subaction's
+    # lookups and string checks. Events are compiled too, for the ifs that
+    # run them. Call it again after changing any of the subaction lists.
+    def compile(self):
+        from engine.subaction import compileSubactions
+        self.compiled_events = dict()
+        for name,event in self.events.items():
+            self.compiled_events[name] = compileSubactions(event, self)
+        self.compiled_at_frame = [compileSubactions(subacts, self) for subacts in self.actions_at_frame]
+        self.compiled_before_frame = compileSubactions(self.actions_before_frame, self)
+        self.compiled_after_frame = compileSubactions(self.actions_after_frame, self)
+        self.compiled_at_last_frame = compileSubactions(self.actions_at_last_frame, self)
+        self.compiled_transitions = compileSubactions(self.state_transition_actions, self)
+    
+    # Throws the compiled tables away, so the subaction lists are run as
+    # they are again. Compiled actions can't be pickled, so this is done
+    # to a copy before saving one.
+    def decompile(self):
+        self.compiled_at_frame = None
+        self.compiled_before_frame = None
+        self.compiled_after_frame = None
+        self.compiled_at_last_frame = None
+        self.compiled_transitions = None
+        self.compiled_events = None
             
     # The update skeleton function. You must implement it for every action or you will get
     # an error.
     def update(self,_actor):
-        for act in self.actions_before_frame:
-            act.execute(self,_actor)
-        if self.frame < len(self.actions_at_frame):
-            for act in self.actions_at_frame[self.frame]:
+        if self.compiled_at_frame is not None:
+            self.compiled_before_frame(self,_actor)
+            if self.frame < len(self.compiled_at_frame):
+                self.compiled_at_frame[self.frame](self,_actor)
+            if self.frame == self.last_frame:
+                self.compiled_at_last_frame(self,_actor)
+            self.compiled_after_frame(self,_actor)
+        else:
+            for act in self.actions_before_frame:
                 act.execute(self,_actor)
-        if self.frame == self.last_frame:
-            for act in self.actions_at_last_frame:
+            if self.frame < len(self.actions_at_frame):
+                for act in self.actions_at_frame[self.frame]:
+                    act.execute(self,_actor)
+            if self.frame == self.last_frame:
+                for act in self.actions_at_last_frame:
+                    act.execute(self,_actor)
+            for act in self.actions_after_frame:
                 act.execute(self,_actor)
-        for act in self.actions_after_frame:
-            act.execute(self,_actor)
         if self.sprite_rate is not 0:
             if self.sprite_rate < 0:
                 _actor.changeSpriteImage((self.frame // self.sprite_rate)-1, _loop=self.loop)
@@ -104,8 +170,11 @@ class Action(object):
         self.frame += 1         
                     
     def stateTransitions(self,_actor):
-        for act in self.state_transition_actions:
-            act.execute(self,_actor)
+        if self.compiled_transitions is not None:
+            self.compiled_transitions(self,_actor)
+        else:
+            for act in self.state_transition_actions:
+                act.execute(self,_actor)
     
     def setUp(self,_actor):
         self.sprite_rate = self.base_sprite_rate
@@ -136,3 +205,17 @@ class Action(object):
     def onClank(self,_actor,_hitbox,_other):
         for act in self.actions_on_clank:
             act.execute(self,_actor)
+            
+    # Snapshot the action and the hitboxes and hurtboxes it owns, for rollback and replay seeking.
+    def saveState(self):
+        return (getObjectState(self),
+                dict((name,hbox.saveState()) for name,hbox in self.hitboxes.items()),
+                dict((name,hbox.saveState()) for name,hbox in self.hurtboxes.items()))
+    
+    def loadState(self,_state):
+        attributes,hitbox_states,hurtbox_states = _state
+        setObjectState(self,attributes)
+        for name,hitbox_state in hitbox_states.items():
+            self.hitboxes[name].loadState(hitbox_state)
+        for name,hurtbox_state in hurtbox_states.items():
+            self.hurtboxes[name].loadState(hurtbox_state)
@@ -16,12 +16,27 @@ class ActionLoader():
         self.actions_xml_full = ElementTree.parse(self.actions_xml_data)
         self.actions_xml = self.actions_xml_full.getroot()
         print('actions_xml: ' + str(self.actions_xml))
+        #Every action we've built so far, by name. Loading one hands out a copy of it.
+        self.prototypes = dict()
+        #Copies share their subaction lists and subactions with the prototype, so anything that edits
+        #the actions it loads, like the builder, turns this off to get an action of its own every time
+        self.use_prototypes = True
     
     def hasAction(self, _actionName):
         if self.actions_xml.find(_actionName) is None:
             return False
         return True
     
+    """
+    Adds prototypes that were built somewhere else, like a fighter package. They're compiled
+    here, but any action that's already been built is left alone.
+    """
+    def addPrototypes(self,_prototypes):
+        for name,prototype in _prototypes.items():
+            if name not in self.prototypes:
+                prototype.compile()
+                self.prototypes[name] = prototype
+    
     def getAllActions(self):
         ret = []
         for item in list(self.actions_xml):
@@ -48,6 +63,7 @@ class ActionLoader():
     object of the fighter.
     """
     def modifyAction(self,_actionName,_newAction):
+        self.prototypes.pop(_actionName, None)
         action_xml = self.actions_xml.find(_actionName)
         if action_xml is not None:self.actions_xml.remove(action_xml)
         
@@ -158,16 +174,39 @@ class ActionLoader():
             data = reparsed.toprettyxml(indent="\t")
             self.actions_xml.append(ElementTree.fromstring(data))
             
+    """
+    Gets a new copy of an action, ready to be set up. The action is only built from the XML the
+    first time it's asked for. After that, it's cloned from that first one, which is never run itself.
+    With use_prototypes off, it's built from the XML every time, and nothing is kept.
+    """
     def loadAction(self,_actionName):
+        if not self.use_prototypes:
+            new_action = self.compileAction(_actionName)
+            if isinstance(new_action, action.Action):
+                return new_action
+            return new_action()
+        prototype = self.prototypes.get(_actionName)
+        if prototype is None:
+            prototype = self.compileAction(_actionName)
+            self.prototypes[_actionName] = prototype
+        if isinstance(prototype, action.Action):
+            return prototype.clone()
+        #Python actions set themselves up however they like, so we make a new one every time
+        return prototype()
+    
+    """
+    Builds an action from the XML. Python actions give back their class instead, since we can't
+    know what a copy of one needs.
+    """
+    def compileAction(self,_actionName):
         #Load the action XML
         action_xml = self.actions_xml.find(_actionName)
-        print('loading action',action_xml,_actionName)
         #Check if it's a Python action
         if action_xml is not None and action_xml.find('loadCodeAction') is not None:
             file_name = action_xml.find('loadCodeAction').find('file').text
             action_name = action_xml.find('loadCodeAction').find('action').text
             new_action = settingsManager.importFromURI(os.path.join(self.base_dir,file_name), file_name)
-            return getattr(new_action, action_name)()
+            return getattr(new_action, action_name)
         
         #Get the baseClass
         class_ = None
@@ -208,10 +247,9 @@ class ActionLoader():
         set_up_actions = []
         if action_xml.find('setUp') is not None:
             for subact in action_xml.find('setUp'):
-                print('loading setup actions',subaction.subactionFactory, subact, subact.tag)
                 if subaction.subactionFactory.getSubaction(subact.tag):
                     set_up_actions.append(subaction.subactionFactory.buildFromXml(subact.tag,subact))
-        print('loading set up actions',set_up_actions)         
+        
         #Load the tearDown subactions
         tear_down_actions = []
         if action_xml.find('tearDown') is not None:
@@ -337,6 +375,7 @@ class ActionLoader():
         for key,val in action_vars.iteritems():
             setattr(dyn_action,key,val)
         
+        dyn_action.compile()
         return dyn_action
     
     @staticmethod
@@ -7,6 +7,7 @@ import engine.hitbox as hitbox
 import engine.collisionBox as collisionBox
 import subaction
 import numpy
+from global_functions import *
 
 """
 Articles are objects subordinate to a fighter that have their own behavior. For example, projectiles, shields,
@@ -187,11 +188,30 @@ class DynamicArticle():
             act.execute(self,self)
         self.ecb = None
         if self.sprite: #This makes deactivating a deactive article safe
+            self.sprite.release()
             self.sprite.kill()
         self.sprite = None
         if self in self.owner.articles:
             self.owner.articles.remove(self)
 
+    """
+    Snapshot the article and its hitboxes, for rollback and replay seeking.
+    A deactivated article has no sprite or ECB left to save.
+    """
+    def saveState(self):
+        return (getObjectState(self),
+                self.ecb.saveState() if self.ecb else None,
+                self.sprite.saveState() if self.sprite else None,
+                dict((name,hbox.saveState()) for name,hbox in self.hitboxes.items()))
+    
+    def loadState(self,_state):
+        attributes,ecb_state,sprite_state,hitbox_states = _state
+        setObjectState(self,attributes)
+        if self.ecb: self.ecb.loadState(ecb_state)
+        if self.sprite: self.sprite.loadState(sprite_state)
+        for name,hitbox_state in hitbox_states.items():
+            self.hitboxes[name].loadState(hitbox_state)
+
     def collisionUpdate(self):
         if 'platform_phase' in self.variables:
             self.platform_phase = self.variables['platform_phase']
@@ -206,7 +226,7 @@ class DynamicArticle():
             self.updatePosition()
             self.ecb.normalize()
             bumped = False
-            block_hit_list = collisionBox.getSizeCollisionsWith(self, self.game_state.platform_list)
+            block_hit_list = collisionBox.getSizeCollisionsWith(self, self.game_state.getPlatformIndex())
             if not block_hit_list:
                 break
             for block in block_hit_list:
@@ -229,10 +249,10 @@ class DynamicArticle():
 
         self.updatePosition()
         self.ecb.normalize()
-        block_hit_list = collisionBox.getMovementCollisionsWith(self, self.game_state.platform_list)
-        for block in block_hit_list:
-            if self.ecb.pathRectIntersects(block.rect, self.change_x, self.change_y) > 0 and self.ecb.pathRectIntersects(block.rect, self.change_x, self.change_y) < t and collisionBox.catchMovement(self, block, self.platform_phase > 0): 
-                t = self.ecb.pathRectIntersects(block.rect, self.change_x, self.change_y)
+        block_hit_list = collisionBox.getMovementCollisionsWith(self, self.game_state.getPlatformIndex())
+        for block, block_t in block_hit_list:
+            if block_t > 0 and block_t < t and collisionBox.catchMovement(self, block, self.platform_phase > 0): 
+                t = block_t
                 to_bounce_block = block
                 
         self.posy += self.change_y*t
@@ -293,51 +313,51 @@ class DynamicArticle():
 
     def checkGround(self):
         self.updatePosition()
-        return collisionBox.checkGround(self, self.game_state.platform_list, True)
+        return collisionBox.checkGround(self, self.game_state.getPlatformIndex(), True)
 
     def checkLeftWall(self):
         self.updatePosition()
-        return collisionBox.checkLeftWall(self, self.game_state.platform_list, True)
+        return collisionBox.checkLeftWall(self, self.game_state.getPlatformIndex(), True)
 
     def checkRightWall(self):
         self.updatePosition()
-        return collisionBox.checkRightWall(self, self.game_state.platform_list, True)
+        return collisionBox.checkRightWall(self, self.game_state.getPlatformIndex(), True)
 
     def checkBackWall(self):
         self.updatePosition()
-        return collisionBox.checkBackWall(self, self.game_state.platform_list, True)
+        return collisionBox.checkBackWall(self, self.game_state.getPlatformIndex(), True)
 
     def checkFrontWall(self):
         self.updatePosition()
-        return collisionBox.checkFrontWall(self, self.game_state.platform_list, True)
+        return collisionBox.checkFrontWall(self, self.game_state.getPlatformIndex(), True)
 
     def checkCeiling(self):
         self.updatePosition()
-        return collisionBox.checkCeiling(self, self.game_state.platform_list, True)
+        return collisionBox.checkCeiling(self, self.game_state.getPlatformIndex(), True)
 
     def isGrounded(self):
         self.updatePosition()
-        return collisionBox.isGrounded(self, self.game_state.platform_list, True)
+        return collisionBox.isGrounded(self, self.game_state.getPlatformIndex(), True)
 
     def isLeftWalled(self):
         self.updatePosition()
-        return collisionBox.isLeftWalled(self, self.game_state.platform_list, True)
+        return collisionBox.isLeftWalled(self, self.game_state.getPlatformIndex(), True)
 
     def isRightWalled(self):
         self.updatePosition()
-        return collisionBox.isRightWalled(self, self.game_state.platform_list, True)
+        return collisionBox.isRightWalled(self, self.game_state.getPlatformIndex(), True)
 
     def isBackWalled(self):
         self.updatePosition()
-        return collisionBox.isBackWalled(self, self.game_state.platform_list, True)
+        return collisionBox.isBackWalled(self, self.game_state.getPlatformIndex(), True)
 
     def isFrontWalled(self):
         self.updatePosition()
-        return collisionBox.isFrontWalled(self, self.game_state.platform_list, True)
+        return collisionBox.isFrontWalled(self, self.game_state.getPlatformIndex(), True)
 
     def isCeilinged(self):
         self.updatePosition()
-        return collisionBox.isCeilinged(self, self.game_state.platform_list, True)
+        return collisionBox.isCeilinged(self, self.game_state.getPlatformIndex(), True)
 
     def setSpeed(self,_speed,_direction):
         """ Set the article's speed. Instead of modifying the change_x and change_y values manually,
@@ -472,7 +492,7 @@ class DynamicArticle():
           
 class Article():
     def __init__(self, _spritePath, _owner, _origin, _length=1, _draw_depth = 1):
-        self.sprite = spriteManager.ImageSprite(_spritePath)
+        self.sprite = spriteManager.SheetSprite(_spritePath)
         self.posx, self.posy = _origin
         self.sprite.rect.center = self.posx, self.posy
         self.owner = _owner
@@ -500,14 +520,23 @@ class Article():
         self.owner.articles.append(self)
     
     def deactivate(self):
+        self.sprite.release()
         self.sprite.kill()
         if self in self.owner.articles:
             self.owner.articles.remove(self)
+            
+    #Snapshots for rollback and replay seeking
+    def saveState(self):
+        return (getObjectState(self),self.sprite.saveState())
+    
+    def loadState(self,_state):
+        setObjectState(self,_state[0])
+        self.sprite.loadState(_state[1])
 
          
 class AnimatedArticle():
     def __init__(self, _sprite, _owner, _origin, _imageWidth, _length=1, _draw_depth=1):
-        self.sprite = spriteManager.SheetSprite(pygame.image.load(_sprite), _imageWidth)
+        self.sprite = spriteManager.SheetSprite(_sprite, _imageWidth)
         self.posx, self.posy = _origin
         self.sprite.rect.center = _origin
         self.owner = _owner
@@ -542,9 +571,17 @@ class AnimatedArticle():
         self.owner.articles.append(self)
     
     def deactivate(self):
+        self.sprite.release()
         self.sprite.kill()
         if self in self.owner.articles:
             self.owner.articles.remove(self)
+            
+    def saveState(self):
+        return (getObjectState(self),self.sprite.saveState())
+    
+    def loadState(self,_state):
+        setObjectState(self,_state[0])
+        self.sprite.loadState(_state[1])
                 
 class ShieldArticle(Article):
     def __init__(self,_image,_owner):
@@ -607,6 +644,14 @@ class ShieldArticle(Article):
     def draw(self,_screen,_offset,_scale):
         print(self)
         return Article.draw(self, _screen, _offset, _scale)
+    
+    def saveState(self):
+        return (Article.saveState(self),self.reflect_hitbox.saveState(),self.main_hitbox.saveState())
+    
+    def loadState(self,_state):
+        Article.loadState(self,_state[0])
+        self.reflect_hitbox.loadState(_state[1])
+        self.main_hitbox.loadState(_state[2])
 
 class ParryArticle(Article):
     def __init__(self,_image,_owner):
@@ -663,6 +708,14 @@ class ParryArticle(Article):
    
     def draw(self,_screen,_offset,_scale):
         return Article.draw(self, _screen, _offset, _scale)
+    
+    def saveState(self):
+        return (Article.saveState(self),self.reflect_hitbox.saveState(),self.main_hitbox.saveState())
+    
+    def loadState(self,_state):
+        Article.loadState(self,_state[0])
+        self.reflect_hitbox.loadState(_state[1])
+        self.main_hitbox.loadState(_state[2])
 
 class LandingArticle(AnimatedArticle):
     def __init__(self,_owner):
@@ -2030,6 +2030,9 @@ class DownAirSpecial(AirAttack):
 class GetupAttack(BaseAttack):
     def __init__(self,_length=0):
         BaseAttack.__init__(self, _length)
+    
+    def setUp(self, _actor):
+        BaseAttack.setUp(self, _actor)
         anti_grab = statusEffect.TemporaryHitFilter(_actor,hurtbox.GrabImmunity(_actor), 10)
         anti_grab.activate()
 
@@ -2400,7 +2403,7 @@ def helplessControl(_actor):
 def grabLedges(_actor):
     # Check if we're colliding with any ledges.
     if not _actor.ledge_lock: #If we're not allowed to re-grab, don't bother calculating
-        ledge_hit_list = pygame.sprite.spritecollide(_actor.ecb.current_ecb, _actor.game_state.platform_ledges, False)
+        ledge_hit_list = _actor.game_state.getLedgeIndex().spritecollide(_actor.ecb.current_ecb)
         for ledge in ledge_hit_list:
             # Don't grab any ledges if the _actor is holding down
             if _actor.keysContain('down') is False:
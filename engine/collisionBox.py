@@ -3,14 +3,14 @@ import math
 import settingsManager
 import spriteManager
 import numpy
-import copy
+from global_functions import *
 
 def checkGround(_object, _objectList, _checkVelocity=True):
     _object.ecb.normalize()
     _object.ecb.current_ecb.rect.y += 4
     collide_sprite = spriteManager.RectSprite(_object.ecb.current_ecb.rect.union(_object.ecb.previous_ecb.rect))
     ground_block = pygame.sprite.Group()
-    block_hit_list = pygame.sprite.spritecollide(collide_sprite, _objectList, False)
+    block_hit_list = spritecollide(collide_sprite, _objectList)
     _object.ecb.current_ecb.rect.y -= 4
     for block in block_hit_list:
         if block.solid or (_object.platform_phase <= 0):
@@ -25,7 +25,7 @@ def checkLeftWall(_object, _objectList, _checkVelocity=True):
     _object.ecb.current_ecb.rect.x -= 4
     collide_sprite = spriteManager.RectSprite(_object.ecb.current_ecb.rect.union(_object.ecb.previous_ecb.rect))
     wall_block = pygame.sprite.Group()
-    block_hit_list = pygame.sprite.spritecollide(collide_sprite, _objectList, False)
+    block_hit_list = spritecollide(collide_sprite, _objectList)
     _object.ecb.current_ecb.rect.x += 4
     for block in block_hit_list:
         if block.solid:
@@ -38,7 +38,7 @@ def checkRightWall(_object, _objectList, _checkVelocity=True):
     _object.ecb.current_ecb.rect.x += 4
     collide_sprite = spriteManager.RectSprite(_object.ecb.current_ecb.rect.union(_object.ecb.previous_ecb.rect))
     wall_block = pygame.sprite.Group()
-    block_hit_list = pygame.sprite.spritecollide(collide_sprite, _objectList, False)
+    block_hit_list = spritecollide(collide_sprite, _objectList)
     _object.ecb.current_ecb.rect.x -= 4
     for block in block_hit_list:
         if block.solid:
@@ -63,7 +63,7 @@ def checkCeiling(_object, _objectList, _checkVelocity=True):
     _object.ecb.current_ecb.rect.y -= 4
     collide_sprite = spriteManager.RectSprite(_object.ecb.current_ecb.rect.union(_object.ecb.previous_ecb.rect))
     ceiling_block = pygame.sprite.Group()
-    block_hit_list = pygame.sprite.spritecollide(collide_sprite, _objectList, False)
+    block_hit_list = spritecollide(collide_sprite, _objectList)
     _object.ecb.current_ecb.rect.y += 4
     for block in block_hit_list:
         if block.solid:
@@ -76,7 +76,7 @@ def isGrounded(_object, _objectList, _checkVelocity=True):
     _object.ecb.normalize()
     _object.ecb.current_ecb.rect.y += 4
     collide_sprite = spriteManager.RectSprite(_object.ecb.current_ecb.rect.union(_object.ecb.previous_ecb.rect))
-    block_hit_list = pygame.sprite.spritecollide(collide_sprite, _objectList, False)
+    block_hit_list = spritecollide(collide_sprite, _objectList)
     _object.ecb.current_ecb.rect.y -= 4
     for block in block_hit_list:
         if block.solid or (_object.platform_phase <= 0):
@@ -88,7 +88,7 @@ def isLeftWalled(_object, _objectList, _checkVelocity=True):
     _object.ecb.normalize()
     _object.ecb.current_ecb.rect.x -= 4
     collide_sprite = spriteManager.RectSprite(_object.ecb.current_ecb.rect.union(_object.ecb.previous_ecb.rect))
-    block_hit_list = pygame.sprite.spritecollide(collide_sprite, _objectList, False)
+    block_hit_list = spritecollide(collide_sprite, _objectList)
     _object.ecb.current_ecb.rect.x += 4
     for block in block_hit_list:
         if block.solid:
@@ -100,7 +100,7 @@ def isRightWalled(_object, _objectList, _checkVelocity=True):
     _object.ecb.normalize()
     _object.ecb.current_ecb.rect.x += 4
     collide_sprite = spriteManager.RectSprite(_object.ecb.current_ecb.rect.union(_object.ecb.previous_ecb.rect))
-    block_hit_list = pygame.sprite.spritecollide(collide_sprite, _objectList, False)
+    block_hit_list = spritecollide(collide_sprite, _objectList)
     _object.ecb.current_ecb.rect.x -= 4
     for block in block_hit_list:
         if block.solid:
@@ -124,7 +124,7 @@ def isCeilinged(_object, _objectList, _checkVelocity=True):
     _object.ecb.normalize()
     _object.ecb.current_ecb.rect.y -= 4
     collide_sprite = spriteManager.RectSprite(_object.ecb.current_ecb.rect.union(_object.ecb.previous_ecb.rect))
-    block_hit_list = pygame.sprite.spritecollide(collide_sprite, _objectList, False)
+    block_hit_list = spritecollide(collide_sprite, _objectList)
     _object.ecb.current_ecb.rect.y += 4
     for block in block_hit_list:
         if block.solid:
@@ -134,17 +134,28 @@ def isCeilinged(_object, _objectList, _checkVelocity=True):
 
 ########################################################
 
+# Returns (block, t) for every block the object's movement this frame runs into, soonest first,
+# where t is how far along the movement it hits
 def getMovementCollisionsWith(_object,_spriteGroup):
     future_rect = _object.ecb.current_ecb.rect.copy()
     future_rect.x += _object.change_x
     future_rect.y += _object.change_y
     collide_sprite = spriteManager.RectSprite(_object.ecb.current_ecb.rect.union(future_rect))
-    check_dict = {k: _object.ecb.pathRectIntersects(k.rect, _object.change_x, _object.change_y) for k in pygame.sprite.spritecollide(collide_sprite, _spriteGroup, False)}
-    return sorted(filter(lambda k: check_dict[k] <= 1, check_dict), key=lambda q: check_dict[q])
+    blocks = spritecollide(collide_sprite, _spriteGroup)
+    if not blocks:
+        return []
+    path_intersects = _object.ecb.pathBoundsIntersects(getRectBounds(blocks), _object.change_x, _object.change_y)
+    return sorted([(block, t) for block, t in zip(blocks, path_intersects) if t <= 1], key=lambda q: q[1])
 
 def getSizeCollisionsWith(_object,_spriteGroup):
-    check_dict = filter(lambda r: _object.ecb.doesIntersect(r.rect), pygame.sprite.spritecollide(_object.ecb.current_ecb, _spriteGroup, False))
-    return sorted(check_dict, key = lambda q: numpy.linalg.norm(_object.ecb.primaryEjection(q.rect)[0]))
+    blocks = spritecollide(_object.ecb.current_ecb, _spriteGroup)
+    if not blocks:
+        return []
+    bounds = getRectBounds(blocks)
+    intersecting = numpy.flatnonzero(_object.ecb.boundsIntersect(bounds))
+    ejections = _object.ecb.primaryEjections(bounds[intersecting])
+    distances = numpy.sqrt(rowDots(ejections[:,0], ejections[:,0]))
+    return [blocks[intersecting[i]] for i in numpy.argsort(distances, kind='mergesort')]
 
 def catchMovement(_object, _other, _platformPhase=False):
     check_rect = _other.rect.copy()
@@ -218,42 +229,55 @@ def directionalDisplacement(_firstPoints, _secondPoints, _direction):
     return [projected_displacement/norm_sqr*_direction[0], projected_displacement/norm_sqr*_direction[1]]
 
 def directionalDisplacements(_firstRect, _secondRect):
+    displacements, directions = boundsDisplacements(_firstRect, getBounds(_secondRect))
+    return numpy.stack((displacements[0], directions), axis=1)
+
+# The same as directionalDisplacements, but against every rect in _bounds at once.
+# Returns an (n,8,2) array of how far to move along each direction to get out of each rect, and the (8,2) array of directions.
+def boundsDisplacements(_firstRect, _bounds):
     norm = numpy.linalg.norm([_firstRect.width, _firstRect.height])
     directions = numpy.array([[float(-1), float(0)], [float(1), float(0)], [float(0), float(-1)], [float(0), float(1)], [-_firstRect.height/norm, -_firstRect.width/norm], [_firstRect.height/norm, -_firstRect.width/norm], [-_firstRect.height/norm, _firstRect.width/norm], [_firstRect.height/norm, _firstRect.width/norm]])
     first_points = numpy.array([_firstRect.midtop, _firstRect.midbottom, _firstRect.midleft, _firstRect.midright])
-    second_points = numpy.array([_secondRect.topleft, _secondRect.topright, _secondRect.bottomleft, _secondRect.bottomright])
+    second_points = getBoundsCorners(_bounds)
     first_dots = numpy.inner(first_points, directions)
-    second_dots = numpy.inner(second_points, directions)
-    projected_displacements = numpy.amax(second_dots, 0) - numpy.amin(first_dots, 0)
-    return numpy.stack((directions*projected_displacements.reshape((8, 1)), directions.reshape((8, 2))), axis=1)
+    second_dots = numpy.matmul(second_points, directions.T)
+    projected_displacements = numpy.amax(second_dots, 1) - numpy.amin(first_dots, 0)
+    return directions*projected_displacements[:,:,numpy.newaxis], directions
+
+# numpy.dot of each pair of rows. matmul works these out the same way dot does, so they round the same.
+def rowDots(_first, _second):
+    return numpy.matmul(_first[...,numpy.newaxis,:], _second[...,:,numpy.newaxis])[...,0,0]
 
 # Returns a 2-entry array representing a range of time when the points and the rect intersect
 # If the range's min is greater than its max, it represents an empty interval
 #Prepare for article usage
 def projectionIntersects(_startPoints, _endPoints, _rectPoints, _vector):
-    start_dots = numpy.inner(_startPoints, _vector)
-    end_dots = numpy.inner(_endPoints, _vector)
     rect_dots = numpy.inner(_rectPoints, _vector)
+    t_range = projectionIntersectsAll(numpy.inner(_startPoints, _vector), numpy.inner(_endPoints, _vector), numpy.array([min(rect_dots)]), numpy.array([max(rect_dots)]))
+    return [t_range[0][0], t_range[1][0]]
+
+# The same as projectionIntersects, but for every rect at once. Takes the projections of the points onto the vector,
+# and arrays of the lowest and highest projection of each rect. Returns arrays of the start and end of each range.
+def projectionIntersectsAll(_startDots, _endDots, _rectMins, _rectMaxs):
+    start_dots = _startDots
+    end_dots = _endDots
+    inf = numpy.full(len(_rectMins), float("inf"))
 
     if min(start_dots) == min(end_dots):
-        if min(start_dots) <= max(rect_dots): #.O.|...
-            t_mins = [float("-inf"), float("inf")]
-        else:                               #...|.O.
-            t_mins = [float("inf"), float("-inf")]
+        behind = min(start_dots) <= _rectMaxs #.O.|...
+        t_mins = [numpy.where(behind, -inf, inf), numpy.where(behind, inf, -inf)]
     elif min(start_dots) > min(end_dots):
-        t_mins = [float(max(rect_dots)-min(start_dots))/(min(end_dots)-min(start_dots)), float("inf")]
+        t_mins = [(_rectMaxs-min(start_dots))/(min(end_dots)-min(start_dots)), inf]
     else:
-        t_mins = [float("-inf"), float(max(rect_dots)-min(start_dots))/(min(end_dots)-min(start_dots))]
+        t_mins = [-inf, (_rectMaxs-min(start_dots))/(min(end_dots)-min(start_dots))]
 
     if max(start_dots) == max(end_dots):
-        if max(start_dots) >= min(rect_dots): #...|.O.
-            t_maxs = [float("-inf"), float("inf")]
-        else:                               #.O.|...
-            t_maxs = [float("inf"), float("-inf")]
+        ahead = max(start_dots) >= _rectMins #...|.O.
+        t_maxs = [numpy.where(ahead, -inf, inf), numpy.where(ahead, inf, -inf)]
     elif max(start_dots) < max(end_dots):
-        t_maxs = [float(min(rect_dots)-max(start_dots))/(max(end_dots)-max(start_dots)), float("inf")]
+        t_maxs = [(_rectMins-max(start_dots))/(max(end_dots)-max(start_dots)), inf]
     else:
-        t_maxs = [float("-inf"), float(min(rect_dots)-max(start_dots))/(max(end_dots)-max(start_dots))]
+        t_maxs = [-inf, (_rectMins-max(start_dots))/(max(end_dots)-max(start_dots))]
 
     if max(end_dots)-max(start_dots) == min(end_dots)-min(start_dots):
         if max(start_dots) > min(start_dots):
@@ -265,7 +289,153 @@ def projectionIntersects(_startPoints, _endPoints, _rectPoints, _vector):
     else:
         t_open = [float(max(end_dots)-max(start_dots)-min(end_dots)+min(start_dots))/(max(start_dots)-min(start_dots)), float("inf")]
 
-    return [max(t_mins[0], t_maxs[0], t_open[0]), min(t_mins[1], t_maxs[1], t_open[1])]
+    return [numpy.maximum(numpy.maximum(t_mins[0], t_maxs[0]), t_open[0]), numpy.minimum(numpy.minimum(t_mins[1], t_maxs[1]), t_open[1])]
+
+########################################################
+#                    BROADPHASE                        #
+########################################################
+
+#pygame 1 counts a rect with no size as colliding with a rect around it, pygame 2 doesn't. We go with whichever we've got.
+ZERO_SIZE_COLLIDES = bool(pygame.Rect(1,1,0,0).colliderect(pygame.Rect(0,0,2,2)))
+#Below this many possible pairs, it's quicker to just check all of them than to sort and sweep
+SWEEP_MIN_PAIRS = 4096
+
+# Returns an (n,4) array of the left, top, right and bottom of each sprite's rect
+def getRectBounds(_sprites):
+    return numpy.array([(s.rect.left, s.rect.top, s.rect.right, s.rect.bottom) for s in _sprites], dtype=float).reshape((-1,4))
+
+# The bounds of a single rect, as a (1,4) array
+def getBounds(_rect):
+    return numpy.array([(_rect.left, _rect.top, _rect.right, _rect.bottom)], dtype=float)
+
+# Returns an (n,4,2) array of the topleft, topright, bottomleft and bottomright of each rect in _bounds
+def getBoundsCorners(_bounds):
+    return _bounds[:,[[0,1],[2,1],[0,3],[2,3]]]
+
+# Whether each pair of rows in _first and _second collide, the same way colliderect would say
+def boundsCollide(_first, _second):
+    collides = (_first[:,0] < _second[:,2]) & (_second[:,0] < _first[:,2]) & (_first[:,1] < _second[:,3]) & (_second[:,1] < _first[:,3])
+    if not ZERO_SIZE_COLLIDES:
+        collides &= (_first[:,2] > _first[:,0]) & (_first[:,3] > _first[:,1]) & (_second[:,2] > _second[:,0]) & (_second[:,3] > _second[:,1])
+    return collides
+
+# Gives each sprite's owner a number, so boxes can be compared by owner in numpy.
+# Pass the same dict for every list that gets compared, so the same owner gets the same number.
+def getOwnerKeys(_sprites, _ownerKeys):
+    return numpy.array([_ownerKeys.setdefault(s.owner, len(_ownerKeys)) for s in _sprites], dtype=int)
+
+# Sweep along x: finds every (i,j) where the left edge of _second[j] is inside the left and right of _first[i].
+# 'left' includes the left edge, 'right' doesn't, so the two sweeps in getOverlappingPairs don't both find a pair.
+def sweepBounds(_first, _second, _side):
+    order = numpy.argsort(_second[:,0], kind='mergesort')
+    lefts = _second[order,0]
+    starts = numpy.searchsorted(lefts, _first[:,0], _side)
+    ends = numpy.searchsorted(lefts, _first[:,2], 'left')
+    counts = numpy.maximum(ends-starts, 0)
+    first_indexes = numpy.repeat(numpy.arange(len(_first)), counts)
+    offsets = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts)-counts, counts)
+    return first_indexes, order[numpy.repeat(starts, counts)+offsets]
+
+"""
+Sweep and prune broadphase for rects. Any two rects that overlap on x have one of their left edges inside the other,
+so sorting by left edges and sweeping both ways finds every pair that could collide, without trying all of them.
+Those are then checked the same way pygame's colliderect does, and pairs with the same owner are thrown out.
+When there are only a few rects, every pair is checked at once instead, which is faster than sorting.
+
+Parameters
+-----------
+_first, _second : numpy array
+    Bounds from getRectBounds
+_firstOwners, _secondOwners : numpy array
+    Owner keys from getOwnerKeys
+    
+Return
+-----------
+Two arrays of indexes into _first and _second, of every pair that collides, sorted by the first index then the second.
+That's the same order pygame.sprite.groupcollide would give them in.
+"""
+def getOverlappingPairs(_first, _second, _firstOwners, _secondOwners):
+    swept = len(_first)*len(_second) >= SWEEP_MIN_PAIRS
+    if swept:
+        first_a, second_a = sweepBounds(_first, _second, 'left')
+        second_b, first_b = sweepBounds(_second, _first, 'right')
+        first_indexes = numpy.concatenate((first_a, first_b))
+        second_indexes = numpy.concatenate((second_a, second_b))
+    else:
+        first_indexes, second_indexes = numpy.indices((len(_first),len(_second))).reshape((2,-1))
+    
+    collides = boundsCollide(_first[first_indexes], _second[second_indexes]) & (_firstOwners[first_indexes] != _secondOwners[second_indexes])
+    first_indexes = first_indexes[collides]
+    second_indexes = second_indexes[collides]
+    if not swept:
+        return first_indexes, second_indexes#already in order
+    order = numpy.lexsort((second_indexes, first_indexes))
+    return first_indexes[order], second_indexes[order]
+
+########################################################
+#                    SPATIAL INDEX                     #
+########################################################
+
+#How big each square of the spatial index's grid is, in pixels
+SPATIAL_CELL_SIZE = 128
+#With fewer sprites than this, pygame can check all of them quicker than we can look them up
+SPATIAL_MIN_SPRITES = 64
+
+# Returns the range of grid cells from _start to _end covers, along one axis
+def getCellRange(_start, _end, _cellSize):
+    return range(int(_start // _cellSize), int(_end // _cellSize) + 1)
+
+"""
+A grid over the stage, for finding which of a list of sprites a rect is touching without checking every one.
+Sprites that don't move are put into every cell they cover when the index is built. The ones that do move
+are kept to the side and checked every time. Collisions come back in the same order as the list, so it gives
+the same answer pygame.sprite.spritecollide would.
+"""
+class SpatialIndex():
+    def __init__(self,_sprites,_moving=[],_cellSize=SPATIAL_CELL_SIZE,_version=0):
+        self.sprites = _sprites
+        self.members = list(_sprites)
+        self.count = len(_sprites)
+        self.version = _version
+        self.cell_size = _cellSize
+        self.cells = {}
+        self.moving = []
+        moving_ids = set(map(id, _moving))
+        for i,sprite in enumerate(_sprites):
+            if id(sprite) in moving_ids:
+                self.moving.append((i,sprite))
+                continue
+            for x in getCellRange(sprite.rect.left, sprite.rect.right, self.cell_size):
+                for y in getCellRange(sprite.rect.top, sprite.rect.bottom, self.cell_size):
+                    self.cells.setdefault((x,y), []).append((i,sprite))
+    
+    """
+    Whether the index was built from this list, and it still holds the same sprites, in the same order.
+    The index can't see a sprite it put in the grid move, so whoever moves one passes a new _version.
+    """
+    def isCurrent(self,_sprites,_version=0):
+        return _sprites is self.sprites and _version == self.version and _sprites == self.members
+    
+    def spritecollide(self,_sprite):
+        if self.count < SPATIAL_MIN_SPRITES:
+            return pygame.sprite.spritecollide(_sprite, self.sprites, False)
+        rect = _sprite.rect
+        x_cells = getCellRange(rect.left, rect.right, self.cell_size)
+        y_cells = getCellRange(rect.top, rect.bottom, self.cell_size)
+        if len(x_cells) * len(y_cells) > self.count:
+            #A rect this big would look in more cells than there are sprites
+            return pygame.sprite.spritecollide(_sprite, self.sprites, False)
+        found = dict(self.moving)
+        for x in x_cells:
+            for y in y_cells:
+                found.update(self.cells.get((x,y), ()))
+        return [found[i] for i in sorted(found) if rect.colliderect(found[i].rect)]
+
+# Everything in _objectList that _sprite collides with. _objectList can be a list or group of sprites, or a SpatialIndex.
+def spritecollide(_sprite, _objectList):
+    if isinstance(_objectList, SpatialIndex):
+        return _objectList.spritecollide(_sprite)
+    return pygame.sprite.spritecollide(_sprite, _objectList, False)
 
 ########################################################
 #                       ECB                            #
@@ -310,6 +480,17 @@ class ECB():
         self.previous_ecb = spriteManager.RectSprite(self.current_ecb.rect,pygame.Color('#EA6F1C'))
         self.tracking_rect.center = self.actor.posx, self.actor.posy
     
+    """
+    Snapshot the ECB, for rollback and replay seeking.
+    The previous ECB is replaced every frame rather than changed, so only the current one needs saving.
+    """
+    def saveState(self):
+        return (getObjectState(self),self.current_ecb.saveState())
+    
+    def loadState(self,_state):
+        setObjectState(self,_state[0])
+        self.current_ecb.loadState(_state[1])
+    
     """
     Set the ECB's height and width to the sprite's, and centers it
     """
@@ -336,16 +517,13 @@ class ECB():
         self.current_ecb.rect.y += offsets[1]
         
     def draw(self,_screen,_offset,_scale):
-        self.current_ecb.draw(_screen,self.actor.game_state.stageToScreen(self.current_ecb.rect),_scale)
-        self.previous_ecb.draw(_screen,self.actor.game_state.stageToScreen(self.previous_ecb.rect),_scale)
+        current_rect = self.current_ecb.draw(_screen,self.actor.game_state.stageToScreen(self.current_ecb.rect),_scale)
+        previous_rect = self.previous_ecb.draw(_screen,self.actor.game_state.stageToScreen(self.previous_ecb.rect),_scale)
+        if current_rect and previous_rect: return current_rect.union(previous_rect)
+        return current_rect or previous_rect
 
     def doesIntersect(self, _other, _dx=0, _dy=0):
-        test_rect = self.current_ecb.rect.copy()
-        test_rect.x += _dx
-        test_rect.y += _dy
-
-        displacements = directionalDisplacements(test_rect, _other)
-        return all(map(lambda k: numpy.dot(k[0], k[1]) >= 0, displacements))
+        return bool(self.boundsIntersect(getBounds(_other), _dx, _dy)[0])
 
     def intersectPoint(self, _other, _dx=0, _dy=0):
         test_rect = self.current_ecb.rect.copy()
@@ -356,24 +534,53 @@ class ECB():
         return min(distances, key=lambda x: x[0][0]*x[1][0]+x[0][1]*x[1][1])
 
     def ejectionDirections(self, _other, _dx=0, _dy=0):
+        distances, directions = self.boundsDisplacements(getBounds(_other), _dx, _dy)
+        good = self.goodEjections(distances, directions)[0]
+        return [numpy.stack((distances[0][i], directions[i])) for i in numpy.flatnonzero(good)]
+
+    def primaryEjection(self, _other, _dx=0, _dy=0):
+        return self.primaryEjections(getBounds(_other), _dx, _dy)[0]
+
+    """
+    The collision kernel. These do the same as the methods above, but against every rect in an (n,4) array of bounds
+    from getRectBounds at once, so checking against all of the platforms doesn't need a numpy call for each of them.
+    """
+    def boundsDisplacements(self, _bounds, _dx=0, _dy=0):
         test_rect = self.current_ecb.rect.copy()
         test_rect.x += _dx
         test_rect.y += _dy
+        return boundsDisplacements(test_rect, _bounds)
 
-        distances = directionalDisplacements(test_rect, _other)
+    def boundsIntersect(self, _bounds, _dx=0, _dy=0):
+        distances, directions = self.boundsDisplacements(_bounds, _dx, _dy)
+        return numpy.all(rowDots(distances, directions) >= 0, 1)
 
-        working_list = filter(lambda e: numpy.dot(e[0], e[1]) >= 0, distances)
-        reference_list = copy.deepcopy(working_list)
-        for element in reference_list:
-            working_list = filter(lambda k: abs(numpy.dot(k[0], element[1]) - numpy.dot(element[0], element[1])) > 0.01 or numpy.allclose(k[0], element[0]), working_list)
-        return working_list
+    """
+    Which of the directions the ECB could be ejected in are worth considering, for each rect.
+    Any that would push out as far as another good one does along that one's direction are thrown out,
+    unless it's the same ejection. The (n,8,8) along has every ejection's push along every direction.
+    """
+    def goodEjections(self, _distances, _directions):
+        dots = rowDots(_distances, _directions)
+        good = dots >= 0
+        along = rowDots(_distances[:,:,numpy.newaxis], _directions[numpy.newaxis,numpy.newaxis])
+        others = _distances[:,numpy.newaxis]
+        close = numpy.all(numpy.abs(_distances[:,:,numpy.newaxis]-others) <= 1e-08+1e-05*numpy.abs(others), 3)
+        different = (numpy.abs(along-dots[:,numpy.newaxis]) > 0.01) | close
+        return good & numpy.all(different | ~good[:,numpy.newaxis], 2)
 
-    def primaryEjection(self, _other, _dx=0, _dy=0):
-        good_directions = self.ejectionDirections(_other, _dx, _dy)
-        distances = directionalDisplacements(self.previous_ecb.rect, _other)
-        previous_dir = min(distances, key=lambda x: x[0][0]*x[1][0]+x[0][1]*x[1][1])
-        return min(good_directions, key=lambda y: -numpy.dot(previous_dir[1], y[0])+numpy.linalg.norm(y[0]))
-        #return min(good_directions, key=lambda y: numpy.linalg.norm(y[0]))
+    """
+    Returns an (n,2,2) array of the displacement and direction of the primary ejection out of each rect.
+    """
+    def primaryEjections(self, _bounds, _dx=0, _dy=0):
+        distances, directions = self.boundsDisplacements(_bounds, _dx, _dy)
+        good = self.goodEjections(distances, directions)
+        previous_distances, previous_directions = boundsDisplacements(self.previous_ecb.rect, _bounds)
+        previous_dots = previous_distances[:,:,0]*previous_directions[:,0]+previous_distances[:,:,1]*previous_directions[:,1]
+        previous_dir = previous_directions[numpy.argmin(previous_dots, 1)][:,numpy.newaxis]
+        scores = -rowDots(numpy.broadcast_to(previous_dir, distances.shape), distances)+numpy.sqrt(rowDots(distances, distances))
+        best = numpy.argmin(numpy.where(good, scores, float("inf")), 1)
+        return numpy.stack((distances[numpy.arange(len(best)),best], directions[best]), axis=1)
 
     def checkPlatform(self, _platform, _yvel):
         distances = directionalDisplacements(self.previous_ecb.rect, _platform)
@@ -391,22 +598,25 @@ class ECB():
         return False
 
     def pathRectIntersects(self, _platform, _dx, _dy):
-        if self.current_ecb.rect.colliderect(_platform):
-            return 0
-        start_corners = [self.current_ecb.rect.midtop, self.current_ecb.rect.midbottom, self.current_ecb.rect.midleft, self.current_ecb.rect.midright]
-        end_corners = [[self.current_ecb.rect.centerx+_dx, self.current_ecb.rect.top+_dy], 
-                       [self.current_ecb.rect.centerx+_dx, self.current_ecb.rect.bottom+_dy],
-                       [self.current_ecb.rect.left+_dx, self.current_ecb.rect.centery+_dy], 
-                       [self.current_ecb.rect.right+_dx, self.current_ecb.rect.centery+_dy]]
-        rect_corners = [_platform.topleft, _platform.topright, _platform.bottomleft, _platform.bottomright]
-    
-        horizontal_intersects = projectionIntersects(start_corners, end_corners, rect_corners, [1, 0])
-        vertical_intersects = projectionIntersects(start_corners, end_corners, rect_corners, [0, 1])
-        downward_diagonal_intersects = projectionIntersects(start_corners, end_corners, rect_corners, [self.current_ecb.rect.height, self.current_ecb.rect.width])
-        upward_diagonal_intersects = projectionIntersects(start_corners, end_corners, rect_corners, [-self.current_ecb.rect.height, self.current_ecb.rect.width])
-
-        total_intersects = [max(horizontal_intersects[0], vertical_intersects[0], downward_diagonal_intersects[0], upward_diagonal_intersects[0], 0), min(horizontal_intersects[1], vertical_intersects[1], downward_diagonal_intersects[1], upward_diagonal_intersects[1], 1)]
-        if total_intersects[0] > total_intersects[1]:
-            return 999
-        else:
-            return total_intersects[0]
+        return float(self.pathBoundsIntersects(getBounds(_platform), _dx, _dy)[0])
+
+    """
+    How far along the ECB's movement it first touches each rect, from 0 to 1, or 999 if it doesn't.
+    """
+    def pathBoundsIntersects(self, _bounds, _dx, _dy):
+        rect = self.current_ecb.rect
+        start_corners = [rect.midtop, rect.midbottom, rect.midleft, rect.midright]
+        end_corners = [[rect.centerx+_dx, rect.top+_dy], 
+                       [rect.centerx+_dx, rect.bottom+_dy],
+                       [rect.left+_dx, rect.centery+_dy], 
+                       [rect.right+_dx, rect.centery+_dy]]
+        rect_corners = getBoundsCorners(_bounds)
+
+        total_intersects = [numpy.zeros(len(_bounds)), numpy.ones(len(_bounds))]
+        #horizontal, vertical, downward diagonal, upward diagonal
+        for vector in ([1, 0], [0, 1], [rect.height, rect.width], [-rect.height, rect.width]):
+            rect_dots = numpy.inner(rect_corners, vector)
+            intersects = projectionIntersectsAll(numpy.inner(start_corners, vector), numpy.inner(end_corners, vector), numpy.amin(rect_dots, 1), numpy.amax(rect_dots, 1))
+            total_intersects = [numpy.maximum(total_intersects[0], intersects[0]), numpy.minimum(total_intersects[1], intersects[1])]
+        path_intersects = numpy.where(total_intersects[0] > total_intersects[1], 999, total_intersects[0])
+        return numpy.where(boundsCollide(getBounds(rect), _bounds), 0, path_intersects)
@@ -1,5 +1,14 @@
 import settingsManager
 import pygame
+import math
+from global_functions import *
+
+#How far a stick has to be pushed, in any direction, before it counts
+STICK_DEADZONE = 0.275
+#How far any other axis, like a trigger, has to be pushed
+AXIS_DEADZONE = 0.275
+#How many steps between 0 and 1 an analog value can be
+ANALOG_STEPS = 64
 
 class BaseController():
     def __init__(self,_bindings):
@@ -12,15 +21,39 @@ class BaseController():
         
         self.buffer = [[]]
         self.last_index = 0
+        #Online, how far the network last said each key was pressed, and the changes to pass on. See setInputValues.
+        self.input_values = dict()
+        self.values_to_pass = []
       
       
     def linkObject(self,_object):
         self.target = _object
     
+    #Only a gamepad has anything to sample. See GamepadController. Returns whether anything changed.
+    def sampleAxes(self):
+        return False
+    
+    def releaseAxes(self):
+        pass
+    
+    """
+    Online, the controllers don't read their devices, the network tells them how far each key is pressed,
+    as (key,value) pairs, whenever that changes. See network.getInputEvents. Anything that changed is
+    passed to the target with everything else on the next passInputs, the way a key going down would be.
+    """
+    def setInputValues(self,_values):
+        for key,value in _values:
+            if value != self.input_values.get(key, 0):
+                self.values_to_pass.append((key,value))
+                self.input_values[key] = value
+                if value > 0 and key not in self.keys_held: self.keys_held.append(key)
+                if value == 0 and key in self.keys_held: self.keys_held.remove(key)
+    
     def flushInputs(self):
         self.keys_to_pass = []
         self.keys_to_release = []
         self.keys_held = []
+        self.values_to_pass = []
         
         self.buffer = [[]]
         self.last_index = 0
@@ -50,8 +83,14 @@ class BaseController():
                 self.target.keyPressed(key)
             for key in self.keys_to_release:
                 self.target.keyReleased(key)
+            for key,value in self.values_to_pass:
+                if value > 0:
+                    self.target.keyPressed(key,value)
+                else:
+                    self.target.keyReleased(key)
         self.keys_to_pass = []
         self.keys_to_release = []
+        self.values_to_pass = []
         
     def getKeysForAction(self,_action):
         list_of_bindings = []
@@ -83,10 +122,39 @@ class Controller(BaseController):
         if output: return k
         return None
     
+"""
+In menus, a gamepad works off its events like a keyboard does, with the sticks as digital directions.
+In a battle, the sticks are sampled instead. Moving a stick can put hundreds of motion events a second on the
+queue, so the battle blocks them, and once a frame, sampleAxes reads where every bound axis is and hands the
+target how far each direction is pushed, from 0 to 1, whenever that changes. The buttons still come through events.
+"""
 class GamepadController(BaseController):
     def __init__(self,_padBindings):
         BaseController.__init__(self, _padBindings)
         self.type = 'Gamepad'
+        #How far each key bound to an axis was pushed, the last time it changed
+        self.analog_values = dict()
+    
+    def sampleAxes(self):
+        if not self.target: return False
+        changed = False
+        for key,value in self.key_bindings.getAxisValues().items():
+            if value != self.analog_values.get(key, 0):
+                if value > 0:
+                    self.target.keyPressed(key,value)
+                else:
+                    self.target.keyReleased(key)
+                self.analog_values[key] = value
+                changed = True
+        return changed
+    
+    #Lets go of everything the sticks were holding, so nothing stays held once the battle's over
+    def releaseAxes(self):
+        if self.target:
+            for key,value in self.analog_values.items():
+                if value > 0:
+                    self.target.keyReleased(key)
+        self.analog_values = dict()
     
     def getInputs(self,_event,_push = True, _outputOnRelease = True):
         if _event.type not in [pygame.JOYAXISMOTION, pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP]:
@@ -131,14 +199,91 @@ class GamepadController(BaseController):
     def getKeysForAction(self,_action):
         return self.key_bindings.getKeysForAction(_action)
     
+"""
+The replay controller plays back inputs that were recorded from a battle, instead of reading
+them from a device. It's given a dict of frame number to the list of (key,value) pairs that went into
+the fighter's input buffer that frame, and hands them to the fighter one frame at a time.
+It takes on the type of the controller that was recorded, so the fighter reads it the same way.
+"""
+class ReplayController(BaseController):
+    def __init__(self,_inputs,_timing_window = dict(),_type = 'Keyboard'):
+        BaseController.__init__(self, dict())
+        self.type = _type
+        self.timing_window = _timing_window
+        self.inputs = _inputs
+        self.frame = 0
+    
+    def getInputs(self,_event,_push = True, _outputOnRelease = True):
+        return None
+    
+    def passInputs(self):
+        if self.target:
+            for key,value in self.inputs.get(self.frame, []):
+                if value:
+                    self.target.keyPressed(key,value)
+                else:
+                    #A key that was pressed and let go on the same frame only shows up as a release,
+                    #so press it first or the fighter won't take the release
+                    if key not in self.target.keys_held:
+                        self.target.keyPressed(key)
+                    self.target.keyReleased(key)
+        self.frame += 1
+    
 class PadBindings():
-    def __init__(self,_joyName,_joystick,_axisBindings,_buttonBindings):
+    def __init__(self,_joyName,_joystick,_axisBindings,_buttonBindings,_stickDeadzone=STICK_DEADZONE,_axisDeadzone=AXIS_DEADZONE):
         self.name = _joyName
         self.joystick = _joystick
         #Each axis is bound to a tuple of what a negative value is, and what a positive value is.
         #So, in this hard-coded example, axis 0 is left when negative, right when positive.
-        self.axis_bindings = _axisBindings
+        self.axis_bindings = dict([(axis,tuple([key.strip() for key in keys])) for axis,keys in _axisBindings.items()])
         self.button_bindings = _buttonBindings
+        self.stick_deadzone = _stickDeadzone
+        self.axis_deadzone = _axisDeadzone
+        #A stick is the axis bound to left and right, and the one bound to up and down, read together
+        self.stick_axes = ([axis for axis,keys in self.axis_bindings.items() if keys == ('left','right')][:1] +
+                           [axis for axis,keys in self.axis_bindings.items() if keys == ('up','down')][:1])
+        if len(self.stick_axes) < 2:
+            self.stick_axes = []
+        self.pad = None
+    
+    def getPad(self):
+        if self.pad is None and self.joystick is not None:
+            self.pad = pygame.joystick.Joystick(self.joystick)
+            if not self.pad.get_init():
+                self.pad.init()
+        return self.pad
+    
+    """
+    How far each key bound to an axis is pushed right now, from 0 to 1. The stick's two axes get a radial deadzone,
+    so a diagonal isn't cut off on one axis before the other, and anything else, like a trigger, gets one of its own.
+    Past the deadzone, values are scaled back up to go from 0 to 1, and rounded to ANALOG_STEPS steps,
+    so a stick held still doesn't jitter between values.
+    """
+    def getAxisValues(self):
+        pad = self.getPad()
+        values = dict()
+        if pad is None:
+            return values
+        for axis,(negative,positive) in self.axis_bindings.items():
+            if axis in self.stick_axes or axis >= pad.get_numaxes():
+                continue
+            value = pad.get_axis(axis)
+            magnitude = getDeadzoneMagnitude(abs(value),self.axis_deadzone)
+            self.setAxisValue(values,negative,positive,math.copysign(magnitude,value))
+        if self.stick_axes and max(self.stick_axes) < pad.get_numaxes():
+            x = pad.get_axis(self.stick_axes[0])
+            y = pad.get_axis(self.stick_axes[1])
+            magnitude = math.sqrt(x*x + y*y)
+            scale = getDeadzoneMagnitude(magnitude,self.stick_deadzone) / magnitude if magnitude > 0 else 0
+            self.setAxisValue(values,'left','right',x*scale)
+            self.setAxisValue(values,'up','down',y*scale)
+        return values
+    
+    def setAxisValue(self,_values,_negative,_positive,_value):
+        _value = round(_value * ANALOG_STEPS) / ANALOG_STEPS
+        for key,value in ((_negative,-_value),(_positive,_value)):
+            if key and key != 'none':
+                _values[key] = max(_values.get(key,0),value,0)
         
     def getJoystickInput(self,_joy,_axis,_value):
         if not _joy == self.joystick:
@@ -146,9 +291,9 @@ class PadBindings():
         axis_tuple = self.axis_bindings.get(_axis) 
         if axis_tuple:
             #if the value is above deadzone
-            if _value > 0.2750:
+            if _value > self.axis_deadzone:
                 return axis_tuple[1]
-            elif _value < -0.2750:
+            elif _value < -self.axis_deadzone:
                 return axis_tuple[0]
             else:
                 return 0
@@ -171,37 +316,155 @@ class PadBindings():
         return list_of_bindings
     
     
+#Takes the deadzone off a magnitude from 0 to 1, and stretches what's left back out to go from 0 to 1
+def getDeadzoneMagnitude(_magnitude,_deadzone):
+    if _magnitude <= _deadzone:
+        return 0.0
+    return min(1.0,(_magnitude - _deadzone) / (1.0 - _deadzone))
+
 """
 The input buffer is a list of all of the buttons pressed and released,
 and the frames they're put in on. It's used to check for buttons that
 were pressed in the past, such as for a wall tech, or a buffered jump,
-but can also be used to re-create the entire battle (once a replay manager
-is set up)
+and to record the inputs for replays.
+
+Only the last INPUT_BUFFER_FRAMES frames are kept, in a ring, so the buffer stays the same size however long
+the match goes on. As well as the frames themselves, each key has a bitmask of the frames it was pressed in and
+one of the frames it was released in, so checking a key over a window of frames is a few shifts instead of a
+look through every frame. A key's bitmasks start from the last frame it was pressed or released in, so only the
+keys in a frame need touching when it's pushed.
+
+Keys and buttons are always 1.0 or 0, so whether they count as pressed doesn't depend on the threshold being
+checked against. A stick that's partway can be either, so windows with one of those in them are checked frame by frame.
 """
+#How many frames of inputs are kept. Nothing can look further back than this.
+INPUT_BUFFER_FRAMES = 256
+#A frame with no inputs in it. Pushed frames are never changed, so they can all share this one.
+EMPTY_FRAME = {}
+
 class InputBuffer():
-    def __init__(self):
-        self.buffer = [[]]
+    def __init__(self,_capacity=INPUT_BUFFER_FRAMES):
+        self.capacity = _capacity
+        self.capacity_mask = (1 << _capacity) - 1
+        #Frame number n is in buffer[n % capacity]
+        self.buffer = [EMPTY_FRAME] * _capacity
         self.working_buff = []
         self.last_index = 0
+        #Bit 0 is the frame in last_pressed or last_released, and each bit after it is a frame further back
+        self.pressed_bits = dict()
+        self.released_bits = dict()
+        self.last_pressed = dict()
+        self.last_released = dict()
+        #The last frame each key had a value between 0 and 1 in
+        self.last_analog = dict()
+        #See getSmoothedDirection
+        self.smoothed_directions = dict()
       
     """
     Pushes the buttons for the frame into the buffer, then extends the index by one.
     """
     def push(self):
-        self.buffer.append(dict(self.working_buff))
-        self.working_buff = []
         self.last_index += 1
-        
+        frame = dict(self.working_buff) if self.working_buff else EMPTY_FRAME
+        self.buffer[self.last_index % self.capacity] = frame
+        self.working_buff = []
+        for key,value in frame.items():
+            if value >= 1:
+                self.markFrame(self.pressed_bits,self.last_pressed,key)
+            elif value <= 0:
+                self.markFrame(self.released_bits,self.last_released,key)
+            else:
+                self.last_analog[key] = self.last_index
+    
+    def markFrame(self,_bits,_lastFrames,_key):
+        last_frame = _lastFrames.get(_key)
+        if last_frame is None:
+            _bits[_key] = 1
+        else:
+            _bits[_key] = ((_bits[_key] << (self.last_index - last_frame)) | 1) & self.capacity_mask
+        _lastFrames[_key] = self.last_index
+    
     """
-    Get a sub-buffer of N frames
+    Works out which frames a window covers, as how many frames back the newest one is, and how many frames long it is.
+    The last frame pushed is 0 frames back. _to counts twice: the window is _from - _to frames long, and starts
+    2*_to frames back. That's how the buffer has always counted it, and checkTap is timed to it.
     """
-    def getLastNFrames(self,_from,_to=0):
-        ret_buffer = []
+    def getWindow(self,_from,_to):
         if _from > self.last_index: _from = self.last_index
         if _to > self.last_index: _to = self.last_index
-        for i in range(self.last_index - _to,self.last_index - _from,-1):
-            ret_buffer.append(self.buffer[i - _to])
-        return ret_buffer
+        newest = 2 * _to
+        return newest, min(_from - _to, self.capacity - newest)
+    
+    """
+    Get a sub-buffer of N frames, newest first
+    """
+    def getLastNFrames(self,_from,_to=0):
+        newest,length = self.getWindow(_from,_to)
+        return [self.buffer[(self.last_index - newest - age) % self.capacity] for age in range(length)]
+    
+    """
+    The frames in a window that a key was at least _state in, and the frames it was less than _state in,
+    as two bitmasks. Bit 0 is the newest frame in the window. See getNewestFrame and getOldestFrame.
+    """
+    def getKeyFrames(self,_key,_from,_to=0,_state=0.1):
+        newest,length = self.getWindow(_from,_to)
+        if length <= 0:
+            return 0,0
+        window = (1 << length) - 1
+        if 0 < _state <= 1 and self.last_analog.get(_key,0) <= self.last_index - newest - length:
+            return (self.getBits(self.pressed_bits,self.last_pressed,_key,newest) & window,
+                    self.getBits(self.released_bits,self.last_released,_key,newest) & window)
+        pressed = 0
+        released = 0
+        for age in range(length):
+            value = self.buffer[(self.last_index - newest - age) % self.capacity].get(_key)
+            if value is not None:
+                if value >= _state: pressed |= 1 << age
+                else: released |= 1 << age
+        return pressed,released
+    
+    #A key's bitmask, moved so that bit 0 is the frame _age frames back
+    def getBits(self,_bits,_lastFrames,_key,_age):
+        last_frame = _lastFrames.get(_key)
+        if last_frame is None:
+            return 0
+        shift = self.last_index - last_frame - _age
+        if shift >= 0:
+            return _bits[_key] << shift
+        return _bits[_key] >> -shift
+    
+    """
+    The direction keys over the last _distance frames, smoothed into a stick position, before it's cut down to
+    _maxMagnitude. See AbstractFighter.getSmoothedInput.
+    
+    Smoothing starts from the middle on the oldest frame in the window, and each frame after it moves the stick
+    back toward the middle a little, then adds that frame's direction. So the result only depends on the window,
+    and moving the window on by a frame doesn't change where it stood on the frames still in it, as long as the
+    frame that dropped out had no direction in it. Most frames don't, so the last result is kept for each window
+    size, and carried forward a frame at a time. It's only worked out from the start of the window again when a
+    direction drops out, and it isn't worked out again at all if it's asked for twice in a frame.
+    """
+    def getSmoothedDirection(self,_distance,_maxMagnitude=1.0):
+        newest,length = self.getWindow(_distance,0)
+        first_frame = self.last_index - length + 1
+        key = (_distance,_maxMagnitude)
+        smoothed = self.smoothed_directions.get(key)
+        if smoothed is not None:
+            frame,smoothed_x,smoothed_y,start_frame = smoothed
+            if frame == self.last_index and start_frame == first_frame:
+                return smoothed_x,smoothed_y
+            if (frame > self.last_index or start_frame > first_frame or self.last_index - start_frame >= self.capacity
+                or first_frame - start_frame > length
+                or [index for index in range(start_frame,first_frame) if getDirection(self.buffer[index % self.capacity]) != (0.0,0.0)]):
+                smoothed = None
+        if smoothed is None:
+            frame,smoothed_x,smoothed_y = first_frame - 1,0.0,0.0
+        for index in range(frame + 1,self.last_index + 1):
+            working_x,working_y = getDirection(self.buffer[index % self.capacity])
+            if working_x or working_y or smoothed_x or smoothed_y:
+                smoothed_x,smoothed_y = smoothDirection(smoothed_x,smoothed_y,working_x,working_y,_distance,_maxMagnitude)
+        self.smoothed_directions[key] = (self.last_index,smoothed_x,smoothed_y,first_frame)
+        return smoothed_x,smoothed_y
     
     """
     put a key into the current working buffer. The working buffer is all of the inputs for
@@ -209,4 +472,68 @@ class InputBuffer():
     """
     def append(self,_key):
         self.working_buff.append(_key)
+    
+    """
+    Snapshot the buffer, for rollback and replay seeking.
+    """
+    def saveState(self):
+        return getObjectState(self)
+    
+    def loadState(self,_state):
+        setObjectState(self,_state)
+
+#Where the direction keys put the stick on one frame of the buffer
+def getDirection(_frame):
+    if not _frame:
+        return 0.0,0.0
+    working_x = 0.0
+    working_y = 0.0
+    if 'left' in _frame: working_x -= _frame['left']
+    if 'right' in _frame: working_x += _frame['right']
+    if 'up' in _frame: working_y -= _frame['up']
+    if 'down' in _frame: working_y += _frame['down']
+    return working_x,working_y
+
+"""
+One frame of smoothing. The stick goes back toward the middle, faster if it's being pushed the other way, and
+slower if it's being pushed the same way, and then the frame's direction is added on.
+"""
+def smoothDirection(_smoothedX,_smoothedY,_workingX,_workingY,_distance,_maxMagnitude):
+    x_decay = float(1.5)/_distance
+    y_decay = float(1.5)/_distance
+    if (_workingX > 0 and _smoothedX > 0) or (_workingX < 0 and _smoothedX < 0):
+        x_decay = float(1)/_distance
+    elif (_workingX < 0 and _smoothedX > 0) or (_workingX > 0 and _smoothedX < 0):
+        x_decay = float(4)/_distance
+    #Going the other way up or down has never sped up y, only going the same way slows it down
+    if (_workingY < 0 and _smoothedY < 0) or (_workingY > 0 and _smoothedY > 0):
+        y_decay = float(1)/_distance
+    magnitude = math.sqrt(_workingX*_workingX + _workingY*_workingY)
+    if magnitude > _maxMagnitude:
+        _workingX /= magnitude/_maxMagnitude
+        _workingY /= magnitude/_maxMagnitude
+    if _smoothedX > 0:
+        _smoothedX -= x_decay
+        if _smoothedX < 0:
+            _smoothedX = 0
+    elif _smoothedX < 0:
+        _smoothedX += x_decay
+        if _smoothedX > 0:
+            _smoothedX = 0
+    if _smoothedY > 0:
+        _smoothedY -= y_decay
+        if _smoothedY < 0:
+            _smoothedY = 0
+    elif _smoothedY < 0:
+        _smoothedY += y_decay
+        if _smoothedY > 0:
+            _smoothedY = 0
+    return _smoothedX + _workingX,_smoothedY + _workingY
+
+#Which bit of a bitmask from getKeyFrames is the newest frame, counting from the start of the window
+def getNewestFrame(_bits):
+    return (_bits & -_bits).bit_length() - 1
 
+#Which bit is the oldest frame
+def getOldestFrame(_bits):
+    return _bits.bit_length() - 1
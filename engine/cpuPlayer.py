@@ -1,27 +1,58 @@
 import engine.controller as controller
+import spriteManager
 import pygame
 import math
+import copy
+import random
 import pprint
 
+#Whether a rect moving from one place to another is blocked by a platform, by where it starts and ends and where
+#the platform is. The CPU asks about the same paths over and over, and the ECB's check is slow for just one path.
+#It only depends on the rects, so it's shared, and only ever cleared so it doesn't keep growing.
+PATH_CACHE_SIZE = 4096
+path_cache = dict()
+
+def isPathBlocked(_ecb,_startRect,_endRect,_platform):
+    key = (tuple(_startRect),tuple(_endRect),tuple(_platform))
+    blocked = path_cache.get(key)
+    if blocked is None:
+        if len(path_cache) >= PATH_CACHE_SIZE:
+            path_cache.clear()
+        #Only a platform inside the rect around the whole path can be in the way
+        _ecb.current_ecb.rect = _startRect
+        blocked = _startRect.union(_endRect).colliderect(_platform) and _ecb.pathRectIntersects(_platform, _endRect.x-_startRect.x, _endRect.y-_startRect.y) <= 1
+        path_cache[key] = blocked
+    return blocked
+
+"""
+A controller that plays by itself. Pass a seed to have it make the same choices every time it's in the same spot.
+It has its own random, so it plays the same however much the battle's random gets used, and vice versa.
+"""
 class CPUplayer(controller.Controller):
-    def __init__(self,_bindings):
+    def __init__(self,_bindings,_seed=None):
         controller.Controller.__init__(self,_bindings)
         self.mode = 'duckling'
         self.jump_last_frame = 0
+        self.attack_last_frame = 0
+        self.attack_wait = 20
+        self.random = random.Random(_seed)
         self.type = 'CPU'
+        self.fighter = None
+    
+    def linkObject(self,_object):
+        controller.Controller.linkObject(self,_object)
+        self.fighter = _object
         
     def getDistanceTo(self,_target):
         sx = self.fighter.posx
         sy = self.fighter.posy
-        tx,ty = _target.rect.center
-        return (tx - sx, ty - sy)
+        return (_target.posx - sx, _target.posy - sy)
 
     def passInputs(self):
         self.update()
         controller.Controller.passInputs(self)
 
     def getPathDistance(self, _startPoint, _endPoint):
-        import engine.abstractFighter as abstractFighter
         nodes = [_startPoint, _endPoint]
         solid_list = []
         for platform in self.fighter.game_state.platform_list:
@@ -38,6 +69,10 @@ class CPUplayer(controller.Controller):
         dists = {0: 0}
         estimates = {0: math.sqrt((_startPoint[0]-_endPoint[0])**2+(_startPoint[1]-_endPoint[1])**2)}
 
+        #Paths are checked by moving a copy of our ECB along them, the way we'd move ourselves
+        path_ecb = copy.copy(self.fighter.ecb)
+        path_ecb.current_ecb = spriteManager.RectSprite(self.fighter.ecb.current_ecb.rect)
+
         while (len(open_set) > 0):
             current = min(filter(lambda n: n[0] in open_set, estimates.items()), key=lambda x: x[1])[0] #Current now has the farthest-off point
             if current == 1:
@@ -51,7 +86,7 @@ class CPUplayer(controller.Controller):
                 current_ecb = pygame.Rect(nodes[current][0]-self.fighter.ecb.current_ecb.rect.width//2, nodes[current][1]-self.fighter.ecb.current_ecb.rect.height//2, self.fighter.ecb.current_ecb.rect.width, self.fighter.ecb.current_ecb.rect.height)
                 next_ecb = pygame.Rect(nodes[node][0]-self.fighter.ecb.current_ecb.rect.width//2, nodes[node][1]-self.fighter.ecb.current_ecb.rect.height//2, self.fighter.ecb.current_ecb.rect.width, self.fighter.ecb.current_ecb.rect.height)
 
-                if not any(map(lambda f: abstractFighter.pathRectIntersects(current_ecb, next_ecb, f) <= 1, solid_list)):
+                if not any(map(lambda f: isPathBlocked(path_ecb, current_ecb, next_ecb, f), solid_list)):
                     tentativeDist = dists[current] + math.sqrt((nodes[current][0]-nodes[node][0])**2+(nodes[current][1]-nodes[node][1])**2)
                     if node not in open_set:
                         open_set.add(node)
@@ -59,24 +94,28 @@ class CPUplayer(controller.Controller):
                         continue
                     came_from[node] = current
                     dists[node] = tentativeDist
-                    estimates[node] = dists[node]+math.sqrt((nodes[node][0]-end_point[0])**2+(nodes[node][1]-end_point[1])**2)
+                    estimates[node] = dists[node]+math.sqrt((nodes[node][0]-_endPoint[0])**2+(nodes[node][1]-_endPoint[1])**2)
         if 1 not in dists:
             return 99999
         else: return dists[1]
 
+    #The closest fighter that isn't us, by how far we'd have to go to get to them
+    def getNearestOpponent(self):
+        opposing_players = list(filter(lambda k: k != self.fighter, self.fighter.players))
+        opposing_dists = list(map(lambda x: self.getPathDistance((self.fighter.posx, self.fighter.posy), x.sprite.rect.center), opposing_players))
+        return opposing_players[opposing_dists.index(min(opposing_dists))]
+
     def ducklingTargeting(self):
-        opposing_players = filter(lambda k: k != self.fighter, self.fighter.players)
-        opposing_dists = map(lambda x: self.getPathDistance((self.fighter.posx, self.fighter.posy), x.sprite.rect.center), opposing_players)
-        return opposing_players[opposing_dists.index(min(opposing_dists))].sprite.rect.center
+        return self.getNearestOpponent().sprite.rect.center
 
     def ledgeTargeting(self):
-        ledge_points = map(lambda x: [x.rect.left-self.fighter.sprite.bounding_rect.width/2.0 if x.side == 'left' else x.rect.right+self.fighter.sprite.bounding_rect.width/2.0, x.rect.bottom+self.fighter.sprite.bounding_rect.height/2.0], self.fighter.game_state.platform_ledges)
-        ledge_distances = map(lambda x: self.getPathDistance(self.fighter.sprite.bounding_rect.center, x), ledge_points)
+        ledge_points = list(map(lambda x: [x.rect.left-self.fighter.sprite.bounding_rect.width/2.0 if x.side == 'left' else x.rect.right+self.fighter.sprite.bounding_rect.width/2.0, x.rect.bottom+self.fighter.sprite.bounding_rect.height/2.0], self.fighter.game_state.platform_ledges))
+        ledge_distances = list(map(lambda x: self.getPathDistance(self.fighter.sprite.bounding_rect.center, x), ledge_points))
         return ledge_points[ledge_distances.index(min(ledge_distances))]
 
     def platformTargeting(self):
-        target_points = map(lambda x: [x.rect.left-self.fighter.sprite.bounding_rect.width/2.0, x.rect.top-self.fighter.sprite.bounding_rect.height/2.0], self.fighter.game_state.platform_list)+map(lambda x: [x.rect.right+self.fighter.sprite.bounding_rect.width/2.0, x.rect.top-self.fighter.sprite.bounding_rect.height/2.0], self.fighter.game_state.platform_list)
-        target_distances = map(lambda x: self.getPathDistance(self.fighter.sprite.bounding_rect.center, x), target_points)
+        target_points = list(map(lambda x: [x.rect.left-self.fighter.sprite.bounding_rect.width/2.0, x.rect.top-self.fighter.sprite.bounding_rect.height/2.0], self.fighter.game_state.platform_list))+list(map(lambda x: [x.rect.right+self.fighter.sprite.bounding_rect.width/2.0, x.rect.top-self.fighter.sprite.bounding_rect.height/2.0], self.fighter.game_state.platform_list))
+        target_distances = list(map(lambda x: self.getPathDistance(self.fighter.sprite.bounding_rect.center, x), target_points))
         return target_points[target_distances.index(min(target_distances))]
 
     def update(self):
@@ -85,17 +124,24 @@ class CPUplayer(controller.Controller):
         if self.fighter is None or not hasattr(self.fighter, 'players') or self.fighter.players is None:
             print("Can't find!")
             return
-        if self.mode == 'duckling': #Follow the player
-            distance = self.getPathDistance((self.fighter.posx, self.fighter.posy), self.ducklingTargeting())
-            prev_distance = self.getPathDistance(self.fighter.ecb.current_ecb.rect.center, self.fighter.players[0].sprite.bounding_rect.center)
+        if self.mode == 'duckling': #Follow the nearest player
+            target = self.getNearestOpponent()
+            distance = self.getPathDistance((self.fighter.posx, self.fighter.posy), target.sprite.rect.center)
+            prev_distance = self.getPathDistance(self.fighter.ecb.current_ecb.rect.center, target.sprite.bounding_rect.center)
             #We offset by one so that simply running away doesn't trigger catchup behavior
-            (dx, dy) = self.getDistanceTo(self.fighter.players[0])
-            if dx < 0:
-                if not isinstance(self.fighter.current_action, baseActions.LedgeGrab):
-                    construct_list += ['left']
-            if dx > 0:
-                if not isinstance(self.fighter.current_action, baseActions.LedgeGrab):
-                    construct_list += ['right']
+            (dx, dy) = self.getDistanceTo(target)
+            #Close enough to hit them, but not so close we're on top of them and swing right past. Too close and
+            #we keep walking, through them and out the other side, then turn around.
+            width = self.fighter.sprite.bounding_rect.width
+            in_range = width // 4 < abs(dx) < width and abs(dy) < self.fighter.sprite.bounding_rect.height
+            facing_them = (dx < 0) == (self.fighter.facing == -1)
+            if isinstance(self.fighter.current_action, baseActions.LedgeGrab):
+                #Get back up. Nobody's coming to the ledge to fight us.
+                construct_list += ['up']
+            elif dx < 0 and (not in_range or not facing_them):
+                construct_list += ['left']
+            elif dx > 0 and (not in_range or not facing_them):
+                construct_list += ['right']
             if dy < 0 and self.jump_last_frame > 8 and distance-prev_distance>0:
                 construct_list += ['jump']
                 self.jump_last_frame = 0
@@ -103,7 +149,16 @@ class CPUplayer(controller.Controller):
                 self.jump_last_frame += 1
             if dy > 0 and self.fighter.grounded and not isinstance(self.fighter.current_action, baseActions.Crouch):
                 construct_list += ['down']
+            #Swing at them. It's a tap, since some attacks keep going for as long as it's held. The wait between
+            #swings is random, so two of the same CPU don't swing in step and clank every time.
+            if in_range and facing_them and self.attack_last_frame > self.attack_wait:
+                construct_list += ['attack']
+                self.attack_last_frame = 0
+                self.attack_wait = self.random.randint(10, 40)
+            else:
+                self.attack_last_frame += 1
         for key in filter(lambda x: x not in construct_list, self.keys_held):
             self.keys_to_release += [key]
         for key in filter(lambda x: x not in self.keys_held, construct_list):
             self.keys_to_pass += [key]
+        self.keys_held = construct_list
@@ -0,0 +1,281 @@
+import os
+import sys
+import mmap
+import struct
+import hashlib
+import pygame
+import spriteManager
+import engine.action as action
+import engine.actionLoader as actionLoader
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+"""
+Fighter packages are a fighter's sprites and actions, already built, saved in one file for each costume and palette.
+Loading a fighter from its source files means loading every sprite sheet, cutting it into frames, recoloring every
+frame and flipping a copy of it, then building every action from the XML. A package holds the finished frames,
+uncompressed, one after another, and the pickled action prototypes. The file is mapped into memory instead of read,
+and each frame is converted to the display's format straight from it.
+
+Each package remembers the size, modification time and hash of every file it was built from. If a file's time or
+size has changed, its hash is checked, and the package is only rebuilt if that's different too. If the hash is the
+same, the new time and size are saved in the package, so the file isn't hashed again next time.
+
+A package is the magic and version, the length of the index, the pickled index, and then the frame data.
+"""
+PACKAGE_MAGIC = b'TUSF'
+PACKAGE_VERSION = 1
+PACKAGE_HEADER = '<4sBI'
+#Packages go in here, inside the fighter's folder
+PACKAGE_DIRECTORY = 'cache'
+
+class FighterPackage(object):
+    def __init__(self,_path):
+        self.path = _path
+        #Set when isCurrent finds a file that changed time or size but not contents, see saveIndex
+        self.sources_changed = False
+        with open(_path,'rb') as package_file:
+            #Copy on write, so a frame that gets drawn on doesn't change the file
+            self.data = mmap.mmap(package_file.fileno(),0,access=mmap.ACCESS_COPY)
+        #Nothing is unpickled until the header says it's a whole package, from this version
+        offset = struct.calcsize(PACKAGE_HEADER)
+        if len(self.data) < offset:
+            raise ValueError(_path+' is too short to be a fighter package')
+        magic,version,index_length = struct.unpack_from(PACKAGE_HEADER,self.data,0)
+        if magic != PACKAGE_MAGIC or version != PACKAGE_VERSION:
+            raise ValueError(_path+' is not a fighter package this version of TUSSLE can load')
+        if offset+index_length > len(self.data):
+            raise ValueError(_path+' has been cut short')
+        self.index = pickle.loads(self.data[offset:offset+index_length])
+        self.frame_start = offset+index_length
+        frame_end = max([frame_offset+width*height*4 for sheets in self.index['sheets'].values() for frames in sheets.values() for frame_offset,width,height in frames] or [0])
+        if self.frame_start+frame_end > len(self.data):
+            raise ValueError(_path+' has been cut short')
+
+    """
+    Checks that the package was built from the files in _sources, with the same settings.
+    A file that only changed time or size, like one that was checked out again, gets its new ones noted down.
+    """
+    def isCurrent(self,_baseDir,_sources,_settings):
+        if self.index['settings'] != _settings:
+            return False
+        built_from = self.index['sources']
+        if sorted(built_from.keys()) != sorted([os.path.relpath(path,_baseDir) for path in _sources]):
+            return False
+        for path in _sources:
+            mtime,size,digest = built_from[os.path.relpath(path,_baseDir)]
+            stat = os.stat(path)
+            if (stat.st_mtime,stat.st_size) != (mtime,size):
+                if hashFile(path) != digest:
+                    return False
+                built_from[os.path.relpath(path,_baseDir)] = (stat.st_mtime,stat.st_size,digest)
+                self.sources_changed = True
+        return True
+
+    """
+    Writes the package again with its index as it is now, keeping the frames it has.
+    Like buildPackage, it's written somewhere else first, so a half written package is never loaded.
+    """
+    def saveIndex(self):
+        index_data = pickle.dumps(self.index,2)
+        with open(self.path+'.tmp','wb') as package_file:
+            package_file.write(struct.pack(PACKAGE_HEADER,PACKAGE_MAGIC,PACKAGE_VERSION,len(index_data)))
+            package_file.write(index_data)
+            package_file.write(self.data[self.frame_start:])
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(self.path+'.tmp',self.path)
+        self.sources_changed = False
+
+    """
+    The image library for a SpriteHandler, facing both ways. Each frame is converted once, the way ImageLibrary
+    converts its sheets, so it isn't converted again every time it's drawn.
+    """
+    def getImageLibrary(self):
+        library = dict()
+        for flip,sheets in self.index['sheets'].items():
+            library[flip] = dict()
+            for name,frames in sheets.items():
+                library[flip][name] = [pygame.image.frombuffer(getFrameBuffer(self.data,self.frame_start+offset,width*height*4),(width,height),'RGBA').convert_alpha()
+                                       for offset,width,height in frames]
+        return library
+
+    """
+    The action prototypes, by name. They still need to be compiled, which ActionLoader.addPrototypes does.
+    """
+    def getPrototypes(self):
+        prototypes = dict()
+        for name,data in self.index['prototypes'].items():
+            try:
+                prototypes[name] = pickle.loads(data)
+            except Exception as e:
+                print('Could not load action '+name+' from fighter package: '+str(e))
+        return prototypes
+
+"""
+Gets the package for the fighter's current costume and the given palette, building it if it's missing or out of date.
+Returns None if there's no package and one can't be built, in which case the fighter should load from its source files.
+"""
+def getPackage(_fighter,_color):
+    path = getPackagePath(_fighter,_color)
+    sources = getSources(_fighter)
+    settings = getSettings(_fighter,_color)
+    if os.path.exists(path):
+        try:
+            package = FighterPackage(path)
+            if package.isCurrent(_fighter.base_dir,sources,settings):
+                if package.sources_changed:
+                    #If the new times can't be saved, the package is still good, they'll just be hashed again next time
+                    try:
+                        package.saveIndex()
+                    except Exception as e:
+                        print('Could not update fighter package '+path+': '+str(e))
+                return package
+        except Exception as e:
+            print('Could not load fighter package '+path+': '+str(e))
+    try:
+        buildPackage(_fighter,_color)
+        return FighterPackage(path)
+    except Exception as e:
+        print('Could not build fighter package '+path+': '+str(e))
+        return None
+
+"""
+Builds the sprites and actions the same way a fighter loading from its source files would, and saves them in a package.
+"""
+def buildPackage(_fighter,_color):
+    path = getPackagePath(_fighter,_color)
+    costume = getCostume(_fighter)
+    palette = _fighter.color_palettes[_color % len(_fighter.color_palettes)]
+    handler = spriteManager.SpriteHandler(str(os.path.join(_fighter.base_dir,_fighter.sprite_directory)),
+                                          costume,
+                                          _fighter.default_sprite,
+                                          _fighter.sprite_width,
+                                          palette,
+                                          getScale(_fighter),
+                                          _fighter.sprite_flip)
+    frame_data = []
+    offset = 0
+    sheets = dict()
+    for flip,library in handler.image_library.items():
+        sheets[flip] = dict()
+        for name,images in library.items():
+            frames = []
+            for image in images:
+                data = pygame.image.tostring(image,'RGBA')
+                frames.append((offset,image.get_width(),image.get_height()))
+                frame_data.append(data)
+                offset += len(data)
+            sheets[flip][name] = frames
+
+    index = {'settings': getSettings(_fighter,_color),
+             'sources': dict([(os.path.relpath(source,_fighter.base_dir),getFingerprint(source)) for source in getSources(_fighter)]),
+             'sheets': sheets,
+             'prototypes': getPickledPrototypes(_fighter)
+             }
+    index_data = pickle.dumps(index,2)
+
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    #Write it somewhere else first, so a half written package is never loaded
+    with open(path+'.tmp','wb') as package_file:
+        package_file.write(struct.pack(PACKAGE_HEADER,PACKAGE_MAGIC,PACKAGE_VERSION,len(index_data)))
+        package_file.write(index_data)
+        for data in frame_data:
+            package_file.write(data)
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(path+'.tmp',path)
+
+"""
+Builds every action that can be built without a fighter to go with it, and pickles each one.
+Anything that can't be built or pickled is left out, and is built from the XML when it's used, like before.
+"""
+def getPickledPrototypes(_fighter):
+    prototypes = dict()
+    if not isinstance(_fighter.actions, actionLoader.ActionLoader):
+        return prototypes
+    for name in _fighter.actions.getAllActions():
+        try:
+            prototype = _fighter.actions.compileAction(name)
+            if isinstance(prototype, action.Action):
+                prototype = prototype.clone()
+                prototype.decompile()
+                prototypes[name] = pickle.dumps(prototype,2)
+        except Exception:
+            pass
+    return prototypes
+
+def getCostume(_fighter):
+    return _fighter.costumes[_fighter.current_costume % len(_fighter.costumes)]
+
+def getScale(_fighter):
+    try:
+        return float(_fighter.xml_data.find('scale').text)
+    except:
+        return 1.0
+
+def getSettings(_fighter,_color):
+    palette = _fighter.color_palettes[_color % len(_fighter.color_palettes)]
+    return (getCostume(_fighter), sorted(palette.items()), getScale(_fighter), _fighter.sprite_width, _fighter.sprite_flip)
+
+def getPackagePath(_fighter,_color):
+    key = hashlib.sha1(repr(getSettings(_fighter,_color)).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(_fighter.base_dir,PACKAGE_DIRECTORY,(getCostume(_fighter) or 'fighter_')+key+'.pkg')
+
+"""
+Every file that goes into a package: the sprite sheets for the costume, fighter.xml and the actions XML.
+Pickled actions are only good for the code that pickled them, so the engine's action code counts too.
+"""
+def getSources(_fighter):
+    sources = [path for _,path in spriteManager.getLibraryFiles(str(os.path.join(_fighter.base_dir,_fighter.sprite_directory)),getCostume(_fighter))]
+    if os.path.exists(os.path.join(_fighter.base_dir,'fighter.xml')):
+        sources.append(os.path.join(_fighter.base_dir,'fighter.xml'))
+    if isinstance(_fighter.actions, actionLoader.ActionLoader):
+        sources.append(_fighter.actions.actions_xml_data)
+        sources.extend(getActionCode())
+    return sorted(sources)
+
+def getActionCode():
+    engine_directory = os.path.dirname(os.path.abspath(__file__))
+    code = [os.path.join(engine_directory,name) for name in ['action.py','actionLoader.py','baseActions.py','subaction.py']]
+    for directory,_,files in os.walk(os.path.join(engine_directory,'subactions')):
+        code.extend([os.path.join(directory,name) for name in files if name.endswith('.py')])
+    return code
+
+def getFingerprint(_path):
+    stat = os.stat(_path)
+    return (stat.st_mtime,stat.st_size,hashFile(_path))
+
+def hashFile(_path):
+    with open(_path,'rb') as source_file:
+        return hashlib.sha1(source_file.read()).hexdigest()
+
+#A view of part of the mapped file, that a surface can use as its pixels without copying them
+def getFrameBuffer(_data,_offset,_length):
+    if sys.version_info[0] < 3:
+        return buffer(_data,_offset,_length)
+    return memoryview(_data)[_offset:_offset+_length]
+
+"""
+Builds every costume and palette of the given fighters ahead of time, so nobody has to wait for them on the character select screen.
+
+    python -m engine.fighterPackage fighters/hitboxie fighters/sandbag
+"""
+def buildAllPackages(_fighter):
+    for costume in range(len(_fighter.costumes)):
+        _fighter.current_costume = costume
+        for color in range(len(_fighter.color_palettes)):
+            buildPackage(_fighter,color)
+            print('Built '+getPackagePath(_fighter,color))
+
+if __name__ == '__main__':
+    import engine.abstractFighter as abstractFighter
+    os.environ.setdefault('SDL_VIDEODRIVER','dummy')
+    pygame.init()
+    pygame.display.set_mode((1,1))
+    for directory in sys.argv[1:]:
+        buildAllPackages(abstractFighter.AbstractFighter(directory,0))
@@ -2,88 +2,158 @@ import socket
 import json 
 import select 
 import random
+import struct
 import pygame
 import settingsManager
+import engine.controller as controller
 
 import time
 
+"""
+Every message starts with a one character status, and everything after it is packed little-endian with struct.
+Over UDP, each datagram is one message. Over TCP, each message is sent with its length in front of it, see frameMessage.
+"""
+MESSAGE_CONNECT = b'c'
+MESSAGE_START = b't'
+MESSAGE_INPUT = b'u'
+MESSAGE_FIGHTER = b'f'
+MESSAGE_PROGRESS = b'p'
+MESSAGE_DISCONNECT = b'd'
+MAX_MESSAGE_SIZE = 512
+LENGTH_PREFIX = struct.Struct('<H')
+
+#A player's input for a frame is how far they're pressing each of these, from 0 to ANALOG_STEPS.
+#Keys and gamepad buttons are all the way or not at all, sticks and triggers can be anywhere in between.
+BUTTONS = ['left','right','up','down','jump','attack','special','shield']
+ANALOG_STEPS = controller.ANALOG_STEPS
+#The event a player's input comes to the battle as when it changes, see getInputEvents.
+#It's never posted, Network makes them.
+NETWORK_INPUT = pygame.USEREVENT + 617
+#How many frames of input go in each UDP packet, so a lost packet is covered by the next one
+REDUNDANT_FRAMES = 8
+
+def frameMessage(_msg):
+    return LENGTH_PREFIX.pack(len(_msg))+_msg
+
+"""
+Splits as many whole messages as it can off the front of a TCP stream.
+Returns the messages, and whatever's left over to wait for the rest of.
+"""
+def unframeMessages(_data):
+    messages = []
+    while len(_data) >= LENGTH_PREFIX.size:
+        (length,) = LENGTH_PREFIX.unpack_from(_data)
+        if len(_data) < LENGTH_PREFIX.size + length:
+            break
+        messages.append(_data[LENGTH_PREFIX.size:LENGTH_PREFIX.size+length])
+        _data = _data[LENGTH_PREFIX.size+length:]
+    return messages,_data
+
+#Turns how far something's pressed, from 0 to 1, into the steps that are sent
+def toSteps(_value):
+    return int(round(min(max(_value,0),1) * ANALOG_STEPS))
+
 class NetworkEvt(object):
-    pass#empty, for deserialising, attributes are added from json
+    pass#empty, for the input events we make, see getInputEvents
 
+"""
+The input of one player on a frame, along with the frames just before it.
+inputs is oldest first, so the last one is for frame. Each is a tuple of how far each of BUTTONS is pressed.
+"""
 class NetworkUpdateMessage(object):
+    HEADER = struct.Struct('<cIBB')
+    INPUT = struct.Struct('<'+str(len(BUTTONS))+'B')
     def __init__(self):
-        self.status = "u"
-        self.json = "{}"
-        self.type = 0
+        self.status = MESSAGE_INPUT
         self.frame = 0
-    def toString(self):
-        return self.status+"_"+str(self.type)+"_"+str(self.frame)+"_"+self.json
+        self.player = 0
+        self.inputs = []
+    def toBytes(self):
+        return self.HEADER.pack(self.status,self.frame,self.player,len(self.inputs))+b''.join([self.INPUT.pack(*values) for values in self.inputs])
     def isValid(self,msg):
-        return (len(msg)>1 and msg[0] == "u" and msg.count("_")==3)
-    def isBlank(self):
-        return self.type == 0
-    def fromString(self,msg):
-        evt = NetworkEvt()
-        evtSplit = msg.split("_")
-        self.status = evtSplit[0]
-        self.type = int(evtSplit[1])
-        self.frame = int(evtSplit[2])
-        self.json = evtSplit[3]
-        evt.type = self.type
-        jsondict = json.loads(self.json).items()
-        for attr,val in jsondict:
-            setattr(evt,attr,val)
-        return evt
-    def update(self,_type,_json,_frame):
-        self.json = _json
-        self.type = _type
+        return (len(msg)>=self.HEADER.size and msg[0:1] == MESSAGE_INPUT and
+                len(msg) == self.HEADER.size+self.INPUT.size*self.HEADER.unpack_from(msg)[3])
+    def fromBytes(self,msg):
+        self.status,self.frame,self.player,count = self.HEADER.unpack_from(msg)
+        self.inputs = [self.INPUT.unpack_from(msg,self.HEADER.size+i*self.INPUT.size) for i in range(count)]
+        return self
+    def getFrames(self):
+        first = self.frame-len(self.inputs)+1
+        return [(first+i,values) for i,values in enumerate(self.inputs)]
+    def update(self,_player,_frame,_inputs):
+        self.player = _player
         self.frame = _frame
+        self.inputs = _inputs
+
+"""
+Asks the server for a place in a room. Players asking for the same room name and size are put together,
+and the game starts once it's full. Players who don't name a room are matched with whoever's waiting.
+"""
+class NetworkConnectMessage(object):
+    HEADER = struct.Struct('<cB')
+    MIN_PLAYERS = 2
+    MAX_PLAYERS = 4
+    def __init__(self):
+        self.status = MESSAGE_CONNECT
+        self.room = ""
+        self.size = self.MIN_PLAYERS
+    def toBytes(self):
+        return self.HEADER.pack(self.status,self.size)+self.room.encode('utf-8')
+    def isValid(self,msg):
+        return (len(msg)>=1 and msg[0:1] == MESSAGE_CONNECT)
+    def fromBytes(self,msg):
+        self.status = msg[0:1]
+        if len(msg) >= self.HEADER.size:#a bare connect gets the default room
+            self.size = self.HEADER.unpack_from(msg)[1]
+            self.room = msg[self.HEADER.size:].decode('utf-8')
+        self.size = min(max(self.size,self.MIN_PLAYERS),self.MAX_PLAYERS)
+        return self
 
 class NetworkTickMessage(object):
+    FORMAT = struct.Struct('<cIBBI')
     def __init__(self):
-        self.status = "t"
-        self.json = ""
+        self.status = MESSAGE_START
         self.tick = 0
+        self.playerno = 0
+        self.players = 0
+        self.seed = 0
+    def toBytes(self):
+        return self.FORMAT.pack(self.status,self.tick,self.playerno,self.players,self.seed)
     def isValid(self,msg):
-        return (len(msg)>1 and msg[0] == "t" and msg.count("_")==2)
-    def fromString(self,msg):
-        evtSplit = msg.split("_")
-        self.status = evtSplit[0]
-        self.tick = int(evtSplit[1])
-        self.json = evtSplit[2]
+        return (len(msg) == self.FORMAT.size and msg[0:1] == MESSAGE_START)
+    def fromBytes(self,msg):
+        self.status,self.tick,self.playerno,self.players,self.seed = self.FORMAT.unpack(msg)
         return self
 
 class NetworkFighterMessage(object):
+    HEADER = struct.Struct('<cI')
     def __init__(self):
-        self.status = "f"
+        self.status = MESSAGE_FIGHTER
         self.frame = 0
         self.json = ""
     def setFighter(self,_frame,_fighterAttrs):
         self.frame = _frame
         self.json = json.dumps(_fighterAttrs)
     def isValid(self,msg):
-        return (len(msg)>1 and msg[0] == "f" and msg.count("|")==2)
-    def toString(self):
-        return self.status+"|"+str(self.frame)+"|"+self.json
-    def fromString(self,msg):
-        evtSplit = msg.split("|")
-        self.status = evtSplit[0]
-        self.frame = int(evtSplit[1])
-        self.json = evtSplit[2]
+        return (len(msg)>=self.HEADER.size and msg[0:1] == MESSAGE_FIGHTER)
+    def toBytes(self):
+        return self.HEADER.pack(self.status,self.frame)+self.json.encode('utf-8')
+    def fromBytes(self,msg):
+        self.status,self.frame = self.HEADER.unpack_from(msg)
+        self.json = msg[self.HEADER.size:].decode('utf-8')
         return self
 
 class NetworkProgressMessage(object):
+    FORMAT = struct.Struct('<cI')
     def __init__(self):
-        self.status = "p"
+        self.status = MESSAGE_PROGRESS
         self.frame = 0
     def isValid(self,msg):
-        return (len(msg)>1 and msg[0] == "p" and msg.count("_")==1)
-    def toString(self):
-        return self.status+"_"+str(self.frame)
-    def fromString(self,msg):
-        evtSplit = msg.split("_")
-        self.status = evtSplit[0]
-        self.frame = int(evtSplit[1])
+        return (len(msg) == self.FORMAT.size and msg[0:1] == MESSAGE_PROGRESS)
+    def toBytes(self):
+        return self.FORMAT.pack(self.status,self.frame)
+    def fromBytes(self,msg):
+        self.status,self.frame = self.FORMAT.unpack(msg)
         return self
         
 class NetworkBufferEntry(object):
@@ -102,19 +172,18 @@ class Network(object):
         if(self.connect_mode == self.SOCKET_MODE_UDP):
             self.conn.sendto(msg, target)
         if(self.connect_mode == self.SOCKET_MODE_TCP):
-            if len(msg)<self.MESSAGE_SIZE:#fixed-width messages, could be made better by proper buffering 
-                msg='{message: <{fill}}'.format(message=msg, fill=self.MESSAGE_SIZE)
-            else:
-                print("message too long: "+str(len(msg)))
-            self.conn.sendall(msg)
+            self.conn.sendall(frameMessage(msg))
         
     #TODO: replace hard-coded ports/addresses/buffer/etc with configurable ones
-    def __init__(self):
+    def __init__(self,_enabled=None):
         self.settings = settingsManager.getSetting().setting
         #set to false to disable all networking and just run locally
-        self.enabled = self.settings['networkEnabled']
+        #passing _enabled overrides the setting, e.g. headless battles never go online
+        self.enabled = self.settings['networkEnabled'] if _enabled is None else _enabled
+        #in rollback mode local input isn't delayed, the battle rewinds and replays frames when remote input turns up late
+        self.rollback = self.enabled and self.settings['networkMode'] == 'rollback'
+        self.controllers = []
         if(self.enabled):     
-            self.MESSAGE_SIZE = 96
             self.SOCKET_MODE_UDP = "udp"
             self.SOCKET_MODE_TCP = "tcp"
             
@@ -123,20 +192,7 @@ class Network(object):
             self.serveraddr = self.settings['networkServerIP']
             self.serverport = self.settings['networkServerPort']
             
-            if(self.connect_mode == self.SOCKET_MODE_UDP):
-                self.conn = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                self.conn.setblocking(0)
-                self.clientport = random.randrange(self.settings['networkUDPClientPortMin'], self.settings['networkUDPClientPortMax'])
-                self.conn.bind(("", self.clientport))#bind to everything.
-            if(self.connect_mode == self.SOCKET_MODE_TCP):
-                self.conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.conn.connect((self.serveraddr,self.serverport))
-                self.conn.setblocking(0)
-            
-            self.read_list = [self.conn]
-            self.write_list = []
-            
-            self.send("c", (self.serveraddr, self.serverport))
+            self.connect()
             #count each frame with an id so that it can be identified when sent over the wire
             self.tick_count = 0
             self.buffer_size = self.settings['networkBufferSize']#number of frames of latency to introduce locally (should be greater than the network latency)
@@ -150,8 +206,46 @@ class Network(object):
             self.STATE_PLAYING = 1
             self.current_state = self.STATE_WAITING_FOR_OPPONENT
             self.playerno = 0
+            
+            #we send how far each button is pressed every frame, and each side works out what changed
+            self.local_buttons = set()#keys and gamepad buttons, the sticks are read every frame
+            self.local_values = None#what we last sent
+            self.sent_frame = None
+            self.sent_inputs = []#the last REDUNDANT_FRAMES inputs we sent, to send again over UDP
+            self.player_values = {}#last input each player's controller was given, us included
+            self.remote_frames = {}#last frame we got from each player
+            
+            #rollback mode keeps every frame's inputs until the opponent has confirmed it
+            self.rollback_frames = self.settings['networkRollbackFrames']#most frames we'll predict ahead of the opponent
+            self.local_inputs = {}
+            self.remote_inputs = {}
+            self.remote_frame = -1#last frame every opponent has sent us everything for
+            self.rollback_frame = None#earliest frame we simulated before its remote inputs arrived
             #TODO: on exit implement disconnect (message status "d" to server)
             #close TCP
+    
+    """
+    Opens the socket and asks the server for a place in a room.
+    """
+    def connect(self):
+        if(self.connect_mode == self.SOCKET_MODE_UDP):
+            self.conn = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.conn.setblocking(0)
+            self.clientport = random.randrange(self.settings['networkUDPClientPortMin'], self.settings['networkUDPClientPortMax'])
+            self.conn.bind(("", self.clientport))#bind to everything.
+        if(self.connect_mode == self.SOCKET_MODE_TCP):
+            self.conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.conn.connect((self.serveraddr,self.serverport))
+            self.conn.setblocking(0)
+        
+        self.read_list = [self.conn]
+        self.write_list = []
+        self.received = b''#TCP data that isn't a whole message yet
+        
+        msgConnect = NetworkConnectMessage()
+        msgConnect.room = self.settings['networkRoom']
+        msgConnect.size = self.settings['networkRoomSize']
+        self.send(msgConnect.toBytes(), (self.serveraddr, self.serverport))
             
     """
     Creates a fake 'pipe' between the local event source (keyboard) and the network processing
@@ -186,15 +280,20 @@ class Network(object):
     and it means tracking code changes to fighters in this class (making code slightly harder to maintain).
     Additioanlly it requires possible engine changes to allow state rollback/fast forward
     
-    TODO: implement a translation layer between controls?
-    player 1 keybindings on computer 1 should translate to player 2 keybindings on computer 2
+    inputs are sent as how far our own player (playerno) is pressing each button, whatever they're playing with,
+    so each player can use whichever keys or gamepad they have bound. Every player's input, ours too, comes back out
+    as NETWORK_INPUT events on the frame it goes in, and online, that's the only input the controllers get.
     """
     def processEvents(self,events):
         if(not self.enabled):
             return events#not turned on, nothing to do
+        if(self.rollback):
+            return self.processRollbackEvents(events)
         #enqueue/dequeue from buffer
         bufferObj = NetworkBufferEntry()
         bufferObj.receivedFrom['local']=events
+        if(self.current_state == self.STATE_PLAYING):
+            bufferObj.receivedFrom['local'] = events+self.updateLocalInputs(events)
         self.buffer.insert(0,bufferObj)#enqueue event onto start of queue
         nextEventObj = self.buffer.pop()#dequeue the frame that's persisted the length of the queue
         nextEventList = nextEventObj.getEvents()
@@ -218,24 +317,129 @@ class Network(object):
         self.tick_count += 1
         return nextEventList
     
+    """
+    Rollback version of processEvents. Local input is sent off and used straight away, with no buffer.
+    
+    Remote input for this frame is used if it's already here. If it isn't, we predict that the opponent's
+    input didn't change, so whatever they're holding stays held, as far as they were holding it. When their input for a frame
+    we've already played does arrive, rollback_frame is set, and the battle loads its snapshot of that frame
+    and plays forward again with getInputs.
+    
+    Every frame gets a message, even if nothing changed, so the opponent knows which frames are confirmed.
+    We never get more than rollback_frames ahead of the last confirmed frame, and stall like delay mode if we do.
+    """
+    def processRollbackEvents(self,events):
+        #anything before the last confirmed frame will never be rolled back to
+        for inputs in [self.local_inputs, self.remote_inputs]:
+            for frame in [frame for frame in inputs if frame < self.remote_frame]:
+                del inputs[frame]
+        self.readFromNetwork()
+        if(self.current_state == self.STATE_WAITING_FOR_OPPONENT):
+            return []#absorb events until players are ready
+        
+        MAX_STALL_COUNT = 100#1 second max 
+        while(self.tick_count - self.remote_frame > self.rollback_frames and MAX_STALL_COUNT>=0):
+            print("Stall at frame: "+str(self.tick_count)+" confirmed: "+str(self.remote_frame))
+            MAX_STALL_COUNT-=1
+            self.readFromNetwork()
+            time.sleep(0.01)
+        if(MAX_STALL_COUNT<0):
+            print("Max stalls exceeded.")
+        
+        local_events = self.updateLocalInputs(events)
+        self.local_inputs[self.tick_count] = local_events
+        self.sendInputs(self.tick_count)
+        
+        next_events = events + local_events + self.remote_inputs.get(self.tick_count, [])
+        self.tick_count += 1
+        return next_events
+    
+    """
+    Gets the NETWORK_INPUT events, both local and remote, that went into the given frame. Used when
+    replaying frames after a rollback.
+    """
+    def getInputs(self,_frame):
+        return self.local_inputs.get(_frame, []) + self.remote_inputs.get(_frame, [])
+    
+    """
+    Returns False while a rollback battle is waiting on its opponent. The game shouldn't move
+    until both sides start together, or their first frames won't match.
+    """
+    def canSimulate(self):
+        return not self.rollback or self.current_state == self.STATE_PLAYING
+    
+    """
+    Gives the network the battle's controllers. Ours is used to work out which buttons our keys,
+    gamepad buttons and sticks are.
+    """
+    def linkControllers(self,_controllers):
+        self.controllers = _controllers
+    
+    def getBindings(self,_player):
+        if 0 <= _player < len(self.controllers):
+            return self.controllers[_player].key_bindings
+        return dict()
+    
+    """
+    Works out how far we're pressing each button this frame, from our keys and gamepad buttons going down and up,
+    and where our sticks are. Returns our NETWORK_INPUT event for the frame, if it changed.
+    """
+    def updateLocalInputs(self,_events):
+        bindings = self.getBindings(self.playerno-1)
+        for e in _events:
+            button = None
+            if e.type in [pygame.locals.KEYDOWN, pygame.locals.KEYUP] and isinstance(bindings, dict):
+                button = bindings.get(e.key)
+            elif e.type in [pygame.locals.JOYBUTTONDOWN, pygame.locals.JOYBUTTONUP] and hasattr(bindings, 'getButtonInput'):
+                button = bindings.getButtonInput(e.joy, e.button)
+            if button in BUTTONS:
+                if e.type in [pygame.locals.KEYDOWN, pygame.locals.JOYBUTTONDOWN]: self.local_buttons.add(button)
+                else: self.local_buttons.discard(button)
+        axes = bindings.getAxisValues() if hasattr(bindings, 'getAxisValues') else dict()
+        self.local_values = tuple([ANALOG_STEPS if button in self.local_buttons else toSteps(axes.get(button, 0)) for button in BUTTONS])
+        return self.getInputEvents(self.playerno-1, self.local_values)
+    
+    """
+    Sends our input for the given frame. Over UDP, the frames just before it go too,
+    so if a packet goes missing the next one fills in for it.
+    """
+    def sendInputs(self,_frame):
+        if(self.sent_frame is None or _frame != self.sent_frame+1):
+            self.sent_inputs = []#the frames before this one aren't the ones we sent last time
+        self.sent_inputs = (self.sent_inputs+[self.local_values])[-REDUNDANT_FRAMES:]
+        self.sent_frame = _frame
+        msgEvt = NetworkUpdateMessage()
+        if(self.connect_mode == self.SOCKET_MODE_UDP):
+            msgEvt.update(self.playerno-1,_frame,self.sent_inputs)
+        else:
+            msgEvt.update(self.playerno-1,_frame,[self.local_values])
+        self.send(msgEvt.toBytes(), (self.serveraddr, self.serverport))
+    
+    """
+    Turns a player's input for a frame into the NETWORK_INPUT event the battle hands to that player's controller,
+    with how far each button is pressed, from 0 to 1. There's only an event when the input's changed since the
+    player's last one, so a frame we haven't heard about yet can be played as if nothing changed.
+    """
+    def getInputEvents(self,_player,_values):
+        if _values == self.player_values.get(_player, (0,)*len(BUTTONS)):
+            return []
+        self.player_values[_player] = _values
+        evt = NetworkEvt()
+        evt.type = NETWORK_INPUT
+        evt.player = _player
+        evt.values = [(button,float(value)/ANALOG_STEPS) for button,value in zip(BUTTONS,_values)]
+        return [evt]
+    
     def sendBuffer(self):
         bufferTicks = self.tick_count+(self.buffer_size)
         b = self.buffer[0]
-        if('local' in b.receivedFrom):
-            events = b.receivedFrom['local']
-            for e in events:
-                #TODO: make this work for devices other than keyboard
-                if e.type == pygame.locals.KEYDOWN or e.type == pygame.locals.KEYUP:
-                    #send input to others
-                    msgEvt = NetworkUpdateMessage()
-                    msgEvt.update(e.type,json.dumps(e.__dict__),bufferTicks)
-                    self.send(msgEvt.toString(), (self.serveraddr, self.serverport))
-                    #print("sent input for frame: "+str(bufferTicks)+" current frame: "+str(self.tick_count))
+        if('local' in b.receivedFrom and self.current_state == self.STATE_PLAYING):
+            self.sendInputs(bufferTicks)
         #periodically send "progressing to frame X"
         if(self.tick_count % self.buffer_size == 0):
             msgProgress = NetworkProgressMessage()
             msgProgress.frame = self.tick_count + self.buffer_size
-            self.send(msgProgress.toString(),(self.serveraddr, self.serverport))
+            self.send(msgProgress.toBytes(),(self.serveraddr, self.serverport))
     
     def handleMessage(self, msg):
         msgEvt = NetworkUpdateMessage()
@@ -243,38 +447,56 @@ class Network(object):
         msgFighter = NetworkFighterMessage()
         msgProgress = NetworkProgressMessage()
         if(msgEvt.isValid(msg)):
-            fromString = msgEvt.fromString(msg)
-            receivedTime = msgEvt.frame
-            #print("received input for frame: "+str(msgEvt.frame)+" current frame: "+str(self.tick_count))
-            frameDiff = self.buffer_size - (receivedTime - self.tick_count)
-            if(frameDiff<self.buffer_size and frameDiff>=0):
-                if(self.serveraddr not in self.buffer[frameDiff].receivedFrom):#initialise list
-                    self.buffer[frameDiff].receivedFrom[self.serveraddr] = []
-                if(not msgEvt.isBlank()):
-                    self.buffer[frameDiff].receivedFrom[self.serveraddr].append(fromString)#new entry, insert into buffer
-            else:
-                print("frame outside range"+str(msgEvt.frame))
-                if msgEvt.frame>=self.buffer_size:
-                    #Note: should never get here, it means frame rates are out of sync by a lot
-                    #but if we have hit this, try and re-sync frame count
-                    print(str(self.tick_count)+" adjusted to: "+str(msgEvt.frame-self.buffer_size+1))
-                    self.tick_count = msgEvt.frame-self.buffer_size+1
+            msgEvt.fromBytes(msg)
+            for frame,values in msgEvt.getFrames():
+                if(frame <= self.remote_frames.get(msgEvt.player, -1)):
+                    continue#already got this one in an earlier packet
+                self.remote_frames[msgEvt.player] = frame
+                self.receiveInputs(frame,msgEvt.player,self.getInputEvents(msgEvt.player,values))
+            if(self.rollback):
+                self.remote_frame = min(self.remote_frames.values())
         if(msgTick.isValid(msg)):
-            msgTick.fromString(msg)
+            msgTick.fromBytes(msg)
             self.tick_count = msgTick.tick
-            self.playerno = json.loads(msgTick.json)['playerno']
+            self.playerno = msgTick.playerno
+            #everyone else in the room has to confirm a frame before it's safe
+            for player in range(msgTick.players):
+                if(player != self.playerno-1):
+                    self.remote_frames.setdefault(player, -1)
+            if(self.rollback):
+                #both sides have to roll the same random numbers, or re-simulated frames won't match
+                random.seed(msgTick.seed)
             if(self.current_state == self.STATE_WAITING_FOR_OPPONENT):
                 self.current_state = self.STATE_PLAYING
             print("starting")
         if(msgFighter.isValid(msg)):
-            fromString = msgFighter.fromString(msg)
+            fromString = msgFighter.fromBytes(msg)
             receivedTime = msgFighter.frame
             frameDiff = receivedTime - self.tick_count
             if(frameDiff-1<self.buffer_size and frameDiff-1>-1):
                 self.fighter_buffer[frameDiff-1].append(fromString)#insert into buffer
         if(msgProgress.isValid(msg)):
-            fromString = msgProgress.fromString(msg)
+            fromString = msgProgress.fromBytes(msg)
             self.max_frame = fromString.frame
+    
+    def receiveInputs(self,_frame,_player,_events):
+        if(self.rollback):
+            if(_events):
+                self.remote_inputs.setdefault(_frame, []).extend(_events)
+                if(_frame < self.tick_count):#we guessed wrong, go back and play it again
+                    self.rollback_frame = _frame if self.rollback_frame is None else min(self.rollback_frame, _frame)
+            return
+        #print("received input for frame: "+str(_frame)+" current frame: "+str(self.tick_count))
+        frameDiff = self.buffer_size - (_frame - self.tick_count)
+        if(frameDiff<self.buffer_size and frameDiff>=0):
+            self.buffer[frameDiff].receivedFrom.setdefault(_player, []).extend(_events)#new entry, insert into buffer
+        else:
+            print("frame outside range"+str(_frame))
+            if _frame>=self.buffer_size:
+                #Note: should never get here, it means frame rates are out of sync by a lot
+                #but if we have hit this, try and re-sync frame count
+                print(str(self.tick_count)+" adjusted to: "+str(_frame-self.buffer_size+1))
+                self.tick_count = _frame-self.buffer_size+1
             
     def readFromNetwork(self):
         repeat = True
@@ -286,16 +508,22 @@ class Network(object):
             if self.connect_mode == self.SOCKET_MODE_UDP:
                 for f in readable:
                   if f is self.conn:
-                    msg,addr = f.recvfrom(self.MESSAGE_SIZE)
+                    msg,addr = f.recvfrom(MAX_MESSAGE_SIZE)
                     repeat = True#may be more than 1 message waiting to be read, catch up by looping until select returns nothing
                     self.handleMessage(msg)
             if self.connect_mode == self.SOCKET_MODE_TCP:
                 for f in readable:
                     if f is self.conn:
-                        msg,addr = f.recvfrom(self.MESSAGE_SIZE)              
-                        msg = msg.strip()
+                        data = f.recv(4096)
+                        if not data:
+                            print("Lost connection to the server")
+                            self.read_list.remove(f)
+                            continue
+                        #a read can end partway through a message, or hold several, so keep what's left for next time
+                        messages,self.received = unframeMessages(self.received+data)
                         repeat = True
-                        self.handleMessage(msg)
+                        for msg in messages:
+                            self.handleMessage(msg)
                         
     def processFighters(self,fighters):
         if(not self.enabled or
@@ -353,7 +581,7 @@ class Network(object):
                     #grabbing = None#??
                     #grabbed_by = None#??
                     #hit_tagged = None#??"""
-                self.send(msg.toString(), (self.serveraddr, self.serverport))
+                self.send(msg.toBytes(), (self.serveraddr, self.serverport))
         for fighter_message in nextFighterList:
             fighter_data = json.loads(fighter_message.json).items()
             print("updating fighter"+str(fighter_data.frame)+" "+str(self.tick_count))
@@ -0,0 +1,266 @@
+from __future__ import print_function
+import time
+import json
+import collections
+import pygame
+
+"""
+Frame timings for the battle loop. The loop marks the start and end of each frame, and each part of it
+in between, like the input, the network, the stage and each fighter's update, and the drawing. Sections can
+be inside other sections, so a fighter's collisionUpdate shows up inside its update.
+
+The last PROFILER_FRAMES frames are kept. They can be shown on screen with a ProfilerOverlay, or saved as
+a Chrome trace, which can be opened in chrome://tracing or https://ui.perfetto.dev to see every section of
+every frame laid out in time, with the fighter, action or article that each one was for.
+
+It's off unless it's turned on, and when it's off, marking a section costs one attribute check.
+"""
+#How many frames of timings are kept
+PROFILER_FRAMES = 600
+#How long a frame has, in milliseconds, at 60 frames a second
+FRAME_BUDGET = 1000.0 / 60
+#How often the overlay's numbers change, in frames
+OVERLAY_REFRESH_FRAMES = 15
+#How many inputs' latencies are kept
+LATENCY_SAMPLES = 600
+
+#The most accurate clock there is. Python 2 doesn't have perf_counter.
+timer = getattr(time, 'perf_counter', time.time)
+
+profiler = None
+
+def getProfiler():
+    global profiler
+    if profiler is None:
+        profiler = Profiler()
+    return profiler
+
+class Profiler(object):
+    def __init__(self,_frames=PROFILER_FRAMES):
+        self.enabled = False
+        self.frames = collections.deque(maxlen=_frames)
+        self.current_frame = None
+        self.open_sections = []
+        self.start_time = timer()
+
+    def enable(self,_enabled=True):
+        self.enabled = _enabled
+        if not _enabled:
+            self.current_frame = None
+            self.open_sections = []
+
+    def startFrame(self,_frame):
+        if not self.enabled: return
+        self.current_frame = ProfiledFrame(_frame,timer())
+        self.open_sections = []
+
+    def endFrame(self):
+        if self.current_frame is None: return
+        self.current_frame.end = timer()
+        self.frames.append(self.current_frame)
+        self.current_frame = None
+
+    """
+    Starts timing a section of the current frame, until the matching end. _args is anything worth knowing about
+    the section in the trace, like which action a fighter was in. It can also be a function that gives them,
+    so they're only worked out when they're kept. Does nothing outside of a frame.
+    """
+    def begin(self,_name,_args=None):
+        if self.current_frame is None: return
+        if callable(_args): _args = _args()
+        self.open_sections.append((_name,_args,timer()))
+
+    def end(self):
+        if self.current_frame is None or not self.open_sections: return
+        name,args,start = self.open_sections.pop()
+        self.current_frame.sections.append((name,args,start,timer()-start,len(self.open_sections)))
+
+    """
+    The same as begin and end, as a with block:
+        with profiler.section('stage'):
+            self.stage.update()
+    """
+    def section(self,_name,_args=None):
+        if self.current_frame is None: return NO_SECTION
+        return ProfiledSection(self,_name,_args)
+
+    """
+    The average milliseconds per frame spent in each section, over the last _frames frames, as a list
+    of (name, depth, milliseconds), in the order they first came up.
+    """
+    def getAverages(self,_frames=60):
+        frames = list(self.frames)[-_frames:]
+        if not frames: return []
+        totals = collections.OrderedDict()
+        for frame in frames:
+            for name,_,_,duration,depth in sorted(frame.sections, key=lambda section: section[2]):
+                totals[name] = (depth, totals.get(name, (depth, 0.0))[1] + duration)
+        return [(name, depth, 1000.0 * total / len(frames)) for name,(depth,total) in totals.items()]
+
+    #How long each of the last _frames frames took, in milliseconds, oldest first
+    def getFrameTimes(self,_frames=PROFILER_FRAMES):
+        return [1000.0 * frame.getDuration() for frame in list(self.frames)[-_frames:]]
+
+    """
+    Saves every frame that's been kept in the Chrome trace event format. Times in a trace are in microseconds.
+    """
+    def exportTrace(self,_path):
+        events = []
+        for frame in self.frames:
+            events.append({'name': 'frame '+str(frame.frame), 'cat': 'frame', 'ph': 'X', 'pid': 1, 'tid': 1,
+                           'ts': self.getMicroseconds(frame.start), 'dur': 1000000.0 * frame.getDuration(),
+                           'args': {'frame': frame.frame}})
+            for name,args,start,duration,_ in frame.sections:
+                events.append({'name': name, 'cat': 'section', 'ph': 'X', 'pid': 1, 'tid': 1,
+                               'ts': self.getMicroseconds(start), 'dur': 1000000.0 * duration,
+                               'args': args or {}})
+        with open(_path,'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+        return len(self.frames)
+
+    def getMicroseconds(self,_time):
+        return 1000000.0 * (_time - self.start_time)
+
+class ProfiledFrame(object):
+    def __init__(self,_frame,_start):
+        self.frame = _frame
+        self.start = _start
+        self.end = _start
+        #(name, args, start, duration, depth), in the order they ended
+        self.sections = []
+
+    def getDuration(self):
+        return self.end - self.start
+
+class ProfiledSection(object):
+    def __init__(self,_profiler,_name,_args):
+        self.profiler = _profiler
+        self.name = _name
+        self.args = _args
+
+    def __enter__(self):
+        self.profiler.begin(self.name,self.args)
+        return self
+
+    def __exit__(self,_type,_value,_traceback):
+        self.profiler.end()
+        return False
+
+#What section gives back when the profiler's off
+class NoSection(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self,_type,_value,_traceback):
+        return False
+
+NO_SECTION = NoSection()
+
+"""
+Input latency: how long it is from the battle getting an input from pygame to the first frame that shows it
+being put on the screen. The battle tells the meter when it got an input, when it passed its inputs to the
+fighters, when it simulated a frame and when it showed one, and each input is timed from the first to the last.
+pygame doesn't say when an event happened, so the time an input waited in the queue isn't counted. That's
+half a frame, on average.
+"""
+class LatencyMeter(object):
+    def __init__(self,_samples=LATENCY_SAMPLES):
+        #(seconds, frames shown), one for each input
+        self.samples = collections.deque(maxlen=_samples)
+        self.polled = []
+        self.passed = []
+        self.simulated = []
+        self.shown_frames = 0
+    
+    def inputPolled(self,_time):
+        self.polled.append((_time,self.shown_frames))
+    
+    def inputsPassed(self):
+        self.passed.extend(self.polled)
+        self.polled = []
+    
+    def frameSimulated(self):
+        self.simulated.extend(self.passed)
+        self.passed = []
+    
+    def frameShown(self):
+        now = timer()
+        self.shown_frames += 1
+        for polled_time,shown_frames in self.simulated:
+            self.samples.append((now - polled_time,self.shown_frames - shown_frames))
+        self.simulated = []
+    
+    """
+    The latencies so far, as a dict of how many inputs were timed, the mean, median, 99th percentile
+    and worst in milliseconds, and the mean number of frames shown before the one with the input in it.
+    None if nothing's been timed.
+    """
+    def getSummary(self):
+        if not self.samples: return None
+        milliseconds = sorted([1000.0 * seconds for seconds,_ in self.samples])
+        count = len(milliseconds)
+        return {'inputs': count,
+                'mean_ms': sum(milliseconds) / count,
+                'p50_ms': milliseconds[count // 2],
+                'p99_ms': milliseconds[min(count - 1, int(count * 0.99))],
+                'max_ms': milliseconds[-1],
+                'frames': float(sum([frames for _,frames in self.samples])) / count}
+
+"""
+Draws the profiler's numbers over the battle: a bar for each of the last few frames, red if it went over
+the frame budget, and the average time spent in each section. It has a rect and a draw like the rest of the
+GUI, so it can go in the battle's gui_objects. Drawing the text takes a while, so the panel is only rebuilt
+every OVERLAY_REFRESH_FRAMES frames.
+"""
+class ProfilerOverlay(object):
+    def __init__(self,_profiler,_latency=None,_topleft=(4,4)):
+        self.profiler = _profiler
+        self.latency = _latency
+        self.font = pygame.font.Font(None, 16)
+        self.graph_frames = 120
+        self.image = None
+        self.latest_frame = None
+        self.new_frames = 0
+        self.rect = pygame.Rect(_topleft,(0,0))
+
+    def draw(self,_screen,_offset,_scale):
+        latest_frame = self.profiler.frames[-1] if self.profiler.frames else None
+        if latest_frame is not self.latest_frame:
+            self.latest_frame = latest_frame
+            self.new_frames += 1
+        if self.image is None or self.new_frames >= OVERLAY_REFRESH_FRAMES:
+            self.buildImage()
+            self.new_frames = 0
+        self.rect.size = self.image.get_size()
+        return _screen.blit(self.image,_offset)
+
+    def buildImage(self):
+        averages = self.profiler.getAverages()
+        frame_times = self.profiler.getFrameTimes(self.graph_frames)
+        latency = self.latency.getSummary() if self.latency else None
+        line_height = self.font.get_linesize()
+        graph_height = 40
+        width = max(self.graph_frames * 2, 200)
+        height = graph_height + line_height * (len(averages) + 2) + 6
+
+        self.image = pygame.Surface((width,height), pygame.SRCALPHA, 32).convert_alpha()
+        self.image.fill((0,0,0,160))
+        #The frame budget is the line halfway up the graph
+        budget_y = graph_height // 2
+        for index,frame_time in enumerate(frame_times):
+            bar_height = min(graph_height, int(frame_time / FRAME_BUDGET * budget_y))
+            color = (220,60,60) if frame_time > FRAME_BUDGET else (60,200,60)
+            self.image.fill(color, pygame.Rect(index * 2, graph_height - bar_height, 2, bar_height))
+        self.image.fill((255,255,255), pygame.Rect(0, graph_height - budget_y, width, 1))
+
+        y = graph_height + 2
+        if frame_times:
+            total = sum(frame_times[-60:]) / len(frame_times[-60:])
+            self.image.blit(self.font.render('frame %5.2f ms (budget %.1f)' % (total, FRAME_BUDGET), True, (255,255,255)), (2,y))
+        y += line_height
+        if latency:
+            self.image.blit(self.font.render('input %5.2f ms, p99 %.2f, %.1f frames' % (latency['mean_ms'], latency['p99_ms'], latency['frames']), True, (255,255,255)), (2,y))
+        y += line_height
+        for name,depth,milliseconds in averages:
+            self.image.blit(self.font.render('%s%s %5.2f ms' % ('  ' * depth, name, milliseconds), True, (255,255,255)), (2,y))
+            y += line_height
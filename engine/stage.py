@@ -3,6 +3,11 @@ import pygame
 import spriteManager
 import settingsManager
 import math
+import engine.collisionBox as collisionBox
+from global_functions import *
+
+#How many frames a layer's sprites have to hold still before the layer is drawn into one image
+LAYER_SETTLE_FRAMES = 60
 
 class Stage():
     def __init__(self):
@@ -11,6 +16,13 @@ class Stage():
         self.platform_list = []
         self.platform_ledges = []
         
+        #Collision checks look platforms and ledges up in these, instead of going through every one.
+        #They're built the first time they're needed, see getPlatformIndex
+        self.platform_index = None
+        self.ledge_index = None
+        #Goes up whenever the platforms change in a way the indexes can't see, see invalidatePlatforms
+        self.platform_version = 0
+        
         #Entities are updated whenever the frame is drawn.
         #If it changes at all on the stage, it is an entity
         self.entity_list = []
@@ -38,6 +50,10 @@ class Stage():
         self.foreground_sprites = []
         self.background_color = [100, 100, 100]
         
+        #The sprites above, grouped into layers that are drawn as one image. See getLayers.
+        self.background_layers = []
+        self.foreground_layers = []
+        
     """
     Puts the camera in the proper position.
     This MUST be called after creation.
@@ -63,7 +79,47 @@ class Stage():
             for ledge in plat.ledges:
                 if ledge != None:
                     self.platform_ledges.append(ledge)
+        self.invalidatePlatforms()
         return self.platform_ledges
+    
+    """
+    Returns a spatial index of the platforms, for collisionBox to check against.
+    Moving platforms, and any platform that's also an entity, are left out of the grid and always checked.
+    If platforms have been added, taken away or swapped since the index was built, it's built again.
+    """
+    def getPlatformIndex(self):
+        if self.platform_index is None or not self.platform_index.isCurrent(self.platform_list, self.platform_version):
+            moving = [plat for plat in self.platform_list if isinstance(plat, MovingPlatform) or plat in self.entity_list]
+            self.platform_index = collisionBox.SpatialIndex(self.platform_list, moving, _version=self.platform_version)
+        return self.platform_index
+    
+    def getLedgeIndex(self):
+        if self.ledge_index is None or not self.ledge_index.isCurrent(self.platform_ledges, self.platform_version):
+            self.ledge_index = collisionBox.SpatialIndex(self.platform_ledges, _version=self.platform_version)
+        return self.ledge_index
+    
+    """
+    Call this after moving a platform or ledge that isn't a MovingPlatform, or changing platforms any
+    other way the indexes can't see, so they're built again the next time they're needed.
+    """
+    def invalidatePlatforms(self):
+        self.platform_version += 1
+    
+    """
+    Snapshot the stage, for rollback and replay seeking. Platforms and entities are saved
+    along with it, since moving platforms and stage articles change from frame to frame.
+    """
+    def saveState(self):
+        objects = self.platform_list + [entity for entity in self.entity_list if entity not in self.platform_list]
+        return (getObjectState(self),[(obj,obj.saveState()) for obj in objects])
+    
+    def loadState(self,_state):
+        setObjectState(self,_state[0])
+        for obj,obj_state in _state[1]:
+            obj.loadState(obj_state)
+        #Loading can put platforms back where they were
+        self.invalidatePlatforms()
+    
     """
     The frame-by-frame changes to the stage.
     Updates all entities, then moves the camera closer to its preferred size
@@ -223,16 +279,44 @@ class Stage():
             print("Scaling Error", h, w, abs(h-w), self.zoom_level)
             return w
         
+    """
+    Everything the drawn background and foreground depend on: where the camera is, and where each of their
+    sprites is and what it looks like. When this is the same as last frame, the battle can keep using what it
+    drew of them last frame, instead of drawing them again.
+    """
+    def getLayerKey(self):
+        sprites = [sprite for sprite,_ in self.background_sprites] + self.foreground_sprites
+        platforms = None
+        if settingsManager.getSetting('showPlatformLines'):
+            platforms = tuple(tuple(plat.rect) for plat in self.platform_list)
+        return (tuple(self.camera_position), self.getScale(), tuple(self.background_color), platforms,
+                tuple(sprite.getDrawKey() for sprite in sprites))
+    
+    """
+    Groups _sprites, a list of (sprite, paralax), into layers of sprites next to each other in the list with
+    the same paralax. _layers is the list of layers from last time, which are kept if they haven't changed.
+    """
+    def getLayers(self,_sprites,_layers):
+        groups = []
+        for sprite,paralax in _sprites:
+            if groups and groups[-1][0] == paralax:
+                groups[-1][1].append(sprite)
+            else:
+                groups.append((paralax,[sprite]))
+        if [(layer.paralax,layer.sprites) for layer in _layers] == groups:
+            return _layers
+        for layer in _layers:
+            layer.forget()
+        return [StageLayer(sprites,paralax) for paralax,sprites in groups]
+    
     """
     Draws the background elements in order.
     """
     def drawBG(self,_screen):
         rects = []
-        for sprite,paralax in self.background_sprites:
-            x = sprite.rect.x - (self.camera_position.x * paralax)
-            y = sprite.rect.y - (self.camera_position.y)
-            rect = sprite.draw(_screen,(x,y),self.getScale())
-            if rect: rects.append(rect)
+        self.background_layers = self.getLayers(self.background_sprites,self.background_layers)
+        for layer in self.background_layers:
+            rects.extend(layer.draw(_screen,self.camera_position,self.getScale()))
         return rects
             
     def drawFG(self,_screen):
@@ -245,9 +329,9 @@ class Stage():
         #for ledge in self.platform_ledges:
             #ledgeSprite = spriteObject.RectSprite(ledge.rect.topleft,ledge.rect.size,[0,0,255])
             #ledgeSprite.draw(_screen,self.stageToScreen(ledge.rect),self.getScale())
-        for sprite in self.foreground_sprites:
-            rect = sprite.draw(_screen,self.stageToScreen(sprite.rect),self.getScale())
-            if rect: rects.append(rect)
+        self.foreground_layers = self.getLayers([(sprite,1.0) for sprite in self.foreground_sprites],self.foreground_layers)
+        for layer in self.foreground_layers:
+            rects.extend(layer.draw(_screen,self.camera_position,self.getScale()))
         return rects
     
     """
@@ -256,6 +340,67 @@ class Stage():
     """
     def addToBackground(self,_sprite,_paralaxFactor = 1.0):
         self.background_sprites.append((_sprite,_paralaxFactor))
+
+"""
+Background or foreground sprites with the same paralax, drawn in order. Once none of them have moved or
+changed for LAYER_SETTLE_FRAMES frames, they're drawn together into one image the size of all of them,
+and from then on the layer is drawn as that image, one blit, and one smoothscale for each zoom level it's
+drawn at, which the transform cache keeps. If a sprite changes, the image is thrown out and the sprites
+are drawn one at a time again until they've held still long enough.
+Sprites that change all the time, like scrolling backgrounds and moving platforms, never settle, so
+they should have a layer to themselves, with a different paralax to the sprites next to them.
+"""
+class StageLayer():
+    def __init__(self,_sprites,_paralax):
+        self.sprites = _sprites
+        self.paralax = _paralax
+        self.key = None
+        self.held = 0
+        self.image = None
+        self.rect = None #Where the image goes, in stage coordinates
+    
+    def draw(self,_screen,_camera,_scale):
+        key = tuple(sprite.getDrawKey() for sprite in self.sprites)
+        if key != self.key:
+            self.key = key
+            self.held = 0
+            self.forget()
+        elif self.image is None:
+            self.held += 1
+            if self.held >= LAYER_SETTLE_FRAMES:
+                self.compose()
+        
+        if self.image is None:
+            rects = []
+            for sprite in self.sprites:
+                x = sprite.rect.x - (_camera.x * self.paralax)
+                y = sprite.rect.y - (_camera.y)
+                rect = sprite.draw(_screen,(x,y),_scale)
+                if rect: rects.append(rect)
+            return rects
+        
+        w = int(self.rect.width * _scale)
+        h = int(self.rect.height * _scale)
+        if w <= 0 or h <= 0: return []
+        x = self.rect.x - (_camera.x * self.paralax)
+        y = self.rect.y - (_camera.y)
+        return [_screen.blit(spriteManager.getTransformCache().get(self.image,(w,h)),(int(x * _scale),int(y * _scale)))]
+    
+    def compose(self):
+        #A rotated or scaled sprite draws outside its rect, so a layer with one in it is left as it is
+        if [sprite for sprite in self.sprites if sprite.angle != 0 or sprite.scale != 1 or tuple(sprite.spriteOffset) != (0,0)]:
+            return
+        rects = [sprite.rect for sprite in self.sprites if sprite.visible]
+        if not rects: return
+        self.rect = rects[0].unionall(rects[1:])
+        self.image = pygame.Surface(self.rect.size, pygame.SRCALPHA, 32).convert_alpha()
+        for sprite in self.sprites:
+            sprite.draw(self.image,(sprite.rect.x - self.rect.x,sprite.rect.y - self.rect.y),1)
+    
+    def forget(self):
+        if self.image is not None:
+            spriteManager.getTransformCache().forget(self.image)
+        self.image = None
 """
 Platforms for the stage.
 Given two points (as a tuple of XY coordinates), it will
@@ -293,6 +438,14 @@ class Platform(pygame.sprite.Sprite):
     
     def ledgeGrabbed(self,_fighter):
         pass
+    
+    def saveState(self):
+        return (getObjectState(self),[getObjectState(ledge) for ledge in self.ledges if ledge])
+    
+    def loadState(self,_state):
+        setObjectState(self,_state[0])
+        for ledge,ledge_state in zip([ledge for ledge in self.ledges if ledge],_state[1]):
+            setObjectState(ledge,ledge_state)
         
     def getDirectionBetweenPoints(self, _p1, _p2):
         (x1, y1) = _p1
@@ -9,6 +9,11 @@ from ast import literal_eval as make_tuple
 import settingsManager
 import builder.dataSelector as dataSelector
 
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
 """
 TODO -
     EnableAction
@@ -288,34 +293,82 @@ class FuncData():
 
 """
 An object that will execute a line of python code and returns its return value
-Pulls data at runtime
+Pulls data at runtime, but the code is only compiled once, when it's loaded
 """
 class EvalData(object):
     def __init__(self,_scope,_str):
         self.str = _str
         self.scope = _scope
+        self.code = compile(_str, '<eval>', 'eval')
         
     def unpack(self,_action,_actor):
-        if self.scope == 'action':
-            working_locals = {field: getattr(_action, field) for field in dir(_action)}
-        elif self.scope == 'actor':
-            if hasattr(_actor, 'owner'):
-                _actor = _actor.owner
-            working_locals = {field: getattr(_actor, field) for field in dir(_actor)}
-        elif self.scope == 'article' and hasattr(_actor, 'owner'):
-            working_locals = {field: getattr(_actor, field) for field in dir(_actor)}
-        elif self.scope == 'object':
-            working_locals = {field: getattr(_actor, field) for field in dir(_actor)}
-        elif self.scope == 'global':
-            working_locals = globals()
-        elif self.scope == 'battle':
-            working_locals = {field: getattr(_actor.game_state, field) for field in dir(_actor.game_state)}
-        elif self.scope == 'local':
-            working_locals = locals()
-        else:
-            print(self.scope + " is not a valid scope")
+        working_locals = getCodeScope(self.scope,_action,_actor)
+        if working_locals is None:
             return None
-        return eval(self.str, globals(), working_locals)
+        return eval(self.code, getSandbox(), working_locals)
+    
+    #Code can't be pickled, so it's compiled again when it's loaded
+    def __getstate__(self):
+        return {'str': self.str, 'scope': self.scope}
+    
+    def __setstate__(self,_state):
+        self.__init__(_state['scope'],_state['str'])
+
+#The only builtins code in an exec or eval gets to use. There's no import, open, or anything
+#else that reaches outside of the game. This keeps fighter files honest, it's not a security boundary.
+sandbox_builtins = dict([(name, getattr(builtins, name)) for name in [
+    'abs', 'all', 'any', 'bool', 'dict', 'divmod', 'enumerate', 'filter', 'float', 'hasattr', 'int',
+    'isinstance', 'len', 'list', 'map', 'max', 'min', 'pow', 'range', 'reversed', 'round', 'set',
+    'sorted', 'str', 'sum', 'tuple', 'zip', 'True', 'False', 'None']])
+
+def getSandbox():
+    return {'__builtins__': sandbox_builtins}
+
+"""
+The variables an exec or eval can see, for the scope it's been given. Attributes of the
+action, actor or battle are looked up when the code uses them, instead of all being copied in first.
+"""
+class AttributeScope(object):
+    def __init__(self,_target):
+        self.target = _target
+        self.assigned = dict()
+        
+    def __getitem__(self,_name):
+        if _name in self.assigned:
+            return self.assigned[_name]
+        try:
+            return getattr(self.target, _name)
+        except AttributeError:
+            raise KeyError(_name)
+    
+    #Anything the code sets is kept here, the same as it would have been in a copy of the attributes.
+    #It doesn't change the object itself.
+    def __setitem__(self,_name,_value):
+        self.assigned[_name] = _value
+        
+    def __delitem__(self,_name):
+        del self.assigned[_name]
+
+def getCodeScope(_scope,_action,_actor):
+    if _scope == 'action':
+        return AttributeScope(_action)
+    elif _scope == 'actor':
+        if hasattr(_actor, 'owner'):
+            _actor = _actor.owner
+        return AttributeScope(_actor)
+    elif _scope == 'article' and hasattr(_actor, 'owner'):
+        return AttributeScope(_actor)
+    elif _scope == 'object':
+        return AttributeScope(_actor)
+    elif _scope == 'global':
+        return dict()
+    elif _scope == 'battle':
+        return AttributeScope(_actor.game_state)
+    elif _scope == 'local':
+        return {'_action': _action, '_actor': _actor}
+    else:
+        print(_scope + " is not a valid scope")
+        return None
     
 """
 Used for building subActions dynamically. Each one has a path to get to its XML data,
@@ -482,6 +535,20 @@ class SubAction():
         for tag,variable in self.defaultVars.iteritems():
             if isinstance(variable, VarData) or isinstance(variable, FuncData) or isinstance(variable, EvalData):
                 setattr(self, tag, variable.unpack(_action,_actor))
+    
+    # True if any of this subaction's fields are looked up when it runs, instead of being set in the XML.
+    def isDynamic(self):
+        for variable in self.defaultVars.values():
+            if isinstance(variable, VarData) or isinstance(variable, FuncData) or isinstance(variable, EvalData):
+                return True
+        return False
+    
+    # Turns this subaction into a function of (action, actor) for the action's compiled frame tables.
+    # _action is the action it's being compiled for. Subactions that dispatch on strings or look things
+    # up by name every time they run should override this to do that once, here. Anything dynamic has to
+    # unpack its fields every time anyway, so by default this just runs execute.
+    def compile(self, _action):
+        return self.execute
                 
     def getDisplayName(self):
         return ''
@@ -501,4 +568,19 @@ class SubAction():
     
     @staticmethod
     def buildFromXml(_name,_node):
-        subactionFactory.buildFromXml(_name, _node)
\ No newline at end of file
+        subactionFactory.buildFromXml(_name, _node)
+
+def doNothing(_action,_actor):
+    return None
+
+# Compiles a list of subactions into one function of (action, actor) that runs them all in order.
+def compileSubactions(_subactions,_action):
+    functions = tuple([subact.compile(_action) for subact in _subactions])
+    if len(functions) == 0:
+        return doNothing
+    if len(functions) == 1:
+        return functions[0]
+    def runSubactions(_action,_actor):
+        for function in functions:
+            function(_action,_actor)
+    return runSubactions
\ No newline at end of file
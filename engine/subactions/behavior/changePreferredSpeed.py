@@ -16,36 +16,38 @@ class changeFighterPreferredSpeed(SubAction):
         
     def execute(self, _action, _actor):
         SubAction.execute(self, _action, _actor)
-        if self.speed_x is not None:
-            if type(self.speed_x) is tuple:
-                owner,value = self.speed_x
+        speed_x = self.speed_x
+        speed_y = self.speed_y
+        if speed_x is not None:
+            if type(speed_x) is tuple:
+                owner,value = speed_x
                 if owner == 'actor':
                     if hasattr(_actor, 'owner'):
                         _actor = _actor.owner
-                    self.speed_x = _actor.stats[value]
+                    speed_x = _actor.stats[value]
                 elif owner == 'object' and hasattr(_actor, 'stats'):
-                    self.speed_x = _actor.stats[value]
+                    speed_x = _actor.stats[value]
                 elif owner == 'article' and hasattr(_actor, 'owner'):
-                    self.speed_x = _actor.owner.stats[value]
+                    speed_x = _actor.owner.stats[value]
                 elif owner == 'action':
-                    self.speed_x = getattr(self, value)
-            if self.x_relative: _actor.preferred_xspeed = self.speed_x*_actor.facing
-            else: _actor.preferred_xspeed = self.speed_x
+                    speed_x = getattr(self, value)
+            if self.x_relative: _actor.preferred_xspeed = speed_x*_actor.facing
+            else: _actor.preferred_xspeed = speed_x
             
-        if self.speed_y is not None:
-            if type(self.speed_y) is tuple:
-                owner,value = self.speed_y
+        if speed_y is not None:
+            if type(speed_y) is tuple:
+                owner,value = speed_y
                 if owner == 'actor':
                     if hasattr(_actor, 'owner'):
                         _actor = _actor.owner
-                    self.speed_y = _actor.stats[value]
+                    speed_y = _actor.stats[value]
                 elif owner == 'object' and hasattr(_actor, 'stats'):
-                    self.speed_y = _actor.stats[value]
+                    speed_y = _actor.stats[value]
                 elif owner == 'article' and hasattr(_actor, 'owner'):
-                    self.speed_y = _actor.stats[value]
+                    speed_y = _actor.stats[value]
                 elif owner == 'action':
-                    self.speed_y = getattr(self, value)
-            _actor.preferred_yspeed = self.speed_y
+                    speed_y = getattr(self, value)
+            _actor.preferred_yspeed = speed_y
     
     def getPropertiesPanel(self, _root):
         return subactionSelector.ChangeSpeedProperties(_root,self)
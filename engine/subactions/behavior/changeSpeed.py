@@ -23,41 +23,44 @@ class changeFighterSpeed(SubAction):
         
     def execute(self, _action, _actor):
         SubAction.execute(self, _action, _actor)
+        speed_x = self.speed_x
+        speed_y = self.speed_y
         if self.direction is not None and self.magnitude is not None:
             x,y = settingsManager.getXYFromDM(self.direction,self.magnitude)
             _actor.change_x = x
             _actor.change_y = y    
         else:
-            if self.speed_x is not None:
-                if type(self.speed_x) is tuple:
-                    owner,value = self.speed_x
+            if speed_x is not None:
+                if type(speed_x) is tuple:
+                    owner,value = speed_x
                     if owner == 'actor':
                         if hasattr(_actor, 'owner'):
                             _actor = _actor.owner
-                        self.speed_x = _actor.stats[value]
+                        speed_x = _actor.stats[value]
                     elif owner == 'object' and hasattr(_actor, 'stats'):
-                        self.speed_x = _actor.stats[value]
+                        speed_x = _actor.stats[value]
                     elif owner == 'article' and hasattr(_actor, 'owner'):
-                        self.speed_x = _actor.stats[value]
+                        speed_x = _actor.stats[value]
                     elif owner == 'action':
-                        self.speed_x = getattr(self, value)
-                if self.x_relative: _actor.change_x = self.speed_x*_actor.facing
-                else: _actor.change_x = self.speed_x
+                        speed_x = getattr(self, value)
+                if self.x_relative: _actor.change_x = speed_x*_actor.facing
+                else: _actor.change_x = speed_x
             
-            if self.speed_y is not None:
-                if type(self.speed_y) is tuple:
+            if speed_y is not None:
+                if type(speed_y) is tuple:
+                    owner,value = speed_y
                     if owner == 'actor':
                         if hasattr(_actor, 'owner'):
                             _actor = _actor.owner
-                        self.speed_y = _actor.stats[value]
+                        speed_y = _actor.stats[value]
                     elif owner == 'object' and hasattr(_actor, 'stats'):
-                        self.speed_y = _actor.stats[value]
+                        speed_y = _actor.stats[value]
                     elif owner == 'article' and hasattr(_actor, 'owner'):
-                        self.speed_y = _actor.stats[value]
+                        speed_y = _actor.stats[value]
                     elif owner == 'action':
-                        self.speed_y = getattr(self, value)
-                if self.y_relative:_actor.change_y += self.speed_y
-                else: _actor.change_y = self.speed_y
+                        speed_y = getattr(self, value)
+                if self.y_relative:_actor.change_y += speed_y
+                else: _actor.change_y = speed_y
         
         
     def getPropertiesPanel(self, _root):
@@ -1,4 +1,18 @@
 from engine.subaction import *
+import operator
+
+#The comparisons an If can make, by the name it's given in the XML
+comparators = {'==': operator.eq,
+               '!=': lambda var,val: not var == val,
+               '>=': operator.ge,
+               '<=': operator.le,
+               '>': operator.gt,
+               '<': operator.lt,
+               'is': operator.is_,
+               'is not': operator.is_not,
+               'true': lambda var,val: bool(var),
+               'false': lambda var,val: not bool(var)
+               }
 
 class If(SubAction):
     subact_group = 'Control'
@@ -59,10 +73,6 @@ class If(SubAction):
             function = lambda var,val: not bool(var)
             
         cond = function(variable,self.value)
-        print(self.source,self.variable,self.value)
-        print('COND',cond)
-        print('EVENTS',_action.events)
-        print(self.if_actions,self.else_actions)
         
         if cond:
             if self.if_actions and _action.events.has_key(self.if_actions):
@@ -74,6 +84,44 @@ class If(SubAction):
                 for act in _action.events[self.else_actions]:
                     act.execute(_action,_actor)
     
+    def compile(self, _action):
+        comparator = comparators.get(self.function)
+        if self.variable == '' or comparator is None or self.isDynamic():
+            return SubAction.compile(self, _action)
+        variable = self.variable
+        value = self.value
+        if_actions = self.if_actions
+        else_actions = self.else_actions
+        
+        if self.source == 'fighter' or self.source == 'actor':
+            def getVariable(_action,_actor):
+                if hasattr(_actor, 'stats') and variable in _actor.stats:
+                    return _actor.stats[variable]
+                elif variable in _actor.variables:
+                    return _actor.variables[variable]
+                return getattr(_actor, variable)
+        elif self.source == 'article':
+            def getVariable(_action,_actor):
+                if hasattr(_actor, 'owner'):
+                    return _actor.variables[variable]
+                return getattr(_action, variable)
+        elif self.source == 'object':
+            getVariable = lambda _action,_actor: _actor.variables[variable]
+        else:
+            getVariable = lambda _action,_actor: getattr(_action, variable)
+        use_owner = self.source == 'fighter' or self.source == 'actor'
+        
+        def runIf(_action,_actor):
+            if use_owner and hasattr(_actor, 'owner'):
+                _actor = _actor.owner
+            if comparator(getVariable(_action,_actor), value):
+                event_name = if_actions
+            else:
+                event_name = else_actions
+            if event_name and event_name in _action.compiled_events:
+                _action.compiled_events[event_name](_action,_actor)
+        return runIf
+    
     def getPropertiesPanel(self, _root):
         return subactionSelector.IfProperties(_root,self)
                     
@@ -12,6 +12,12 @@ class doAction(SubAction):
     def execute(self, _action, _actor):
         SubAction.execute(self, _action, _actor)
         _actor.doAction(self.action)
+    
+    def compile(self, _action):
+        if self.isDynamic():
+            return SubAction.compile(self, _action)
+        action_name = self.action
+        return lambda _action,_actor: _actor.doAction(action_name)
         
     def getDisplayName(self):
         return 'Change Action: ' + self.action
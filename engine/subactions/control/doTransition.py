@@ -14,6 +14,14 @@ class transitionState(SubAction):
         if baseActions.state_dict.has_key(self.transition):
             baseActions.state_dict[self.transition](_actor)
     
+    def compile(self, _action):
+        if self.isDynamic():
+            return SubAction.compile(self, _action)
+        transition = baseActions.state_dict.get(self.transition)
+        if transition is None:
+            return doNothing
+        return lambda _action,_actor: transition(_actor)
+    
     def getPropertiesPanel(self, _root):
         return subactionSelector.TransitionProperties(_root,self)
     
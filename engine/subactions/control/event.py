@@ -12,6 +12,9 @@ class Event(SubAction):
         for subact in self.event_subactions:
             subact.execute(_action,_actor)
     
+    def compile(self, _action):
+        return compileSubactions(self.event_subactions, _action)
+    
     def getPropertiesPanel(self, _root):
         return None
                     
@@ -8,30 +8,38 @@ class executeCode(SubAction):
     def __init__(self):
         SubAction.__init__(self)
         self.codeString = ''
+        self.code = None
+        self.compiled_string = None
+    
+    #Compiles the code the first time it's needed, and again if it's been edited since.
+    def getCode(self):
+        if self.code is None or self.compiled_string != self.codeString:
+            self.code = compile(self.codeString, '<exec>', 'exec')
+            self.compiled_string = self.codeString
+        return self.code
+    
+    #Code can't be pickled, so getCode compiles it again after it's loaded
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['code'] = None
+        return state
         
     def execute(self, _action, _actor):
         SubAction.execute(self, _action, _actor)
-        if self.scope == 'action':
-            working_locals = {field: getattr(_action, field) for field in dir(_action)}
-        elif self.scope == 'actor':
-            if hasattr(_actor, 'owner'):
-                working_locals = {field: getattr(_actor.owner, field) for field in dir(_actor.owner)}
-            else:
-                working_locals = {field: getattr(_actor, field) for field in dir(_actor)}
-        elif self.scope == 'object':
-            working_locals = {field: getattr(_actor, field) for field in dir(_actor)}
-        elif self.scope == 'article' and hasattr(_actor, 'owner'):
-            working_locals = {field: getattr(_actor, field) for field in dir(_actor)}
-        elif self.scope == 'global':
-            working_locals = globals()
-        elif self.scope == 'battle':
-            working_locals = {field: getattr(_actor.game_state, field) for field in dir(_actor.game_state)}
-        elif self.scope == 'local':
-            working_locals = locals()
-        else:
-            print(self.scope + " is not a valid scope")
-            return None
-        exec self.codeString in globals(), working_locals
+        working_locals = getCodeScope(self.scope,_action,_actor)
+        if working_locals is not None:
+            exec(self.getCode(), getSandbox(), working_locals)
+    
+    def compile(self, _action):
+        if self.isDynamic():
+            return SubAction.compile(self, _action)
+        code = self.getCode()
+        scope = self.scope
+        def runCode(_action,_actor):
+            working_locals = getCodeScope(scope,_action,_actor)
+            if working_locals is not None:
+                exec(code, getSandbox(), working_locals)
+        return runCode
 
     def getDisplayName(self):
         return 'Execute ' + self.codeString + ' in the ' + self.scope + ' scope'
\ No newline at end of file
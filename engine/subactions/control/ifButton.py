@@ -61,6 +61,60 @@ class ifButton(SubAction):
                 for act in _action.events[self.else_actions]:
                     act.execute(_action,_actor)
     
+    def compile(self, _action):
+        if self.isDynamic():
+            return SubAction.compile(self, _action)
+        if self.button == '':
+            return doNothing
+        button = self.button
+        buffer_from = self.buffer_from
+        buffer_to = self.buffer_to
+        threshold = self.threshold
+        beyond_action = self.beyond_action
+        if_actions = self.if_actions
+        else_actions = self.else_actions
+        
+        if self.check == 'keysContain':
+            check = lambda _actor,_button,_from: _actor.keysContain(_button, threshold)
+        elif self.check == 'keyBuffered':
+            check = lambda _actor,_button,_from: _actor.keyBuffered(_button, _from, threshold, buffer_to)
+        elif self.check == 'keyTapped':
+            check = lambda _actor,_button,_from: _actor.keyTapped(_button, _from, threshold, buffer_to)
+        elif self.check == 'keyHeld':
+            check = lambda _actor,_button,_from: _actor.keyHeld(_button, _from, threshold, buffer_to)
+        elif self.check == 'keyUp':
+            check = lambda _actor,_button,_from: _actor.keyUp(_button, _from, threshold, buffer_to)
+        elif self.check == 'keyReinput':
+            check = lambda _actor,_button,_from: _actor.keyReinput(_button, _from, threshold, buffer_to)
+        elif self.check == 'keyIdle':
+            check = lambda _actor,_button,_from: _actor.keyIdle(_button, _from, threshold, buffer_to)
+        elif self.check == 'smash':
+            check = lambda _actor,_button,_from: _actor.checkSmash(_button)
+        elif self.check == 'tap':
+            check = lambda _actor,_button,_from: _actor.checkTap(_button)
+        else:
+            return doNothing
+        
+        def runIfButton(_action,_actor):
+            if button == 'forward':
+                working_button = _actor.getForwardBackwardKeys()[0]
+            elif button == 'backward':
+                working_button = _actor.getForwardBackwardKeys()[1]
+            else:
+                working_button = button
+            if beyond_action:
+                working_from = buffer_from
+            else:
+                working_from = max(min(_actor.last_input_frame, buffer_from), 1)
+            
+            if check(_actor, working_button, working_from):
+                event_name = if_actions
+            else:
+                event_name = else_actions
+            if event_name and event_name in _action.compiled_events:
+                _action.compiled_events[event_name](_action,_actor)
+        return runIfButton
+    
     def getPropertiesPanel(self, _root):
         return subactionSelector.IfButtonProperties(_root,self)
     
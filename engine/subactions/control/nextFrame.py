@@ -9,6 +9,11 @@ class nextFrame(SubAction):
         SubAction.execute(self, _action, _actor)
         _action.frame += 1
     
+    def compile(self, _action):
+        def runNextFrame(_action,_actor):
+            _action.frame += 1
+        return runNextFrame
+    
     def getDisplayName(self):
         return 'Next Frame'
 
@@ -18,6 +18,18 @@ class changeActionFrame(SubAction):
         if self.relative: _action.frame += self.new_frame
         else: _action.frame = self.new_frame
     
+    def compile(self, _action):
+        if self.isDynamic():
+            return SubAction.compile(self, _action)
+        new_frame = self.new_frame
+        if self.relative:
+            def runSetFrame(_action,_actor):
+                _action.frame += new_frame
+        else:
+            def runSetFrame(_action,_actor):
+                _action.frame = new_frame
+        return runSetFrame
+    
     def getPropertiesPanel(self, _root):
         return subactionSelector.ChangeFrameProperties(_root,self)
     
@@ -18,11 +18,24 @@ class changeFighterSubimage(SubAction):
         
         if isinstance(_action, engine.article.Article) or isinstance(_action, engine.article.DynamicArticle):
             _actor = _action
-        print(_actor,_action,self.index)
         _action.sprite_rate = 0 #sprite_rate has been broken, so we have to ignore it from now on
         #TODO changeSpriteRate subaction
         if self.relative: _actor.changeSpriteImage(self.index+_actor.sprite.index, _action.loop)
         else: _actor.changeSpriteImage(self.index, _action.loop)
+    
+    def compile(self, _action):
+        if self.isDynamic() or isinstance(_action, engine.article.Article) or isinstance(_action, engine.article.DynamicArticle):
+            return SubAction.compile(self, _action)
+        index = self.index
+        if self.relative:
+            def runChangeSubimage(_action,_actor):
+                _action.sprite_rate = 0
+                _actor.changeSpriteImage(index+_actor.sprite.index, _action.loop)
+        else:
+            def runChangeSubimage(_action,_actor):
+                _action.sprite_rate = 0
+                _actor.changeSpriteImage(index, _action.loop)
+        return runChangeSubimage
         
     def getDisplayName(self):
         return 'Change Subimage: '+str(self.index)
@@ -1,4 +1,6 @@
 import math
+import weakref
+import pygame
 
 def getXYFromDM(_direction,_magnitude):
     """A helper function to get the X and Y magnitudes from the Direction and Magnitude of a trajectory
@@ -42,4 +44,62 @@ def hasClass(_object, _class):
     _class : String
         The name of the class we are checking for
     """
-    return _class in list(map(lambda x :x.__name__,_object.__class__.__bases__)) + [_object.__class__.__name__]
\ No newline at end of file
+    return _class in list(map(lambda x :x.__name__,_object.__class__.__bases__)) + [_object.__class__.__name__]
+
+def getObjectState(_object):
+    """ Take a snapshot of an object's attributes, to be put back later with setObjectState.
+    This is what most saveState methods are built on. Attributes are stored by reference, except for
+    the things that tend to be changed in place (lists, dicts, sets, rects and sprite groups), which get
+    a shallow copy. Anything deeper than that, like the state of a child object, needs saving on its own.
+    
+    Parameters
+    -----------
+    _object : Object
+        The object to take a snapshot of
+        
+    Return
+    -----------
+    A tuple of the attribute dict, and the copies of its containers
+    """
+    attributes = _object.__dict__.copy()
+    # Group membership is saved by the groups, so leave pygame's own bookkeeping alone
+    attributes.pop('_Sprite__g', None)
+    containers = dict()
+    for name,value in attributes.items():
+        if isinstance(value, list):
+            containers[name] = value[:]
+        elif isinstance(value, (dict, set)):
+            containers[name] = value.copy()
+        elif isinstance(value, (weakref.WeakSet, pygame.sprite.AbstractGroup)):
+            containers[name] = list(value)
+        elif isinstance(value, pygame.Rect):
+            containers[name] = tuple(value)
+    return (attributes, containers)
+
+def setObjectState(_object, _state):
+    """ Put an object back the way it was when getObjectState was called on it. Containers are
+    restored in place, so anything else holding on to them (like the stage following a fighter's rect) sees the change.
+    
+    Parameters
+    -----------
+    _object : Object
+        The object to restore
+    _state : tuple
+        A snapshot from getObjectState
+    """
+    attributes,containers = _state
+    groups = _object.__dict__.get('_Sprite__g')
+    _object.__dict__.clear()
+    _object.__dict__.update(attributes)
+    if groups is not None:
+        _object.__dict__['_Sprite__g'] = groups
+    for name,value in containers.items():
+        container = attributes[name]
+        if isinstance(container, (list, pygame.Rect)):
+            container[:] = value
+        elif isinstance(container, pygame.sprite.AbstractGroup):
+            container.empty()
+            container.add(*value)
+        else:
+            container.clear()
+            container.update(value)
@@ -1,152 +1,167 @@
-import socket
-import select
-import sys
-import json
+import asyncio
+import random
 import settingsManager
-
-#remove this import if removing debug code
-import time
+import engine.network as network
 
 #lightweight server, for the most part just statelessly bounces messages between players
-#the state it does handle, is number of players online and what frame they can progress to
+#the state it does handle, is which room each player is in, and what frame each room can progress to
+#this needs python 3.5 or newer, for asyncio, so the build's compile check leaves it out, see .travis.yml
+
+"""
+A match being played, or waiting for players. Players are kept in the order they joined,
+which is the order they get their player numbers in.
+"""
+class Room(object):
+  def __init__(self, name, size):
+    self.name = name
+    self.size = size
+    self.players = {}
+
+  def isFull(self):
+    return len(self.players) >= self.size
+
+  def start(self, server):
+    seed = random.randrange(2**31)#everyone gets the same seed, so rollback clients stay in sync
+    playerno = 1#give each player a unique number
+    for player in self.players:
+      onlineMsg = network.NetworkTickMessage()
+      onlineMsg.playerno = playerno
+      onlineMsg.players = len(self.players)
+      onlineMsg.seed = seed
+      playerno += 1
+      server.send(onlineMsg.toBytes(), player)
+
+  def broadcast(self, server, msg, sender=None):
+    for player in self.players:
+      if player != sender:
+        server.send(msg, player)
+
+class ServerProtocol(asyncio.DatagramProtocol):
+  def __init__(self, server):
+    self.server = server
+
+  def connection_made(self, transport):
+    self.server.transport = transport
+
+  def datagram_received(self, data, addr):
+    self.server.handleMessage(data, addr)
 
 class GameServer(object):
-  #TODO: replace hard-coded ports/addresses with configurable ones
-  def __init__(self, port=9009):
+  def __init__(self, port=None):
     self.settings = settingsManager.getSetting().setting
-    port =self.settings['networkServerPort']
-    self.MESSAGE_SIZE = 96
+    self.port = self.settings['networkServerPort'] if port is None else port
     self.SOCKET_MODE_UDP = "udp"
-    self.SOCKET_MODE_TCP = "tcp"#not implemented yet
+    self.SOCKET_MODE_TCP = "tcp"
     self.connect_mode = self.settings['networkProtocol']
+
+    self.waiting_rooms = {}#rooms that aren't full yet, by name and size
+    self.rooms = {}#the room each player is in, by address
+    self.writers = {}#each TCP player's stream, by address
+    self.transport = None#the UDP socket
+    self.matches_started = 0
+
+  def send(self,msg,target):
     if(self.connect_mode == self.SOCKET_MODE_UDP):
-        self.conn = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.conn.bind(("", port))#bind to everything.
+      self.transport.sendto(msg, target)
     if(self.connect_mode == self.SOCKET_MODE_TCP):
-        self.conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.conn.setblocking(0)
-        self.conn.bind(('', port))
-        self.conn.listen(5)
-        self.message_queues = {}
-    self.read_list = [self.conn]
-    self.write_list = []
-    self.players = {}
-    
-    self.DEBUG_ENABLED = False
-    #quick and dirty way of testing artificial latency
-    #cycles through this list and sleeps for that amount of time (in seconds)
-    self.sleep_intervals = [0,0,0,0,0,0,0,0,0,0,0,1,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-    
-    
-  def send(self,msg,target):
-      if(self.connect_mode == self.SOCKET_MODE_UDP):
-        self.conn.sendto(msg, target)
-      if(self.connect_mode == self.SOCKET_MODE_TCP):
-        if len(msg)<self.MESSAGE_SIZE:#fixed-width messages, could be made better by proper buffering 
-          msg='{message: <{fill}}'.format(message=msg, fill=self.MESSAGE_SIZE)
-        else:
-          print("message too long: "+str(len(msg))+" "+msg)
-        for s in self.read_list:
-          if s is not self.conn and s.getpeername() == target:
-            self.message_queues[s].append(msg)
-            if s not in self.write_list:
-                self.write_list.append(s)
+      writer = self.writers.get(target)
+      if writer is not None:
+        writer.write(network.frameMessage(msg))
 
   def handleMessage(self,msg,addr):
     if len(msg) >= 1:
-      cmd = msg[0]
-      if cmd == "c":#player connected
-        self.players[addr] = {'nextframe':0}
-        #TODO: what happens when there is more than 2 players? (game will start at 2)
-        if(len(self.players)>1):#game is ready to start, send connect message to all
-          playerno = 1#give each player a unique number
-          for player in self.players:
-            onlineMsg = """t_0_{"playerno":"""+str(playerno)+"""}"""
-            playerno+=1
-            self.send(onlineMsg, player)
-      elif cmd == "u" or cmd == "f":#update keyboard or update fighter, passthrough message
-        if len(msg) >= 2 and addr in self.players:
-          for player in self.players:
-            if(addr != player):
-              self.send(msg, player)
-        else:
-          print "Unknown message: {0},{1}".format(msg,addr)
-      elif cmd == "p":#client is progressing to frame X
-        evtSplit = msg.split("_")
-        self.status = evtSplit[0]
-        self.tick = int(evtSplit[1])
-        if addr in self.players:
-          self.players[addr]['nextframe'] = self.tick
+      cmd = msg[0:1]
+      room = self.rooms.get(addr)
+      if cmd == network.MESSAGE_CONNECT:#player connected
+        self.joinRoom(addr, network.NetworkConnectMessage().fromBytes(msg))
+      elif cmd == network.MESSAGE_INPUT or cmd == network.MESSAGE_FIGHTER:#update buttons or update fighter, passthrough message
+        if len(msg) >= 2 and room is not None:
+          room.broadcast(self, msg, addr)
         else:
+          print("Unknown message: {0},{1}".format(msg,addr))
+      elif cmd == network.MESSAGE_PROGRESS:#client is progressing to frame X
+        if room is None:
           print("progress message from unknown player: " + str(addr))
+          return
+        tick = network.NetworkProgressMessage().fromBytes(msg).frame
+        room.players[addr]['nextframe'] = tick
         allClientsHaveSameFrame = True
-        for player in self.players.values():
-          if player['nextframe']!=self.tick:
+        for player in room.players.values():
+          if player['nextframe']!=tick:
             allClientsHaveSameFrame = False
         if allClientsHaveSameFrame:
-          for playeraddr in self.players:
-              self.send(msg, playeraddr)#send to players that they can all progress to frame X
-      elif cmd == "d":#player disconnected (unused)
-        if addr in self.players:
-          del self.players[addr]
-          #TODO: if len(self.players==0), exit server
-          #TODO: close TCP connections
+          room.broadcast(self, msg)#send to players that they can all progress to frame X
+      elif cmd == network.MESSAGE_DISCONNECT:#player disconnected
+        self.leaveRoom(addr)
       else:
-        print "Unexpected: {0}".format(msg)
-  
-  def process(self):
-    readable, writable, exceptional = (
-      select.select(self.read_list, self.write_list, [])
-    )
-    if self.connect_mode == self.SOCKET_MODE_UDP:
-      for f in readable:
-        if f is self.conn:
-          msg, addr = f.recvfrom(self.MESSAGE_SIZE)
-          self.handleMessage(msg,addr)
-    if self.connect_mode == self.SOCKET_MODE_TCP:
-      for s in readable:
-        if s is self.conn:
-            connection, client_address = s.accept()
-            connection.setblocking(0)
-            self.read_list.append(connection)
-            self.message_queues[connection] = []
-        else:
-            data = s.recv(self.MESSAGE_SIZE)
-            if data:
-                data = data.strip()
-                self.handleMessage(data,s.getpeername())
-            else:
-                if s in self.write_list:
-                    self.write_list.remove(s)
-                self.read_list.remove(s)
-                s.close()
-                del self.message_queues[s]
-
-    for s in writable:
-        if(len(self.message_queues[s])>0):
-            for next_msg in self.message_queues[s]:
-              s.sendall(next_msg)
-            self.message_queues[s] = []
-        self.write_list.remove(s)
-
-    for s in exceptional:
-        self.read_list.remove(s)
-        if s in self.write_list:
-            self.write_list.remove(s)
-        s.close()
-        del self.message_queues[s]
-    
-  
+        print("Unexpected: {0}".format(msg))
+
+  """
+  Puts a player in the room they asked for, starting a new one if there isn't one waiting.
+  Once a room is full, the game starts, and the next player to ask for it gets a new room.
+  """
+  def joinRoom(self, addr, msgConnect):
+    if addr in self.rooms:
+      self.leaveRoom(addr)
+    key = (msgConnect.room, msgConnect.size)
+    room = self.waiting_rooms.get(key)
+    if room is None:
+      room = Room(msgConnect.room, msgConnect.size)
+      self.waiting_rooms[key] = room
+    room.players[addr] = {'nextframe':0}
+    self.rooms[addr] = room
+    if room.isFull():#game is ready to start, send connect message to all
+      del self.waiting_rooms[key]
+      room.start(self)
+      self.matches_started += 1
+
+  def leaveRoom(self, addr):
+    room = self.rooms.pop(addr, None)
+    if room is None:
+      return
+    del room.players[addr]
+    key = (room.name, room.size)
+    if not room.players and self.waiting_rooms.get(key) is room:
+      del self.waiting_rooms[key]
+
+  async def handleConnection(self, reader, writer):
+    addr = writer.get_extra_info('peername')
+    self.writers[addr] = writer
+    received = b''
+    try:
+      while True:
+        data = await reader.read(4096)
+        if not data:
+          break
+        #a read can end partway through a message, or hold several
+        messages, received = network.unframeMessages(received+data)
+        for msg in messages:
+          self.handleMessage(msg, addr)
+    except ConnectionError:
+      pass
+    finally:
+      self.leaveRoom(addr)
+      del self.writers[addr]
+      writer.close()
+
+  """
+  Starts listening, and returns once the server is up. The server keeps running as long as the event loop does.
+  """
+  async def start(self):
+    if(self.connect_mode == self.SOCKET_MODE_UDP):
+      await asyncio.get_event_loop().create_datagram_endpoint(lambda: ServerProtocol(self), local_addr=('0.0.0.0', self.port))
+    if(self.connect_mode == self.SOCKET_MODE_TCP):
+      self.server = await asyncio.start_server(self.handleConnection, '', self.port)
+
+  async def serve(self):
+    await self.start()
+    await asyncio.Future()#run forever
+
   def run(self):
-    print "Staring Server"
-    while True:
-      self.process()
-      if(self.DEBUG_ENABLED):
-        top = self.sleep_intervals.pop()#dequeue the frame that's persisted the length of the queue
-        time.sleep(top)
-        self.sleep_intervals.insert(0,top)#enqueue event onto start of queue
+    print("Starting Server")
+    asyncio.run(self.serve())
 
 #TODO: integrate this into tussle. Make it a menu option or something.
 if __name__ == "__main__":
   g = GameServer()
-  g.run()
\ No newline at end of file
+  g.run()
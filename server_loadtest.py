@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Load test for server.py. Starts a server in the background (or uses one that's already running),
+connects a lot of fake players to it, and fills up rooms with them. Then every player sends a frame of
+input 60 times a second, and we time how long the server takes to pass each one on to the rest of its room.
+Like server.py, it needs Python 3.5 or newer, for asyncio.
+
+    python3 server_loadtest.py --matches 200 --players 2 --seconds 10
+    python3 server_loadtest.py --host 192.168.1.10 --port 9009 --protocol udp
+"""
+import argparse
+import asyncio
+import threading
+import time
+import settingsManager
+import engine.network as network
+from server import GameServer
+
+class FakeClientProtocol(asyncio.DatagramProtocol):
+    def __init__(self, player):
+        self.player = player
+
+    def datagram_received(self, data, addr):
+        self.player.handleMessage(data)
+
+"""
+A player that connects, waits for its room to start, then sends whatever it's told to.
+"""
+class FakePlayer(object):
+    def __init__(self, test, match, room):
+        self.test = test
+        self.match = match
+        self.room = room
+        self.playerno = 0
+        self.sent = {}#when we sent each frame
+        self.started = asyncio.get_event_loop().create_future()
+
+    async def connect(self, host, port, protocol):
+        msgConnect = network.NetworkConnectMessage()
+        msgConnect.room = self.room
+        msgConnect.size = len(self.match)
+        if protocol == 'udp':
+            self.transport,_ = await asyncio.get_event_loop().create_datagram_endpoint(lambda: FakeClientProtocol(self), remote_addr=(host, port))
+            self.write = self.transport.sendto
+        else:
+            reader,writer = await asyncio.open_connection(host, port)
+            self.transport = writer
+            self.write = lambda msg: writer.write(network.frameMessage(msg))
+            asyncio.ensure_future(self.readStream(reader))
+        self.write(msgConnect.toBytes())
+        await self.started
+
+    async def readStream(self, reader):
+        received = b''
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                return
+            messages,received = network.unframeMessages(received+data)
+            for msg in messages:
+                self.handleMessage(msg)
+
+    def handleMessage(self, msg):
+        now = time.perf_counter()
+        msgTick = network.NetworkTickMessage()
+        msgEvt = network.NetworkUpdateMessage()
+        if msgTick.isValid(msg):
+            self.playerno = msgTick.fromBytes(msg).playerno
+            if not self.started.done():
+                self.started.set_result(True)
+        elif msgEvt.isValid(msg):
+            msgEvt.fromBytes(msg)
+            sender = self.match[msgEvt.player]
+            if msgEvt.frame in sender.sent:
+                self.test.latencies.append(now - sender.sent[msgEvt.frame])
+
+    def sendFrame(self, frame):
+        msgEvt = network.NetworkUpdateMessage()
+        msgEvt.update(self.playerno-1, frame, [(frame % 256,) + (0,) * (len(network.BUTTONS) - 1)])
+        self.sent[frame] = time.perf_counter()
+        self.write(msgEvt.toBytes())
+
+class LoadTest(object):
+    def __init__(self, args):
+        self.args = args
+        self.latencies = []
+
+    async def run(self):
+        args = self.args
+        matches = []
+        players = []
+        for match_num in range(args.matches):
+            match = []
+            for _ in range(args.players):
+                match.append(FakePlayer(self, match, 'loadtest-'+str(match_num)))
+            matches.append(match)
+            players.extend(match)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[player.connect(args.host, args.port, args.protocol) for player in players])
+        connect_time = time.perf_counter() - start
+        #players can get into a room in any order, so line them up by the player numbers they were given
+        for match in matches:
+            match.sort(key=lambda player: player.playerno)
+
+        frames = int(args.seconds * 60)
+        loop = asyncio.get_event_loop()
+        for frame in range(frames):
+            frame_start = loop.time()
+            for player in players:
+                player.sendFrame(frame)
+            await asyncio.sleep(max(0, frame_start + 1/60.0 - loop.time()))
+        await asyncio.sleep(0.5)#let the last frames get through
+
+        for player in players:
+            player.transport.close()
+
+        expected = frames * len(players) * (args.players - 1)
+        latencies = sorted(self.latencies)
+        print("%d matches of %d players over %s" % (args.matches, args.players, args.protocol))
+        print("Connected %d players in %.3fs: %.1f connections per second" % (len(players), connect_time, len(players) / connect_time))
+        print("Relayed %d of %d inputs (%.2f%% lost)" % (len(latencies), expected, 100.0 * (expected - len(latencies)) / max(expected, 1)))
+        if latencies:
+            print("Relay latency: mean %.3fms, median %.3fms, 99th percentile %.3fms, max %.3fms" % (
+                1000 * sum(latencies) / len(latencies),
+                1000 * latencies[len(latencies) // 2],
+                1000 * latencies[int(len(latencies) * 0.99)],
+                1000 * latencies[-1]))
+
+"""
+Runs a server on its own thread and event loop, like it would be in its own process.
+"""
+def startServer(port, protocol):
+    server = GameServer(port)
+    server.connect_mode = protocol
+    ready = threading.Event()
+    async def serve():
+        await server.start()
+        ready.set()
+        await asyncio.Future()
+    threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+    ready.wait()
+    return server
+
+def main():
+    settings = settingsManager.getSetting().setting
+    parser = argparse.ArgumentParser(description='Load test the TUSSLE game server.')
+    parser.add_argument('--matches', type=int, default=100, help='how many rooms to fill')
+    parser.add_argument('--players', type=int, default=2, choices=[2,3,4], help='players in each room')
+    parser.add_argument('--seconds', type=float, default=5, help='how long to send input for')
+    parser.add_argument('--protocol', default=settings['networkProtocol'] or 'tcp', choices=['tcp','udp'])
+    parser.add_argument('--host', default=None, help='test a server that is already running, instead of starting one')
+    parser.add_argument('--port', type=int, default=settings['networkServerPort'])
+    args = parser.parse_args()
+    if args.host is None:
+        args.host = '127.0.0.1'
+        startServer(args.port, args.protocol)
+    asyncio.run(LoadTest(args).run())
+
+if __name__ == '__main__':
+    main()
@@ -126,6 +126,7 @@ class Settings(object):
         self.setting["windowWidth"]  = getNumber(self.parser, "window", "windowWidth")
         self.setting["windowHeight"] = getNumber(self.parser, "window", "windowHeight")
         self.setting["frameCap"]     = getNumber(self.parser, "window", "frameCap")
+        self.setting["lowLatency"]   = getBoolean(self.parser, "window", "lowLatency")
         self.setting["windowSize"]   = [
             self.setting["windowWidth"],
             self.setting["windowHeight"],
@@ -143,6 +144,7 @@ class Settings(object):
         self.setting["showSpriteArea"]    = getBoolean(self.parser, "graphics", "displaySpriteArea")
         self.setting["showPlatformLines"] = getBoolean(self.parser, "graphics", "displayPlatformLines")
         self.setting["showECB"]           = getBoolean(self.parser, "graphics", "displayECB")
+        self.setting["showProfiler"]      = getBoolean(self.parser, "graphics", "displayProfiler")
         # ------------- network -----------------
         self.setting["networkEnabled"]          = getBoolean(self.parser, "network", "enabled")
         self.setting["networkProtocol"]         = getString(self.parser,  "network", "protocol")
@@ -151,6 +153,10 @@ class Settings(object):
         self.setting["networkUDPClientPortMin"] = getNumber(self.parser,  "network", "udpclientportmin")
         self.setting["networkUDPClientPortMax"] = getNumber(self.parser,  "network", "udpclientportmax")
         self.setting["networkBufferSize"]       = getNumber(self.parser,  "network", "buffersize")
+        self.setting["networkMode"]             = getString(self.parser,  "network", "mode")
+        self.setting["networkRollbackFrames"]   = getNumber(self.parser,  "network", "rollbackframes")
+        self.setting["networkRoom"]             = getString(self.parser,  "network", "room")
+        self.setting["networkRoomSize"]         = getNumber(self.parser,  "network", "roomsize")
         # ------------- player colours ----------
         for p in range(4):
             self.setting[f"playerColor{p}"] = getString(
@@ -280,7 +286,13 @@ class Settings(object):
         else:
             axes, buttons = {}, {}
 
-        pad_bindings = engine.controller.PadBindings(_controllerName, jid, axes, buttons)
+        # optional deadzones, for pads whose sticks drift or triggers rest off zero
+        deadzones = {}
+        for opt, arg in (("stickdeadzone", "_stickDeadzone"), ("triggerdeadzone", "_axisDeadzone")):
+            if parser.has_option(_controllerName, opt):
+                deadzones[arg] = parser.getfloat(_controllerName, opt)
+
+        pad_bindings = engine.controller.PadBindings(_controllerName, jid, axes, buttons, **deadzones)
         return engine.controller.GamepadController(pad_bindings)
 
     # ... (getGamepadList and getGamepadByName remain the same, but use .items())
@@ -301,6 +313,7 @@ def saveSettings(_settings):
     parser.set("window", "windowWidth", str(_settings["windowSize"][0]))
     parser.set("window", "windowHeight", str(_settings["windowSize"][1]))
     parser.set("window", "frameCap", str(_settings["frameCap"]))
+    parser.set("window", "lowLatency", str(_settings["lowLatency"]))
     # sound
     parser.add_section("sound")
     parser.set("sound", "music_volume", str(_settings["music_volume"] * 100))
@@ -313,6 +326,7 @@ def saveSettings(_settings):
         ("displaySpriteArea", "showSpriteArea"),
         ("displayPlatformLines", "showPlatformLines"),
         ("displayECB", "showECB"),
+        ("displayProfiler", "showProfiler"),
     ):
         parser.set("graphics", key[0], str(_settings[key[1]]))
     # player colours
@@ -354,6 +368,9 @@ def saveGamepad(_settings):
         for key, value in gamepad.key_bindings.button_bindings.items():
             parser.set(controller_name, f"b{key}", str(value))
 
+        parser.set(controller_name, "stickdeadzone", str(gamepad.key_bindings.stick_deadzone))
+        parser.set(controller_name, "triggerdeadzone", str(gamepad.key_bindings.axis_deadzone))
+
     fp = os.path.join(getSetting().datadir, "settings", "gamepads.ini")
     with open(fp, "w", buffering=1) as f:
         parser.write(f)
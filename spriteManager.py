@@ -2,7 +2,246 @@ import pygame
 import os
 import sys
 import math
+import weakref
+import collections
+import numpy
 import settingsManager
+from global_functions import *
+
+#How many bytes of scaled and rotated images the transform cache can hold before it starts throwing out old ones
+TRANSFORM_CACHE_BUDGET = 64*1024*1024
+
+"""
+The transform cache keeps the scaled and rotated copies of images that sprites are drawn with, so a sprite
+that's drawn with the same frame at the same zoom as last time doesn't get smoothscaled all over again.
+Copies are keyed by the image they came from (facing left and right are different images), the size
+they're scaled to in pixels, and the angle. Once they take up more memory than the budget, the least
+recently used ones are thrown out. Hits and misses are counted so we can see how well it's working.
+"""
+transform_cache = None
+
+def getTransformCache():
+    global transform_cache
+    if transform_cache == None:
+        transform_cache = TransformCache()
+    return transform_cache
+
+class TransformCache():
+    def __init__(self,_budget=TRANSFORM_CACHE_BUDGET):
+        self.budget = _budget
+        self.surfaces = collections.OrderedDict() #oldest first
+        #The keys of the copies of every image with its pixels in the same surface, by that surface's id. See forget.
+        self.roots = dict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+    
+    """
+    Returns _image scaled to _size, then rotated by _angle, the same as Sprite.draw always has.
+    Each entry only has a weak reference to the image it came from, and is dropped when the image is, so an
+    image's id is never used for a copy of another one that's been given the same id since.
+    """
+    def get(self,_image,_size,_angle=0):
+        key = (id(_image),_size,_angle)
+        entry = self.surfaces.get(key)
+        if entry is not None and entry[0]() is not _image:
+            self.drop(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            surface = pygame.transform.smoothscale(_image,_size)
+            if _angle != 0:
+                surface = pygame.transform.rotate(surface,_angle)
+            root = id(_image.get_abs_parent())
+            entry = (weakref.ref(_image,lambda _ref,_key=key: self.release(_key,_ref)),root,surface,surface.get_bytesize()*surface.get_width()*surface.get_height())
+            while self.surfaces and self.size+entry[3] > self.budget:
+                self.drop(next(iter(self.surfaces)))
+            self.size += entry[3]
+            self.roots.setdefault(root,set()).add(key)
+        else:
+            self.hits += 1
+            del self.surfaces[key]
+        self.surfaces[key] = entry
+        return entry[2]
+    
+    """
+    Drop every copy of an image that's about to be drawn on. Images cut out of the same sheet share their pixels,
+    so copies of any of them are thrown out too.
+    """
+    def forget(self,_image):
+        for key in list(self.roots.get(id(_image.get_abs_parent()),())):
+            self.drop(key)
+    
+    #Called when an image with copies here is gone. Its entries can only still be here if it's the same image.
+    def release(self,_key,_ref):
+        entry = self.surfaces.get(_key)
+        if entry is not None and entry[0] is _ref:
+            self.drop(_key)
+    
+    def drop(self,_key):
+        entry = self.surfaces.pop(_key)
+        self.size -= entry[3]
+        keys = self.roots[entry[1]]
+        keys.discard(_key)
+        if not keys:
+            del self.roots[entry[1]]
+    
+    def clear(self):
+        self.surfaces.clear()
+        self.roots.clear()
+        self.size = 0
+    
+    def getStats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.surfaces), 'bytes': self.size, 'budget': self.budget}
+
+#How many bytes of sheets nothing is using any more the sheet cache keeps around, in case they're wanted again
+SHEET_CACHE_BUDGET = 32*1024*1024
+
+"""
+The sheet cache loads each sprite sheet once and hands the same frames out to every sprite that asks for it,
+so spawning an article doesn't mean loading its sheet from disk and cutting it up again.
+Sheets are keyed by their path, the width of a frame, and the colors that were swapped in them.
+The frames it hands out are shared, so they mustn't be drawn on. A sprite that needs to recolor its frames
+copies them first, and lets go of the shared ones.
+Each sheet counts the sprites holding it. Sprites call release when they're done with it, and sheets
+nobody's holding are thrown out, oldest first, once they take up more memory than the budget.
+"""
+sheet_cache = None
+
+def getSheetCache():
+    global sheet_cache
+    if sheet_cache == None:
+        sheet_cache = SheetCache()
+    return sheet_cache
+
+class SheetCache():
+    def __init__(self,_budget=SHEET_CACHE_BUDGET):
+        self.budget = _budget
+        self.sheets = dict()
+        self.unused = collections.OrderedDict() #oldest first
+        self.hits = 0
+        self.misses = 0
+    
+    def getKey(self,_path,_offset,_colorMap):
+        return (os.path.abspath(_path),_offset,tuple(sorted((tuple(from_color),tuple(to_color)) for from_color,to_color in _colorMap.items())))
+    
+    """
+    Returns the sheet for _path, cut into frames _offset wide and recolored, loading it if it isn't already here.
+    Every call needs a release to go with it.
+    """
+    def acquire(self,_path,_offset=0,_colorMap={}):
+        key = self.getKey(_path,_offset,_colorMap)
+        entry = self.sheets.get(key)
+        if entry is None:
+            self.misses += 1
+            entry = SheetEntry(key,_path,_offset,_colorMap)
+            self.sheets[key] = entry
+        else:
+            self.hits += 1
+            self.unused.pop(key,None)
+        entry.references += 1
+        return entry
+    
+    def release(self,_entry):
+        if _entry.references == 0:
+            return
+        _entry.references -= 1
+        if _entry.references == 0 and self.sheets.get(_entry.key) is _entry:
+            self.unused[_entry.key] = _entry
+            self.trim(self.budget)
+    
+    """
+    Throw out sheets nobody is using until the ones that are left fit in _budget.
+    """
+    def trim(self,_budget):
+        size = self.getSize()
+        while self.unused and size > _budget:
+            key,entry = self.unused.popitem(False)
+            del self.sheets[key]
+            entry.forget()
+            size -= entry.getSize()
+    
+    def evictUnused(self):
+        self.trim(0)
+    
+    def getSize(self):
+        return sum(entry.getSize() for entry in self.sheets.values())
+    
+    def getStats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.sheets), 'unused': len(self.unused),
+                'bytes': self.getSize(), 'budget': self.budget}
+
+class SheetEntry():
+    def __init__(self,_key,_path,_offset,_colorMap):
+        self.key = _key
+        self.references = 0
+        self.sheet = pygame.image.load(_path)
+        #The frames are cut out of the sheet, so recoloring the sheet recolors all of them
+        swapColors(self.sheet,_colorMap.items())
+        self.frames = tuple(cutSheet(self.sheet,_offset))
+        self.flipped_frames = None
+    
+    #Facing the other way is flipped once, the first time a sprite asks for it
+    def getFlipped(self):
+        if self.flipped_frames is None:
+            self.flipped_frames = tuple(pygame.transform.flip(frame,True,False) for frame in self.frames)
+        return self.flipped_frames
+    
+    def getSize(self):
+        size = self.sheet.get_bytesize()*self.sheet.get_width()*self.sheet.get_height()
+        if self.flipped_frames:
+            size += sum(frame.get_bytesize()*frame.get_width()*frame.get_height() for frame in self.flipped_frames)
+        return size
+    
+    def forget(self):
+        getTransformCache().forget(self.sheet)
+        for frame in self.flipped_frames or ():
+            getTransformCache().forget(frame)
+
+#With this many colors to swap, one pass through a lookup table beats a PixelArray.replace for each of them
+LOOKUP_TABLE_COLORS = 16
+
+"""
+Swaps every color in _colorPairs, a list of (from color, to color), for its new color. Call it on a whole sheet
+rather than on each frame cut from it. The colors are all swapped at once, so a color that's swapped in won't
+get swapped again by another pair.
+A few colors are swapped with PixelArray.replace, one C pass each. Lots of colors, or colors that would get
+swapped twice, go through a numpy lookup table instead: the colors are mapped the same way PixelArray.replace
+maps them, and every pixel is looked up in the sorted list of them in a single pass.
+"""
+def swapColors(_surface,_colorPairs):
+    _colorPairs = list(_colorPairs)
+    if not _colorPairs:
+        return
+    #map_rgb can come back negative, so keep it to the size of a pixel
+    pixel_mask = (1 << (8*_surface.get_bytesize()))-1
+    from_pixels = [_surface.map_rgb(from_color) & pixel_mask for from_color,_ in _colorPairs]
+    to_pixels = [_surface.map_rgb(to_color) & pixel_mask for _,to_color in _colorPairs]
+    chained = set(from_pixels) & set(to_pixels)
+    #surfarray can't reference 24 bit pixels, and 8 bit pixels are indexes into the palette, not colors
+    if _surface.get_bytesize() != 4 or (len(_colorPairs) < LOOKUP_TABLE_COLORS and not chained):
+        arr = pygame.PixelArray(_surface)
+        for from_color,to_color in _colorPairs:
+            arr.replace(from_color,to_color)
+        del arr
+        return
+    pixels = pygame.surfarray.pixels2d(_surface)
+    from_pixels = numpy.array(from_pixels, dtype=pixels.dtype)
+    to_pixels = numpy.array(to_pixels, dtype=pixels.dtype)
+    order = numpy.argsort(from_pixels, kind='mergesort')
+    from_pixels = from_pixels[order]
+    to_pixels = to_pixels[order]
+    index = numpy.minimum(numpy.searchsorted(from_pixels, pixels), len(from_pixels)-1)
+    swapped = from_pixels[index] == pixels
+    pixels[swapped] = to_pixels[index[swapped]]
+    del pixels
+
+#Frames that are _offset wide, cut out of _sheet. They share the sheet's pixels. An offset of 0 means the whole sheet is one frame.
+def cutSheet(_sheet,_offset):
+    if _offset <= 0:
+        return [_sheet]
+    return [_sheet.subsurface(pygame.Rect(index*_offset,0,_offset,_sheet.get_height()))
+            for index in range(_sheet.get_width() // _offset)]
 
 class Sprite(pygame.sprite.Sprite):
     def __init__(self):
@@ -31,29 +270,31 @@ class Sprite(pygame.sprite.Sprite):
         w = max(0,w)
         h = max(0,h)
         try:
-            blit_sprite = pygame.transform.smoothscale(self.image, (int(w), int(h)))
+            blit_sprite = getTransformCache().get(self.image, (int(w), int(h)), self.angle)
         except Exception as e:
             print(e)
             raise ValueError("Please use 32-bit PNG files")
-        if self.angle != 0:
-            blit_sprite = pygame.transform.rotate(blit_sprite,self.angle)
         new_rect = pygame.Rect(new_off,(int(rotated_w), int(rotated_h)))
-        ret_rect = new_rect
-        if not new_rect == self.lastDrawnPosition:
-            self.changed = True
-            ret_rect = new_rect.union(self.lastDrawnPosition)
-            self.lastDrawnPosition = new_rect
-        if self.changed:
-            _screen.blit(blit_sprite,new_rect)
-            self.changed = False
-            return ret_rect
-        _screen.blit(blit_sprite,new_rect) #Until this starts working
-        return None
+        self.lastDrawnPosition = new_rect
+        self.changed = False
+        #The part of the screen that was drawn on. Whoever's drawing keeps track of where it was last frame.
+        return _screen.blit(blit_sprite,new_rect)
+    
+    #Everything about the sprite that changes what it draws. If this is the same as last frame, so is the sprite.
+    def getDrawKey(self):
+        return (id(self.image), tuple(self.rect), self.angle, self.scale, self.visible)
     
     def rotate(self,_angle = 0):
         self.angle = _angle
         self.changed = True
     
+    #Snapshots for rollback and replay seeking. If a sprite has sprites of its own, save those separately.
+    def saveState(self):
+        return getObjectState(self)
+    
+    def loadState(self,_state):
+        setObjectState(self,_state)
+    
     
     def getColorIndexes(self,_color):
         import numpy as np
@@ -74,12 +315,16 @@ class Sprite(pygame.sprite.Sprite):
         
         
 class SpriteHandler(Sprite):
-    def __init__(self,_directory,_prefix,_startingImage,_offset,_colorMap = {},_scale=1.0,_flip="right"):
+    #If _library is given, it's used as the finished image library, instead of building one from the directory
+    def __init__(self,_directory,_prefix,_startingImage,_offset,_colorMap = {},_scale=1.0,_flip="right",_library=None):
         Sprite.__init__(self)
         self.color_map = _colorMap
         self.scale_factor = _scale
         self.flip = _flip
-        self.image_library = self.buildImageLibrary(ImageLibrary(_directory,_prefix), _offset)
+        if _library is not None:
+            self.image_library = _library
+        else:
+            self.image_library = self.buildImageLibrary(ImageLibrary(_directory,_prefix), _offset)
         
         self.starting_image = _startingImage
         
@@ -149,9 +394,8 @@ class SpriteHandler(Sprite):
             library[key] = image_list
             flip_list = []
             for image in image_list:
-                img = image.copy()
-                img = pygame.transform.flip(img,True,False)
-                flip_list.append(img)
+                #flip makes a new surface, so there's no need to copy the image first
+                flip_list.append(pygame.transform.flip(image,True,False))
             flipped_library[key] = flip_list
 
         if self.flip == "right": reverse = "left"
@@ -162,11 +406,11 @@ class SpriteHandler(Sprite):
     def buildSubimage_list(self,_sheet,_offset):
         index = 0
         image_list = []
+        #The subimages share the sheet's pixels, so recolor the whole sheet in one go
+        swapColors(_sheet,self.color_map.items())
         while index < _sheet.get_width() // _offset:
             _sheet.set_clip(pygame.Rect(index * _offset, 0, _offset,_sheet.get_height()))
             image = _sheet.subsurface(_sheet.get_clip())
-            for from_color,to_color in self.color_map.items():
-                self.recolor(image, tuple(list(from_color)), tuple(list(to_color)))
             if not self.scale_factor == 1.0:
                 w = int(image.get_width() * self.scale_factor)
                 h = int(image.get_height() * self.scale_factor)
@@ -176,9 +420,8 @@ class SpriteHandler(Sprite):
         return image_list
     
     def recolor(self,_image,_fromColor,_toColor):
-        arr = pygame.PixelArray(_image)
-        arr.replace(_fromColor,_toColor)
-        del arr
+        getTransformCache().forget(_image)
+        swapColors(_image,[(_fromColor,_toColor)])
         self.changed = True
         
             
@@ -190,7 +433,13 @@ class ImageSprite(Sprite):
         self.rect = self.image.get_rect()
         self.bounding_rect = self.getBoundingBox()
     
+    #Gets an image of this sprite's that's safe to draw on. Sprites that share their images copy them first.
+    def ownImage(self,_image):
+        return _image
+    
     def color_surface(self,_color,_alpha):
+        self.image = self.ownImage(self.image)
+        getTransformCache().forget(self.image)
         arr = pygame.surfarray.pixels3d(self.image)
         arr[:,:,0] = _color[0]
         arr[:,:,1] = _color[1]
@@ -199,35 +448,76 @@ class ImageSprite(Sprite):
         self.changed = True
     
     def alpha(self,_newAlpha):
+        self.image = self.ownImage(self.image)
+        getTransformCache().forget(self.image)
         arr = pygame.surfarray.pixels_alpha(self.image)
         arr[arr!=0] = _newAlpha
         del arr
         self.changed = True
     
     def recolor(self,_image,_fromColor,_toColor,_ignoreAlpha=False):
-        arr = pygame.PixelArray(_image)
-        arr.replace(_fromColor,_toColor)
-        del arr
+        _image = self.ownImage(_image)
+        getTransformCache().forget(_image)
+        swapColors(_image,[(_fromColor,_toColor)])
         self.changed = True
+
+"""
+An image that scrolls to the right, wrapping around, by _speed pixels every other frame. The image itself
+never changes. It's drawn in two pieces, the part that has scrolled off the right edge, then the rest after it.
+Rotation and the sprite's own scale aren't supported.
+"""
+class ScrollingSprite(ImageSprite):
+    def __init__(self,_path,_speed):
+        ImageSprite.__init__(self,_path)
+        self.speed = _speed
+        self.scroll = 0
+        self.frame = 0
+    
+    def update(self):
+        if self.frame % 2 == 0:
+            self.scroll = (self.scroll + self.speed) % self.rect.width
+            self.frame = 0
+        self.frame += 1
+    
+    def getDrawKey(self):
+        return ImageSprite.getDrawKey(self) + (self.scroll,)
+    
+    def draw(self,_screen,_offset,_scale):
+        if not self.visible:
+            return
+        w = int(self.rect.width * _scale)
+        h = int(self.rect.height * _scale)
+        if h <= 0 or w <= 0: return
+        blit_sprite = getTransformCache().get(self.image, (w, h))
+        x = int((_offset[0]+self.spriteOffset[0]) * _scale)
+        y = int((_offset[1]+self.spriteOffset[1]) * _scale)
+        split = min(w,int(self.scroll * _scale))
+        self.lastDrawnPosition = pygame.Rect(x,y,w,h)
+        self.changed = False
+        rect = _screen.blit(blit_sprite,(x,y),pygame.Rect(w-split,0,split,h))
+        return rect.union(_screen.blit(blit_sprite,(x+split,y),pygame.Rect(0,0,w-split,h)))
         
+"""
+A sprite cut out of a sheet. Given the path to the sheet, the frames come from the sheet cache and are shared
+with every other sprite using that sheet, until this one recolors them. Given a surface, it cuts its own.
+"""
 class SheetSprite(ImageSprite):
     def __init__(self,_sheet,_offset=0,_colorMap = {}):
         Sprite.__init__(self)
         
-        self.sheet = _sheet
-        if isinstance(_sheet,str) or isinstance(_sheet, unicode):
-            self.sheet = pygame.image.load(_sheet)
-        
         self.color_map = _colorMap
         self.index = 0
-        self.max_index = self.sheet.get_width() // _offset
         self.offset = _offset
         
-        
-        if self.offset > 0:
+        if isinstance(_sheet, pygame.Surface):
+            self.sheet_entry = None
+            self.sheet = _sheet
             self.image_list = self.buildSubimage_list(self.sheet,_offset)
         else:
-            self.image_list = [self.sheet]
+            self.sheet_entry = getSheetCache().acquire(_sheet,_offset,_colorMap)
+            self.sheet = self.sheet_entry.sheet
+            self.image_list = self.sheet_entry.frames
+        self.max_index = len(self.image_list)
             
         self.flip = False
         self.angle = 0
@@ -237,35 +527,66 @@ class SheetSprite(ImageSprite):
         self.bounding_rect = self.getBoundingBox()
     
     def buildSubimage_list(self,_sheet,_offset):
-        index = 0
-        
-        image_list = []
-        while index < self.max_index:
-            self.sheet.set_clip(pygame.Rect(index * _offset, 0, _offset,_sheet.get_height()))
-            image = _sheet.subsurface(_sheet.get_clip())
-            #image = image.convert_alpha()
-            for from_color,to_color in self.color_map.items():
-                self.recolor(image, tuple(list(from_color)), tuple(list(to_color)))
-            image_list.append(image)
-            index += 1
-        return image_list
+        self.swapPalette(_sheet,self.color_map.items())
+        return cutSheet(_sheet,_offset)
     
     def flipX(self):
         self.flip = not self.flip
-        self.image = pygame.transform.flip(self.image,True,False)
+        self.image = self.getFrame(self.index)
         self.changed = True
+    
+    def getFrame(self,_index):
+        if not self.flip:
+            return self.image_list[_index]
+        if self.sheet_entry:
+            return self.sheet_entry.getFlipped()[_index]
+        return pygame.transform.flip(self.image_list[_index],True,False)
+    
+    """
+    Copy on write. The first time a sprite with shared frames draws on one, it copies the sheet, cuts its own
+    frames out of the copy, and lets go of the shared sheet. Returns this sprite's own version of _image.
+    """
+    def ownImage(self,_image):
+        if self.sheet_entry is None:
+            return _image
+        shared = [self.sheet] + list(self.image_list)
+        shared_flipped = self.sheet_entry.flipped_frames or ()
+        self.sheet = self.sheet.copy()
+        self.image_list = cutSheet(self.sheet,self.offset)
+        owned = [self.sheet] + self.image_list
+        self.release()
+        def own(_shared):
+            for shared_image,owned_image in zip(shared,owned):
+                if _shared is shared_image:
+                    return owned_image
+            for index,shared_image in enumerate(shared_flipped):
+                if _shared is shared_image:
+                    return pygame.transform.flip(self.image_list[index],True,False)
+            return _shared
+        owned_image = own(_image)
+        self.image = owned_image if self.image is _image else own(self.image)
+        self.changed = True
+        return owned_image
+    
+    #Let go of the shared sheet. Anything that's done with a sprite it made from a path should call this.
+    def release(self):
+        if self.sheet_entry:
+            getSheetCache().release(self.sheet_entry)
+            self.sheet_entry = None
         
     def recolor(self,_image,_fromColor,_toColor):
-        arr = pygame.PixelArray(_image)
-        arr.replace(_fromColor,_toColor)
-        del arr
+        self.swapPalette(_image,[(_fromColor,_toColor)])
+    
+    #Swap several colors at once. Swapping them on the sheet swaps them on every frame.
+    def swapPalette(self,_image,_colorPairs):
+        _image = self.ownImage(_image)
+        getTransformCache().forget(_image)
+        swapColors(_image,_colorPairs)
         self.changed = True
         
     def getImageAtIndex(self,_index):
         self.index = _index % self.max_index
-        self.image = self.image_list[self.index]
-        if self.flip:
-            self.image = pygame.transform.flip(self.image,True,False)
+        self.image = self.getFrame(self.index)
         self.changed = True
         return self.image
         
@@ -287,22 +608,35 @@ class MaskSprite(ImageSprite):
         else: self.alpha = 128
         self.visible = True
         
-        self.image = self.parent_sprite.image.copy()
+        self.image = None
         self.rect = self.parent_sprite.rect
+        #What the mask was last made from, so it's only made again when one of them changes
+        self.mask_of = None
+        self.mask_fill = None
         
         self.color_surface(self.color)
         
-        
+    """
+    Makes the mask, the shape of the parent's current image filled in with _color. The mask keeps its own surface,
+    and only makes a new one when the parent's image changes size, instead of copying the parent every frame.
+    """
     def color_surface(self,_color):
-        arr = pygame.surfarray.pixels3d(self.image)
-        arr[:,:,0] = _color[0]
-        arr[:,:,1] = _color[1]
-        arr[:,:,2] = _color[2]
-        del arr
+        parent_image = self.parent_sprite.image
+        if self.image is not None and self.mask_of is parent_image and self.mask_fill == (tuple(_color),self.alpha):
+            return
+        if self.image is None or self.image.get_size() != parent_image.get_size():
+            if self.image is not None:
+                getTransformCache().forget(self.image)
+            self.image = pygame.Surface(parent_image.get_size(), pygame.SRCALPHA, 32)
+        else:
+            getTransformCache().forget(self.image)
+        self.image.fill(_color)
         
         arr = pygame.surfarray.pixels_alpha(self.image)
-        arr[arr!=0] = self.alpha
+        arr[:,:] = (pygame.surfarray.array_alpha(parent_image) != 0) * self.alpha
         del arr
+        self.mask_of = parent_image
+        self.mask_fill = (tuple(_color),self.alpha)
         self.changed = True
         
     
@@ -317,7 +651,6 @@ class MaskSprite(ImageSprite):
                     self.alpha = 16
                     self.pulse_size = -self.pulse_size
             self.duration -= 1
-            self.image = self.parent_sprite.image.copy()
             self.color_surface(self.color)
             
             self.rect = self.parent_sprite.rect
@@ -327,6 +660,12 @@ class MaskSprite(ImageSprite):
             if not hasattr(self, 'rect'):
                 self.rect = self.parent_sprite.rect
             return None
+    
+    #The mask surface is drawn on in place, so after a rollback it has to be made again
+    def loadState(self,_state):
+        Sprite.loadState(self,_state)
+        self.mask_of = None
+        self.color_surface(self.color)
 
 class TextSprite(ImageSprite):
     def __init__(self,_text,_font="Orbitron Medium",_size=12,_color=[0,0,0]):
@@ -352,19 +691,32 @@ class TextSprite(ImageSprite):
         
 class ImageLibrary():
     def __init__(self,_directory,_prefix=""):
-        self.directory = os.path.join(os.path.dirname(__file__).replace('main.exe',''),_directory)
-        if _prefix is None: _prefix=''
+        self.directory = getLibraryDirectory(_directory)
         self.image_dict = {}
-        supported_file_types = [".jpg",".png",".gif",".bmp",".pcx",".tga",".tif",".lbm",".pbm",".xpm"]
-        
-        for f in os.listdir(self.directory):
-            fname, ext = os.path.splitext(f)
-            if fname.startswith(_prefix) and supported_file_types.count(ext):
-                sprite_name = fname[len(_prefix):]
-                sprite = pygame.image.load(os.path.join(self.directory,f))
-                sprite = sprite.convert_alpha()
-                self.image_dict[sprite_name] = sprite
-                #print(sprite.get_alpha(), sprite_name, self.image_dict[sprite_name])
+        
+        for sprite_name,path in getLibraryFiles(_directory,_prefix):
+            #Every palette of a fighter starts from the same sheets, so they're only read from disk once.
+            #convert_alpha makes a new surface, which is this library's to recolor.
+            entry = getSheetCache().acquire(path)
+            self.image_dict[sprite_name] = entry.sheet.convert_alpha()
+            getSheetCache().release(entry)
+            #print(sprite.get_alpha(), sprite_name, self.image_dict[sprite_name])
+
+def getLibraryDirectory(_directory):
+    return os.path.join(os.path.dirname(__file__).replace('main.exe',''),_directory)
+
+# The image files an ImageLibrary is loaded from, as a list of (sprite name, path)
+def getLibraryFiles(_directory,_prefix=""):
+    directory = getLibraryDirectory(_directory)
+    if _prefix is None: _prefix=''
+    supported_file_types = [".jpg",".png",".gif",".bmp",".pcx",".tga",".tif",".lbm",".pbm",".xpm"]
+    
+    files = []
+    for f in os.listdir(directory):
+        fname, ext = os.path.splitext(f)
+        if fname.startswith(_prefix) and supported_file_types.count(ext):
+            files.append((fname[len(_prefix):], os.path.join(directory,f)))
+    return files
 
 class RectSprite(Sprite):
     def __init__(self,_rect,_color=[0,0,0]):
@@ -0,0 +1,54 @@
+import os
+import sys
+import csv
+import shutil
+import tempfile
+import unittest
+import subprocess
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+
+#No window and no sound card needed. This has to happen before pygame starts.
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+import batch_matches
+
+FRAMES = 1800
+
+class TestBatchMatches(unittest.TestCase):
+    #A couple of real matches, in this process, the way a worker plays them
+    def test_matches_play(self):
+        rows = []
+        for seed in range(2):
+            rows.extend(batch_matches.runMatch((seed, seed, ['true_arena'], ['hitboxie'], FRAMES, 3, 0)))
+        self.assertEqual([row['error'] for row in rows], [None] * len(rows))
+        for row in rows:
+            self.assertEqual(row['frames'], FRAMES)
+        #The CPU has to actually fight, or the KO and damage columns don't mean anything
+        self.assertTrue(sum(row['damage_dealt'] for row in rows) > 0)
+
+    #The same seed has to play out the same, so a match can be played again on its own
+    def test_same_seed(self):
+        first = batch_matches.runMatch((0, 7, ['true_arena'], ['hitboxie'], 600, 3, 0))
+        second = batch_matches.runMatch((0, 7, ['true_arena'], ['hitboxie'], 600, 3, 0))
+        self.assertEqual(first, second)
+
+    #The whole tool, through its pool of workers, the way it's run
+    def test_batch_run(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'results.csv')
+            status = subprocess.call([sys.executable, os.path.join(ROOT, 'tools', 'batch_matches.py'),
+                                      '--matches', '2', '--processes', '2', '--frames', '300', '--out', path],
+                                     stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+            self.assertEqual(status, 0)
+            with open(path) as results:
+                rows = list(csv.DictReader(results))
+            self.assertEqual(len(rows), 4)
+            self.assertEqual([row['error'] for row in rows], [''] * 4)
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import sys
+import random
+import unittest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+import numpy
+import pygame
+import ecb as original
+
+CASES = 2000
+
+def randomRect(_rng):
+    return pygame.Rect(_rng.randint(0, 60), _rng.randint(0, 60), _rng.randint(1, 80), _rng.randint(1, 80))
+
+"""
+The collision kernel has to come out the same as the per-rect code it replaced, which benchmarks/ecb.py keeps.
+Small rects close together, so plenty of them overlap, touch, or only just miss.
+"""
+class TestCollisionKernel(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(0)
+
+    def randomCase(self):
+        current = randomRect(self.rng)
+        ecb = original.SceneECB(current, current.move(self.rng.randint(-8, 8), self.rng.randint(-8, 8)))
+        return ecb, randomRect(self.rng), self.rng.choice([0, self.rng.uniform(-10, 10)]), self.rng.choice([0, self.rng.uniform(-10, 10)])
+
+    def test_intersects(self):
+        for _ in range(CASES):
+            ecb, other, dx, dy = self.randomCase()
+            self.assertEqual(ecb.doesIntersect(other, dx, dy), original.doesIntersect(ecb, other, dx, dy))
+            self.assertEqual(ecb.pathRectIntersects(other, dx, dy), original.pathRectIntersects(ecb, other, dx, dy))
+
+    def test_ejections(self):
+        checked = 0
+        for _ in range(CASES):
+            ecb, other, dx, dy = self.randomCase()
+            if not original.doesIntersect(ecb, other, dx, dy): continue
+            checked += 1
+            expected = original.ejectionDirections(ecb, other, dx, dy)
+            found = ecb.ejectionDirections(other, dx, dy)
+            self.assertEqual(len(found), len(expected), (ecb.current_ecb.rect, other, dx, dy))
+            for a,b in zip(found, expected):
+                self.assertTrue(numpy.array_equal(a, b))
+            self.assertTrue(numpy.array_equal(ecb.primaryEjection(other, dx, dy), original.primaryEjection(ecb, other, dx, dy)))
+        self.assertTrue(checked > CASES // 4)
+
+if __name__ == '__main__':
+    unittest.main()
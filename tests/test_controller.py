@@ -0,0 +1,77 @@
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#No window and no sound card needed. This has to happen before pygame starts.
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+import pygame
+import settingsManager
+import engine.controller as controller
+import engine.abstractFighter as abstractFighter
+
+AXIS_BINDINGS = {0: ('left', 'right'), 1: ('up', 'down'), 2: ('none', 'shield')}
+TIMING_WINDOW = {'buffer_window': 8, 'repeat_window': 8, 'smoothing_window': 64, 'smash_window': 4}
+
+#Stands in for a pygame Joystick, with its axes wherever they're put
+class FakePad(object):
+    def __init__(self):
+        self.axes = [0.0, 0.0, 0.0]
+
+    def get_numaxes(self):
+        return len(self.axes)
+
+    def get_axis(self,_axis):
+        return self.axes[_axis]
+
+class TestGamepadStick(unittest.TestCase):
+    def setUp(self):
+        pygame.init()
+        pygame.display.set_mode((settingsManager.getSetting('windowWidth'), settingsManager.getSetting('windowHeight')))
+        self.fighter = abstractFighter.AbstractFighter(os.path.join(settingsManager.createPath('fighters'), 'hitboxie'), 0)
+        self.fighter.initialize()
+        self.pad = FakePad()
+        bindings = controller.PadBindings('Fake Pad', 0, AXIS_BINDINGS, {})
+        bindings.pad = self.pad
+        self.gamepad = controller.GamepadController(bindings)
+        #The battle gives a gamepad the player's timing windows, see settingsManager.getControls
+        self.gamepad.timing_window = TIMING_WINDOW
+        self.gamepad.linkObject(self.fighter)
+        self.fighter.key_bindings = self.gamepad
+
+    def getSmoothedInput(self,_x,_y):
+        self.pad.axes[0] = _x
+        self.pad.axes[1] = _y
+        self.gamepad.sampleAxes()
+        return self.fighter.getSmoothedInput()
+
+    #A diagonal keeps its direction, and its length has the deadzone taken off the stick's length, not each axis's
+    def test_diagonal(self):
+        x,y = self.getSmoothedInput(0.6, -0.6)
+        magnitude = controller.getDeadzoneMagnitude((0.6 ** 2 + 0.6 ** 2) ** 0.5, controller.STICK_DEADZONE)
+        self.assertAlmostEqual(x, -y)
+        self.assertAlmostEqual((x * x + y * y) ** 0.5, magnitude, delta=1.0 / controller.ANALOG_STEPS)
+        self.assertTrue(x > 0)
+
+    #Inside the deadzone on each axis, but not on the stick as a whole
+    def test_small_diagonal(self):
+        x,y = self.getSmoothedInput(0.25, 0.25)
+        self.assertTrue(0.25 < controller.STICK_DEADZONE < (0.25 ** 2 + 0.25 ** 2) ** 0.5)
+        self.assertAlmostEqual(x, y)
+        self.assertTrue(x > 0)
+
+    #The battle counts a stick as polled on the frames it moves, see Battle.passInputs
+    def test_changed(self):
+        self.pad.axes[0] = 0.6
+        self.assertTrue(self.gamepad.sampleAxes())
+        self.assertFalse(self.gamepad.sampleAxes())
+        self.pad.axes[0] = 0
+        self.assertTrue(self.gamepad.sampleAxes())
+
+    def test_release(self):
+        self.getSmoothedInput(0.6, 0.6)
+        self.assertEqual(self.getSmoothedInput(0.1, -0.1), [0, 0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import os
+import sys
+import random
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#No window and no sound card needed. This has to happen before pygame starts.
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+import pygame
+import settingsManager
+import battle
+import engine.network as network
+import engine.controller as controller
+import engine.abstractFighter as abstractFighter
+
+FRAMES = 240
+#How many frames a message takes to get to the other side. Anything less than the rollback frames works.
+DELAY = 3
+SEED = 7
+KEYS = ['left', 'right', 'up', 'down', 'attack', 'special', 'jump', 'shield']
+AXIS_BINDINGS = {0: ('left', 'right'), 1: ('up', 'down'), 2: ('none', 'shield')}
+BUTTON_BINDINGS = {0: 'attack', 1: 'jump', 2: 'special'}
+
+#Stands in for a pygame Joystick, with its axes wherever they're put
+class FakePad(object):
+    def __init__(self):
+        self.axes = [0.0, 0.0, 0.0]
+
+    def get_numaxes(self):
+        return len(self.axes)
+
+    def get_axis(self,_axis):
+        return self.axes[_axis]
+
+#Both peers go by the same frame count, so messages turn up DELAY of them after they're sent
+class Clock(object):
+    def __init__(self):
+        self.frame = 0
+
+"""
+A rollback network that hands its messages straight to the other peer's instead of going through the server.
+"""
+class LocalNetwork(network.Network):
+    def __init__(self,_clock):
+        self.clock = _clock
+        self.inbox = []
+        self.peer = None
+        network.Network.__init__(self, True)
+        self.rollback = True
+
+    def connect(self):
+        pass
+
+    def send(self,msg,target):
+        self.peer.inbox.append((self.clock.frame + DELAY, msg))
+
+    def readFromNetwork(self):
+        arrived = [msg for frame,msg in self.inbox if frame <= self.clock.frame]
+        self.inbox = [(frame,msg) for frame,msg in self.inbox if frame > self.clock.frame]
+        for msg in arrived:
+            self.handleMessage(msg)
+
+"""
+One side of the match. Player one is on the keyboard, player two has a gamepad, and this peer is playing one of them.
+Both peers share one process, so each keeps its own random state, the way it would have on its own machine.
+"""
+class Peer(object):
+    def __init__(self,_clock,_playerNum):
+        directory = settingsManager.createPath('fighters')
+        players = [abstractFighter.AbstractFighter(os.path.join(directory, 'hitboxie'), 0),
+                   abstractFighter.AbstractFighter(os.path.join(directory, 'sandbag'), 1)]
+        stage_directory = settingsManager.createPath('stages')
+        stage = settingsManager.importFromURI(stage_directory, os.path.join(stage_directory, 'true_arena', 'stage.py')).getStage()
+        self.battle = battle.Battle(battle.Rules(0, 0), players, stage, SEED)
+        self.battle.initializeHeadless()
+        self.battle.setUpBattle()
+        self.battle.clock_speed = 0
+        #The settings share each player's controller between battles, so each peer gets its own
+        keyboard = players[0].key_bindings
+        self.pad = FakePad()
+        bindings = controller.PadBindings('Fake Pad', 0, AXIS_BINDINGS, BUTTON_BINDINGS)
+        bindings.pad = self.pad
+        gamepad = controller.GamepadController(bindings)
+        gamepad.timing_window = players[1].key_bindings.timing_window
+        for player_num,cont in enumerate([controller.Controller(keyboard.key_bindings, keyboard.timing_window), gamepad]):
+            cont.linkObject(players[player_num])
+            players[player_num].key_bindings = cont
+            self.battle.controllers[player_num] = cont
+        self.network = LocalNetwork(_clock)
+        self.network.linkControllers(self.battle.controllers)
+        self.battle.network = self.network
+        self.player_num = _playerNum
+        self.rollbacks = 0
+        load_state = self.battle.loadState
+        def countRollback(_state):
+            self.rollbacks += 1
+            load_state(_state)
+        self.battle.loadState = countRollback
+
+    def start(self):
+        msg = network.NetworkTickMessage()
+        msg.playerno = self.player_num + 1
+        msg.players = 2
+        msg.seed = SEED
+        self.network.handleMessage(msg.toBytes())
+        self.random_state = random.getstate()
+
+    def step(self,_events):
+        for event in _events:
+            pygame.event.post(event)
+        random.setstate(self.random_state)
+        self.battle.gameEventLoop()
+        self.random_state = random.getstate()
+
+    def getState(self):
+        return [(fighter.posx, fighter.posy, fighter.damage, fighter.current_action.name, sorted(fighter.keys_held.items()))
+                for fighter in self.battle.players]
+
+class TestRollback(unittest.TestCase):
+    def setUp(self):
+        pygame.init()
+        pygame.display.set_mode((settingsManager.getSetting('windowWidth'), settingsManager.getSetting('windowHeight')))
+        self.clock = Clock()
+        self.peers = [Peer(self.clock, 0), Peer(self.clock, 1)]
+        self.peers[0].network.peer = self.peers[1].network
+        self.peers[1].network.peer = self.peers[0].network
+        for peer in self.peers:
+            peer.start()
+
+    #A seeded mash of the keyboard on one side, and the gamepad's buttons and stick on the other
+    def getEvents(self,_rng,_held):
+        keyboard = []
+        gamepad = []
+        if self.clock.frame < FRAMES:
+            key_codes = dict([(name, code) for code, name in self.peers[0].battle.controllers[0].key_bindings.items()])
+            if self.clock.frame % 4 == 0:
+                key = _rng.choice([key for key in KEYS if key in key_codes])
+                event_type = pygame.KEYUP if key in _held else pygame.KEYDOWN
+                _held.symmetric_difference_update([key])
+                keyboard.append(pygame.event.Event(event_type, key=key_codes[key], mod=0, unicode='', scancode=0))
+            if self.clock.frame % 5 == 0:
+                button = _rng.choice(list(BUTTON_BINDINGS))
+                event_type = pygame.JOYBUTTONUP if button in _held else pygame.JOYBUTTONDOWN
+                _held.symmetric_difference_update([button])
+                gamepad.append(pygame.event.Event(event_type, joy=0, button=button))
+            if self.clock.frame % 6 == 0:
+                self.peers[1].pad.axes[0] = _rng.uniform(-1, 1)
+                self.peers[1].pad.axes[1] = _rng.uniform(-1, 1)
+        else:
+            self.peers[1].pad.axes[:] = [0.0, 0.0, 0.0]
+        return keyboard,gamepad
+
+    #Each side plays its own input straight away, and rolls back when the other's turns up late.
+    #Once everything's arrived, both have to have played out exactly the same.
+    def test_rollback_matches(self):
+        rng = random.Random(SEED)
+        held = set()
+        analog = False
+        while self.clock.frame < FRAMES + DELAY * 4:
+            keyboard,gamepad = self.getEvents(rng, held)
+            self.peers[0].step(keyboard)
+            self.peers[1].step(gamepad)
+            analog = analog or [value for key,value in self.peers[0].battle.controllers[1].input_values.items() if 0 < value < 1] != []
+            self.clock.frame += 1
+        self.assertEqual(self.peers[0].battle.frame, self.peers[1].battle.frame)
+        self.assertTrue(self.peers[0].rollbacks > 0 and self.peers[1].rollbacks > 0)
+        #The stick's partway pushes have to come across as they were
+        self.assertTrue(analog)
+        self.assertEqual(self.peers[0].getState(), self.peers[1].getState())
+
+if __name__ == '__main__':
+    unittest.main()
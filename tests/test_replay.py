@@ -0,0 +1,67 @@
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#No window and no sound card needed. This has to happen before pygame starts.
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+import pygame
+import settingsManager
+import battle
+import engine.abstractFighter as abstractFighter
+
+FRAMES = 600
+KEYS = ['left', 'right', 'up', 'down', 'attack', 'special', 'jump', 'shield']
+
+def getBattle():
+    pygame.init()
+    pygame.display.set_mode((settingsManager.getSetting('windowWidth'), settingsManager.getSetting('windowHeight')))
+    directory = settingsManager.createPath('fighters')
+    players = [abstractFighter.AbstractFighter(os.path.join(directory, 'hitboxie'), 0),
+               abstractFighter.AbstractFighter(os.path.join(directory, 'sandbag'), 1)]
+    stage_directory = settingsManager.createPath('stages')
+    stage = settingsManager.importFromURI(stage_directory, os.path.join(stage_directory, 'true_arena', 'stage.py')).getStage()
+    return battle.Battle(battle.Rules(0, 0), players, stage, 0)
+
+#A seeded mash of player one's keys, as the KEYDOWN and KEYUP events simulate takes
+def getInputs(_battle):
+    rng = random.Random(0)
+    key_codes = dict([(name, code) for code, name in _battle.players[0].key_bindings.key_bindings.items()])
+    inputs = [[] for _ in range(FRAMES)]
+    held = set()
+    for frame in range(0, FRAMES, 4):
+        key = rng.choice([key for key in KEYS if key in key_codes])
+        event_type = pygame.KEYUP if key in held else pygame.KEYDOWN
+        held.symmetric_difference_update([key])
+        inputs[frame].append(pygame.event.Event(event_type, key=key_codes[key], mod=0, unicode='', scancode=0))
+    return inputs
+
+def getState(_battle):
+    return [(fighter.posx, fighter.posy, fighter.damage, fighter.current_action.name) for fighter in _battle.players]
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_replay_plays_out_the_same(self):
+        original = getBattle()
+        original.simulate(FRAMES, getInputs(original))
+        path = os.path.join(self.directory, 'test.tusr')
+        original.saveReplay(path)
+
+        replay = battle.Replay(path)
+        self.assertEqual([player['type'] for player in replay.replay_players], ['Keyboard', 'Keyboard'])
+        self.assertEqual(replay.controllers[0].type, 'Keyboard')
+        replay.seek(original.frame)
+        self.assertEqual(replay.frame, original.frame)
+        self.assertEqual(getState(replay), getState(original))
+
+if __name__ == '__main__':
+    unittest.main()
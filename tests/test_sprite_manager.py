@@ -0,0 +1,50 @@
+import os
+import sys
+import unittest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+import pygame
+import spriteManager
+
+class TestTransformCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = spriteManager.TransformCache()
+        self.sheet = pygame.Surface((64, 32), pygame.SRCALPHA, 32)
+        self.frames = [self.sheet.subsurface((0, 0, 32, 32)), self.sheet.subsurface((32, 0, 32, 32))]
+
+    def test_hit(self):
+        copy = self.cache.get(self.frames[0], (64, 64))
+        self.assertTrue(self.cache.get(self.frames[0], (64, 64)) is copy)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    #Frames cut from the same sheet share its pixels, so drawing on one forgets the copies of all of them
+    def test_forget(self):
+        other = pygame.Surface((32, 32), pygame.SRCALPHA, 32)
+        for image in self.frames + [other]:
+            self.cache.get(image, (64, 64))
+            self.cache.get(image, (16, 16), 90)
+        self.cache.forget(self.frames[1])
+        self.assertEqual(self.cache.getStats()['entries'], 2)
+        self.assertEqual(self.cache.size, (64 * 64 + 16 * 16) * 4)
+        self.cache.get(other, (64, 64))
+        self.assertEqual(self.cache.hits, 1)
+
+    #Once an image is gone, its copies go too, and a new image that gets its id doesn't get them
+    def test_release(self):
+        image = pygame.Surface((32, 32), pygame.SRCALPHA, 32)
+        image_id = id(image)
+        self.cache.get(image, (64, 64))
+        del image
+        self.assertEqual(self.cache.getStats()['entries'], 0)
+        self.assertEqual((self.cache.size, self.cache.roots), (0, {}))
+        images = [pygame.Surface((32, 32), pygame.SRCALPHA, 32) for _ in range(100)]
+        for image in images:
+            if id(image) == image_id:
+                image.fill((255, 0, 0, 255))
+                self.assertEqual(self.cache.get(image, (64, 64)).get_at((0, 0)), (255, 0, 0, 255))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import sys
+import unittest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+import pygame
+import spriteManager
+import engine.stage as stage
+import engine.collisionBox as collisionBox
+
+"""
+The platform index has to keep up with the platforms, or collisions go through them.
+There are enough platforms that the index uses its grid instead of checking every one.
+"""
+class TestPlatformIndex(unittest.TestCase):
+    def setUp(self):
+        self.stage = stage.Stage()
+        self.stage.platform_list = [stage.Platform([i * 200, 800], [i * 200 + 150, 800]) for i in range(collisionBox.SPATIAL_MIN_SPRITES)]
+        self.stage.getLedges()
+        self.box = spriteManager.RectSprite(pygame.Rect(5000, 5000, 40, 70))
+
+    def collisions(self):
+        return collisionBox.spritecollide(self.box, self.stage.getPlatformIndex())
+
+    def test_swap(self):
+        self.assertEqual(self.collisions(), [])
+        swapped = stage.Platform([4990, 5010], [5100, 5010])
+        self.stage.platform_list[3] = swapped
+        self.assertEqual(self.collisions(), [swapped])
+
+    def test_move(self):
+        self.assertEqual(self.collisions(), [])
+        platform = self.stage.platform_list[3]
+        platform.rect.topleft = (4990, 5010)
+        self.stage.invalidatePlatforms()
+        self.assertEqual(self.collisions(), [platform])
+
+    def test_load_state(self):
+        state = self.stage.saveState()
+        platform = self.stage.platform_list[3]
+        platform.rect.topleft = (4990, 5010)
+        self.stage.invalidatePlatforms()
+        self.assertEqual(self.collisions(), [platform])
+        self.stage.loadState(state)
+        self.assertEqual(self.collisions(), [])
+
+if __name__ == '__main__':
+    unittest.main()
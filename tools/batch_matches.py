@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+"""
+Runs CPU against CPU matches headless, spread over every core, for balance testing. Each match takes a stage
+and two fighters, picked from what's in stages/ and fighters/ by the match's seed, and plays out with CPU
+controllers, without a window, until someone's out of stocks, the clock runs out, or it hits the frame limit.
+
+Every fighter in every match gets a row in the results: the match, its seed, the stage, who they fought,
+and what their DataLog counted (KOs, falls, damage dealt and damage taken), along with how many stocks they
+had left and whether they won. Rows are written as each match finishes, so a run that's stopped partway
+still has everything up to there. A match that crashes gets its error in the results instead of stopping
+the run. The results are CSV, or Parquet if the path ends in .parquet and pyarrow is installed.
+
+The same seed always gets the same stage and fighters, and plays out the same, so any match can be
+played again on its own with --first and --matches 1.
+
+    python tools/batch_matches.py [--matches N] [--processes N] [--frames N] [--stocks N] [--time SECONDS]
+                                  [--stages a,b] [--fighters a,b] [--first SEED] [--out results.csv]
+"""
+from __future__ import print_function
+import os
+import sys
+import csv
+import random
+import timeit
+import signal
+import argparse
+import traceback
+import multiprocessing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+import battle
+import engine.cpuPlayer as cpuPlayer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COLUMNS = ['match', 'seed', 'stage', 'frames', 'exit_status', 'player', 'fighter', 'opponent',
+           'kos', 'falls', 'damage_dealt', 'damage_taken', 'stocks_left', 'won', 'error']
+#Which column each of the DataLog's sections goes in
+DATA_LOG_COLUMNS = [('KOs', 'kos'), ('Falls', 'falls'), ('Damage Dealt', 'damage_dealt'), ('Damage Taken', 'damage_taken')]
+#The default controls, so the CPU plays the same whatever the settings say
+TIMING_WINDOW = {'buffer_window': 8, 'repeat_window': 8, 'smoothing_window': 64, 'smash_window': 4}
+#The type of each column in a Parquet file. Anything not here is a whole number.
+PARQUET_TYPES = {'stage': 'string', 'fighter': 'string', 'opponent': 'string', 'error': 'string',
+                 'damage_dealt': 'float64', 'damage_taken': 'float64', 'won': 'bool'}
+#A worker is swapped for a fresh one after this many matches, so anything a match leaks doesn't build up
+MATCHES_PER_WORKER = 50
+
+"""
+A CPU match, set up the way a replay is, by the names of the stage and fighters, but with CPU
+controllers instead of recorded inputs.
+"""
+class CPUMatch(battle.Replay):
+    def __init__(self,_stage,_fighters,_seed,_stocks,_time):
+        self.seed = _seed
+        self.stocks = _stocks
+        self.time = _time
+        self.frame_count = 0
+        self.final_status = 0
+        self.stage_name = _stage
+        self.replay_players = []
+        for player_num,fighter in enumerate(_fighters):
+            self.replay_players.append({'player_num': player_num,
+                                        'color': player_num,
+                                        'costume': 0,
+                                        'fighter': fighter,
+                                        'timing_window': TIMING_WINDOW,
+                                        'inputs': dict()
+                                        })
+        self.loadBattle()
+        self.controllers = []
+        #Each CPU gets its own seed, from the match's
+        rng = random.Random(_seed)
+        for fighter in self.players:
+            cpu = cpuPlayer.CPUplayer(dict(), rng.getrandbits(32))
+            cpu.timing_window = dict(TIMING_WINDOW)
+            cpu.linkObject(fighter)
+            fighter.key_bindings = cpu
+            self.controllers.append(cpu)
+
+    #It's played straight through, so there's no point saving keyframes, and it ends when the battle does
+    def simulationStep(self):
+        battle.Battle.simulationStep(self)
+
+def getFolders(_directory):
+    path = os.path.join(ROOT, _directory)
+    return sorted([name for name in os.listdir(path)
+                   if not name.startswith('_') and os.path.isdir(os.path.join(path, name))])
+
+#The stage and fighters for a seed. Fighters can play themselves.
+def getMatchup(_seed,_stages,_fighters):
+    rng = random.Random(_seed)
+    return rng.choice(_stages), [rng.choice(_fighters), rng.choice(_fighters)]
+
+def getRows(_match,_seed,_stage,_fighters,_battle,_error):
+    rows = []
+    scores = []
+    if _battle is not None:
+        scores = [fighter.data_log.getData('KOs') - fighter.data_log.getData('Falls') for fighter in _battle.players]
+    for player,fighter_name in enumerate(_fighters):
+        row = {'match': _match, 'seed': _seed, 'stage': _stage, 'player': player, 'fighter': fighter_name,
+               'opponent': _fighters[1 - player], 'error': _error}
+        if _battle is not None:
+            fighter = _battle.players[player]
+            row['frames'] = _battle.frame
+            row['exit_status'] = _battle.exit_status
+            for section,column in DATA_LOG_COLUMNS:
+                row[column] = fighter.data_log.getData(section)
+            row['stocks_left'] = fighter.stocks if _battle.track_stocks else None
+            #The winner is whoever scored the most, the way the results screen counts it. Nobody wins a tie.
+            row['won'] = scores.count(max(scores)) == 1 and scores[player] == max(scores)
+        rows.append(row)
+    return rows
+
+def runMatch(_args):
+    match,seed,stages,fighters,frames,stocks,time = _args
+    stage,matchup = getMatchup(seed, stages, fighters)
+    try:
+        cpu_match = CPUMatch(stage, matchup, seed, stocks, time)
+        cpu_match.simulate(frames)
+        return getRows(match, seed, stage, matchup, cpu_match, None)
+    except Exception:
+        return getRows(match, seed, stage, matchup, None, traceback.format_exc().strip().splitlines()[-1])
+
+#The engine prints as it goes. With a worker for every core, that's a lot of noise, so workers keep quiet.
+#Each worker starts pygame, headless, once for all of its matches. SDL takes SIGTERM and SIGINT over when it
+#starts, and the pool couldn't stop its workers with it like that, so they're given back. Ctrl+C is left to
+#the main process, which stops the workers itself.
+def startWorker():
+    sys.stdout = open(os.devnull, 'w')
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    pygame.init()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+"""
+Writes rows as they come, either as CSV, or batched up into a Parquet file's row groups.
+"""
+class ResultWriter(object):
+    def __init__(self,_path):
+        self.path = _path
+        self.parquet = _path.endswith('.parquet')
+        self.pending = []
+        if self.parquet:
+            import pyarrow
+            import pyarrow.parquet
+            self.pyarrow = pyarrow
+            self.schema = pyarrow.schema([(column, pyarrow.type_for_alias(PARQUET_TYPES.get(column, 'int64'))) for column in COLUMNS])
+            self.writer = None
+        else:
+            #csv wants bytes in Python 2, and to do its own newlines in Python 3
+            if sys.version_info[0] < 3:
+                self.file = open(_path, 'wb')
+            else:
+                self.file = open(_path, 'w', newline='')
+            self.writer = csv.DictWriter(self.file, COLUMNS)
+            self.writer.writeheader()
+
+    def write(self,_rows):
+        if not self.parquet:
+            self.writer.writerows(_rows)
+            self.file.flush()
+            return
+        self.pending.extend(_rows)
+        if len(self.pending) >= 10000:
+            self.flush()
+
+    def flush(self):
+        if not self.pending: return
+        table = self.pyarrow.Table.from_pydict(dict([(column, [row.get(column) for row in self.pending]) for column in COLUMNS]), schema=self.schema)
+        if self.writer is None:
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.path, self.schema)
+        self.writer.write_table(table)
+        self.pending = []
+
+    def close(self):
+        if self.parquet:
+            self.flush()
+            if self.writer is not None:
+                self.writer.close()
+        else:
+            self.file.close()
+
+#How each fighter did overall: matches played, the fraction won, and their average KOs and damage dealt
+def printSummary(_totals):
+    print("%-16s %8s %8s %8s %12s" % ('fighter', 'matches', 'won', 'kos', 'damage dealt'))
+    for fighter in sorted(_totals):
+        played,won,kos,damage = _totals[fighter]
+        print("%-16s %8d %7.1f%% %8.2f %12.1f" % (fighter, played, 100.0 * won / played, float(kos) / played, float(damage) / played))
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs CPU against CPU matches headless, for balance testing.')
+    parser.add_argument('--matches', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--frames', type=int, default=60 * 60 * 8, help='the most frames a match can last')
+    parser.add_argument('--stocks', type=int, default=3)
+    parser.add_argument('--time', type=int, default=480, help='the match clock, in seconds. 0 for no clock')
+    parser.add_argument('--stages', help='comma separated, from stages/. Every stage by default')
+    parser.add_argument('--fighters', help='comma separated, from fighters/. Every fighter by default')
+    parser.add_argument('--first', type=int, default=0, help='the seed of the first match. Each match after it gets the next one')
+    parser.add_argument('--out', default='batch_results.csv')
+    args = parser.parse_args()
+
+    stages = args.stages.split(',') if args.stages else getFolders('stages')
+    fighters = args.fighters.split(',') if args.fighters else getFolders('fighters')
+    try:
+        writer = ResultWriter(args.out)
+    except ImportError:
+        print("Writing Parquet needs pyarrow. Install it, or save as .csv instead.")
+        return
+    matches = [(match, args.first + match, stages, fighters, args.frames, args.stocks, args.time) for match in range(args.matches)]
+
+    pool = multiprocessing.Pool(args.processes, startWorker, maxtasksperchild=MATCHES_PER_WORKER)
+    totals = dict()
+    errors = 0
+    first_error = None
+    done = 0
+    start = timeit.default_timer()
+    try:
+        for rows in pool.imap_unordered(runMatch, matches):
+            writer.write(rows)
+            done += 1
+            if rows[0]['error']:
+                errors += 1
+                first_error = first_error or rows[0]['error']
+            else:
+                for row in rows:
+                    played,won,kos,damage = totals.get(row['fighter'], (0, 0, 0, 0))
+                    totals[row['fighter']] = (played + 1, won + row['won'], kos + row['kos'], damage + row['damage_dealt'])
+            if done % 100 == 0 or done == len(matches):
+                print("%d/%d matches, %.1f a second, %d errors" % (done, len(matches), done / (timeit.default_timer() - start), errors))
+        pool.close()
+    except:
+        #If it's stopped early, everything that finished is already written
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        writer.close()
+    print("Saved to " + args.out)
+    if totals:
+        printSummary(totals)
+    #If every match crashed, the results are nothing but errors, so it shouldn't look like it worked
+    if done and errors == done:
+        print("Every match ended in an error, the first was: " + str(first_error))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()